@@ -0,0 +1,72 @@
+"""
+Streaming catalog import throughput and memory against a real MongoDB.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_catalog_import.py [--rows 1000000] [--batch-size 1000]
+
+Rows are generated on the fly as JSON Lines and written to a scratch
+collection that is dropped afterwards. Peak RSS should stay flat as --rows
+grows; only the batch is held in memory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from catalog_import import import_feed
+from models import Product
+
+CATEGORIES = ["bags", "shirts", "jackets", "pants", "shoes", "accessories"]
+
+
+def synthetic_feed(rows: int):
+    for i in range(1, rows + 1):
+        yield json.dumps({
+            "id": i,
+            "name": f"منتج {i}",
+            "nameEn": f"Product {i}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "price": 50 + (i * 37) % 950,
+            "image": f"https://example.com/products/{i}.jpg",
+            "isNew": i % 10 == 0,
+        }, ensure_ascii=False)
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def main(rows: int, batch_size: int) -> None:
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    collection = client[os.environ.get("DB_NAME", "bench")]["bench_catalog_import"]
+    await collection.drop()
+    await collection.create_index("id", unique=True)
+
+    async def on_batch(progress):
+        if progress.batches % 100 == 0:
+            print(f"  {progress.checkpoint_line:>9} rows   peak RSS {peak_rss_mb():7.1f} MB", flush=True)
+
+    start = time.perf_counter()
+    try:
+        progress = await import_feed(synthetic_feed(rows), "jsonl", collection, Product, batch_size=batch_size, on_batch=on_batch)
+        elapsed = time.perf_counter() - start
+        print(f"Imported {progress.upserted} rows in {elapsed:.1f}s: {progress.upserted / elapsed:,.0f} rows/s, "
+              f"peak RSS {peak_rss_mb():.1f} MB")
+    finally:
+        await collection.drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.batch_size))
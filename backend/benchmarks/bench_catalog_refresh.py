@@ -0,0 +1,93 @@
+"""
+Catalog refresh cost over a synthetic catalog: a full build versus publishing one changed product.
+
+    python benchmarks/bench_catalog_refresh.py [--products 20000]
+
+The catalog gets the same derived structures as the server (listings, columns,
+ranking, suggest, facets), registered with the same update hooks.
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog import Catalog
+from columnar import ColumnarCatalog
+from facets import facets_builder
+from product_search import build_listings, update_listings
+from search_index import PrefixIndex, RankedIndex
+
+ARABIC_WORDS = ["حقيبة", "جلدية", "فاخرة", "قميص", "صيفي", "أنيق", "جاكيت", "رسمي", "بنطلون", "كلاسيكي", "قطني", "ظهر"]
+ENGLISH_WORDS = ["Luxury", "Leather", "Bag", "Shirt", "Summer", "Elegant", "Jacket", "Formal", "Pants", "Classic", "Cotton", "Backpack"]
+CATEGORIES = ["bags", "shirts", "jackets", "pants", "shoes", "accessories"]
+
+
+def synthetic_products(count: int):
+    rng = random.Random(7777)
+    for i in range(1, count + 1):
+        words = rng.sample(range(len(ENGLISH_WORDS)), 3)
+        yield {
+            "id": i,
+            "name": " ".join(ARABIC_WORDS[w] for w in words) + f" {i}",
+            "nameEn": " ".join(ENGLISH_WORDS[w] for w in words) + f" {i}",
+            "category": rng.choice(CATEGORIES),
+            "price": float(rng.randint(50, 3000)),
+            "image": f"https://images.unsplash.com/photo-{i}",
+            "isNew": rng.random() < 0.3,
+        }
+
+
+def make_catalog() -> Catalog:
+    catalog = Catalog()
+    catalog.add_derived("listings", build_listings, update=update_listings)
+    catalog.add_derived(
+        "columns",
+        lambda snapshot: ColumnarCatalog(snapshot.products, text_fields=()),
+        update=lambda previous, snapshot, change: previous.updated(change.after, [p["id"] for p in change.removed]),
+        depends_on=("price", "category", "isNew"),
+    )
+    catalog.add_derived(
+        "ranking",
+        lambda snapshot: RankedIndex(snapshot.products),
+        update=lambda previous, snapshot, change: previous.updated(change.after, [p["id"] for p in change.removed], snapshot.positions),
+        depends_on=("name", "nameEn", "isNew"),
+    )
+    catalog.add_derived(
+        "suggest",
+        lambda snapshot: PrefixIndex(snapshot.products),
+        update=lambda previous, snapshot, change: previous.updated(change.before, change.after),
+        depends_on=("name", "nameEn"),
+    )
+    catalog.add_derived("facets", facets_builder(5), depends_on=("price", "category"))
+    return catalog
+
+
+def timed(label: str, action) -> None:
+    start = time.perf_counter()
+    action()
+    print(f"{label:<28} {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+
+def main(products: int) -> None:
+    docs = list(synthetic_products(products))
+    catalog = make_catalog()
+    timed(f"full build ({products})", lambda: catalog.load(docs))
+
+    target = docs[products // 2]
+    timed("update: price", lambda: catalog.update([{**target, "price": target["price"] + 1}]))
+    timed("update: name", lambda: catalog.update([{**target, "nameEn": "Renamed Leather Bag"}]))
+    timed("update: insert", lambda: catalog.update([{**target, "id": products + 1}]))
+    timed("update: delete", lambda: catalog.update([], [products + 1]))
+    changed = [dict(doc) for doc in docs]
+    changed[products // 3]["price"] += 1
+    timed("load: one product differs", lambda: catalog.load(changed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.products)
@@ -0,0 +1,95 @@
+"""
+Memory footprint and filter latency of the columnar catalog against a list of dicts.
+
+    python benchmarks/bench_columnar.py [--products 1000000] [--repeat 20]
+
+Memory is measured with tracemalloc while each representation is built.
+Filters compare a Python list comprehension over the dicts (what a dict
+catalog has to do) with ColumnarCatalog.find; both then build the first page
+of 50 dict rows.
+"""
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from columnar import ColumnarCatalog
+
+CATEGORIES = ["bags", "jackets", "shirts", "pants", "shoes", "accessories"]
+PAGE = 50
+
+
+def synthetic_products(count: int):
+    rng = random.Random(7777)
+    return [
+        {
+            "id": i,
+            "name": f"منتج رقم {i}",
+            "nameEn": f"Product number {i}",
+            "category": CATEGORIES[rng.randrange(len(CATEGORIES))],
+            "price": float(rng.randrange(49, 5000)),
+            "image": f"https://images.example.com/products/{i}.jpg",
+            "isNew": rng.random() < 0.2,
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def measure_memory(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def timed(func, repeat: int) -> float:
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main(count: int, repeat: int) -> None:
+    products, dict_bytes = measure_memory(lambda: synthetic_products(count))
+    columns, column_bytes = measure_memory(lambda: ColumnarCatalog(products))
+    print(f"{count} products")
+    print(f"  list of dicts : {dict_bytes / 2**20:8.1f} MiB  ({dict_bytes / count:6.0f} B/product)")
+    print(f"  columnar      : {column_bytes / 2**20:8.1f} MiB  ({column_bytes / count:6.0f} B/product, arrays {columns.nbytes / 2**20:.1f} MiB)")
+
+    filters = [
+        ("category", dict(category="bags"), lambda p: p["category"] == "bags"),
+        ("price range", dict(min_price=500, max_price=900), lambda p: 500 <= p["price"] <= 900),
+        ("category + price + new", dict(category="shirts", max_price=300, is_new=True),
+         lambda p: p["category"] == "shirts" and p["price"] <= 300 and p["isNew"]),
+    ]
+    print(f"\n{'filter':<26}{'sort':<12}{'dicts ms':>10}{'columnar ms':>13}{'matches':>10}")
+    for name, kwargs, predicate in filters:
+        for sort in ("relevance", "newest"):
+            def with_dicts():
+                matches = [p for p in products if predicate(p)]
+                if sort == "newest":
+                    matches.sort(key=lambda p: (not p["isNew"], -p["id"]))
+                return len(matches), matches[:PAGE]
+
+            def with_columns():
+                rows = columns.rows(columns.find(sort=sort, **kwargs))
+                return len(rows), rows[:PAGE]
+
+            assert [p["id"] for p in with_dicts()[1]] == [p["id"] for p in with_columns()[1]]
+            print(f"{name:<26}{sort:<12}{timed(with_dicts, repeat):>10.1f}{timed(with_columns, repeat):>13.2f}{with_columns()[0]:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.products, args.repeat)
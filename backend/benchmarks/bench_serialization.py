@@ -0,0 +1,122 @@
+"""
+Response serialization cost per route, before and after the orjson / model_response change.
+
+    python benchmarks/bench_serialization.py [--number 2000]
+
+"before" is what FastAPI did with its stock JSONResponse: revalidate the
+result against response_model (if any), turn it into JSON-able data and
+encode it with the stdlib json module. "after" is what the route does now:
+model routes return model_response() (pydantic-core encodes directly) and
+dict routes go through jsonable_encoder + orjson.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import server
+
+
+def sample_user() -> server.UserResponse:
+    return server.UserResponse(
+        id=str(uuid.uuid4()),
+        email="bench@7777.com",
+        name="Bench User",
+        phone="+966500000000",
+        created_at=datetime.now(timezone.utc).isoformat()
+    )
+
+
+def sample_orders(count: int) -> dict:
+    now = datetime.now(timezone.utc)
+    orders = []
+    for i in range(count):
+        items = [{"product_id": p["id"], "name": p["nameEn"], "price": p["price"], "quantity": 1, "size": "M", "image": p["image"]}
+                 for p in server.PRODUCTS[:3]]
+        orders.append({
+            "id": str(uuid.uuid4()),
+            "session_id": f"cs_test_{i}",
+            "items": items,
+            "subtotal": 2947.0,
+            "total": 3389.05,
+            "currency": "SAR",
+            "status": "completed",
+            "created_at": (now - timedelta(days=i)).isoformat(),
+        })
+    return {"orders": orders, "next_cursor": None}
+
+
+def sample_status_checks(count: int) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {"id": str(uuid.uuid4()), "client_name": "pinger", "timestamp": (now + timedelta(seconds=i)).isoformat()}
+        for i in range(count)
+    ]
+
+
+# FastAPI builds the response field once per route, so it is built outside the timed loop
+async def stock_fastapi(field, content) -> bytes:
+    return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+
+async def orjson_default(field, content) -> bytes:
+    return ORJSONResponse(await serialize_response(field=field, response_content=content)).body
+
+
+async def validated_model(field, content) -> bytes:
+    return server.model_response(content).body
+
+
+async def timed(func, field, content, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        await func(field, content)
+    return (time.perf_counter() - start) / number * 1e6
+
+
+async def main(number: int) -> None:
+    user = sample_user()
+    token = server.TokenResponse(access_token="x" * 180, user=user)
+    status = server.StatusCheck(client_name="pinger")
+    address = server.AddressResponse(
+        id=str(uuid.uuid4()), title="Home", full_name="Bench User", phone="+966500000000",
+        street="King Fahd Rd", city="Riyadh", region="Riyadh", is_default=True
+    )
+    search = {"products": server.PRODUCTS, "total": len(server.PRODUCTS)}
+
+    routes = [
+        ("POST /api/auth/login", server.TokenResponse, token, validated_model),
+        ("POST /api/auth/register", server.TokenResponse, token, validated_model),
+        ("GET  /api/auth/me", server.UserResponse, user, validated_model),
+        ("POST /api/addresses", server.AddressResponse, address, validated_model),
+        ("POST /api/status", server.StatusCheck, status, validated_model),
+        ("GET  /api/status (100 rows)", List[server.StatusCheck], sample_status_checks(100), orjson_default),
+        ("GET  /api/products/search", None, search, orjson_default),
+        ("GET  /api/orders (50 rows)", None, sample_orders(50), orjson_default),
+    ]
+
+    print(f"{'route':<32}{'before µs':>12}{'after µs':>12}{'speedup':>10}")
+    for name, response_model, content, current in routes:
+        field = create_response_field(name="Response_bench", type_=response_model) if response_model else None
+        before = await timed(stock_fastapi, field, content, number)
+        after = await timed(current, field, content, number)
+        print(f"{name:<32}{before:>12.1f}{after:>12.1f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=2000)
+    asyncio.run(main(parser.parse_args().number))
@@ -0,0 +1,82 @@
+"""
+Status check insert throughput: one insert_one per request vs. the write-behind buffer.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_status_writes.py [--docs 20000] [--concurrency 100]
+
+"direct" runs --concurrency writers each awaiting insert_one, like concurrent
+POST /api/status requests do today. "buffered" submits the same documents to
+a WriteBehindBuffer and counts until the last batch is written. Documents go
+to a scratch collection that is dropped afterwards.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from write_buffer import WriteBehindBuffer
+
+
+def status_doc(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "client_name": f"pinger-{i % 50}",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+async def direct(collection, docs: int, concurrency: int) -> None:
+    remaining = iter(range(docs))
+
+    async def writer():
+        for i in remaining:
+            await collection.insert_one(status_doc(i))
+
+    await asyncio.gather(*(writer() for _ in range(concurrency)))
+
+
+async def buffered(collection, docs: int, batch_size: int) -> None:
+    buffer = WriteBehindBuffer(collection, batch_size=batch_size, max_buffer=max(docs, batch_size))
+    await buffer.start()
+    for i in range(docs):
+        buffer.submit(status_doc(i))
+        if i % batch_size == 0:
+            # Give the flusher a turn, as request handling would
+            await asyncio.sleep(0)
+    await buffer.stop(timeout=600)
+    assert buffer.written == docs, buffer.stats()
+
+
+async def main(docs: int, concurrency: int, batch_size: int) -> None:
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    collection = client[os.environ.get("DB_NAME", "bench")]["bench_status_writes"]
+    try:
+        for label, run in (
+            ("direct", lambda: direct(collection, docs, concurrency)),
+            ("buffered", lambda: buffered(collection, docs, batch_size)),
+        ):
+            await collection.drop()
+            start = time.perf_counter()
+            await run()
+            elapsed = time.perf_counter() - start
+            assert await collection.count_documents({}) == docs
+            print(f"{label:<9} {docs} docs in {elapsed:6.2f}s   {docs / elapsed:10,.0f} docs/s")
+    finally:
+        await collection.drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.docs, args.concurrency, args.batch_size))
@@ -0,0 +1,72 @@
+"""
+Autocomplete latency over a synthetic catalog: uncached PrefixIndex lookups and cache hits.
+
+    python benchmarks/bench_suggest.py [--products 50000] [--queries 20000]
+
+Prefixes are cut from real product names at 1-6 characters, the way a user
+types them, so short prefixes with many completions are well represented.
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache import TTLCache
+from search_index import PrefixIndex
+
+ARABIC_WORDS = ["حقيبة", "جلدية", "فاخرة", "قميص", "صيفي", "أنيق", "جاكيت", "رسمي", "بنطلون", "كلاسيكي", "قطني", "ظهر"]
+ENGLISH_WORDS = ["Luxury", "Leather", "Bag", "Shirt", "Summer", "Elegant", "Jacket", "Formal", "Pants", "Classic", "Cotton", "Backpack"]
+
+
+def synthetic_products(count: int):
+    rng = random.Random(7777)
+    for i in range(1, count + 1):
+        words = rng.sample(range(len(ENGLISH_WORDS)), 3)
+        yield {
+            "id": i,
+            "name": " ".join(ARABIC_WORDS[w] for w in words) + f" {i}",
+            "nameEn": " ".join(ENGLISH_WORDS[w] for w in words) + f" {i}",
+        }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main(products: int, queries: int) -> None:
+    docs = list(synthetic_products(products))
+    start = time.perf_counter()
+    index = PrefixIndex(docs)
+    print(f"Indexed {products} products in {time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(1)
+    prefixes = []
+    for _ in range(queries):
+        doc = rng.choice(docs)
+        name = doc[rng.choice(("name", "nameEn"))]
+        word_start = rng.choice([0] + [i + 1 for i, c in enumerate(name) if c == " "])
+        prefixes.append(name[word_start:word_start + rng.randint(1, 6)])
+
+    cache = TTLCache(maxsize=10000, ttl=300)
+    for label, lookup in (
+        ("uncached", lambda p: index.complete(p, 8)),
+        ("cached", lambda p: cache.get(p) or cache.set(p, index.complete(p, 8))),
+    ):
+        samples = []
+        for prefix in prefixes:
+            t0 = time.perf_counter()
+            lookup(prefix)
+            samples.append((time.perf_counter() - t0) * 1e6)
+        print(f"{label:<10} p50 {percentile(samples, 50):7.1f} µs   p99 {percentile(samples, 99):7.1f} µs   max {max(samples):8.1f} µs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.products, args.queries)
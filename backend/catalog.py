@@ -0,0 +1,387 @@
+"""Read-optimized product catalog.
+
+A :class:`Catalog` publishes an immutable :class:`CatalogSnapshot` holding the
+product list together with the lookup structures built from it. Every change
+builds a new snapshot and swaps the reference in one assignment, so a request
+that grabbed ``catalog.snapshot`` keeps a consistent view even if a reload
+happens while it runs.
+
+A change to a few products does not rebuild the snapshot: :meth:`Catalog.update`
+copies the previous snapshot's maps, patches the affected entries and lists,
+and lets each derived structure decide whether it needs rebuilding at all.
+"""
+import bisect
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import orjson
+
+from search_index import NGramIndex
+
+# Above this share of changed products, load() rebuilds the snapshot instead of patching it
+FULL_REBUILD_RATIO = 0.1
+
+
+def _id_key(product: dict) -> int:
+    return product["id"]
+
+
+def _price_key(product: dict):
+    return (product["price"], product["id"])
+
+
+def patch_sorted(items: List[dict], removed: Iterable[dict], added: Iterable[dict], key: Callable[[dict], Any]) -> List[dict]:
+    """Copy of ``items`` (sorted by ``key``, which must be unique) without ``removed`` and with ``added``.
+
+    Products are found by binary search on ``key``, so ``removed`` must hold
+    the versions that are actually in ``items``.
+    """
+    items = list(items)
+    for product in removed:
+        i = bisect.bisect_left(items, key(product), key=key)
+        if i < len(items) and items[i]["id"] == product["id"]:
+            del items[i]
+    for product in added:
+        items.insert(bisect.bisect_left(items, key(product), key=key), product)
+    return items
+
+
+def _digest(product: dict) -> int:
+    encoded = orjson.dumps(product, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    return int.from_bytes(hashlib.sha256(encoded).digest(), "big")
+
+
+def _is_id_ordered(products: Sequence[dict]) -> bool:
+    return all(products[i]["id"] < products[i + 1]["id"] for i in range(len(products) - 1))
+
+
+class PriceIndex:
+    """Products ordered by price, so price ranges resolve with two binary searches."""
+    __slots__ = ("products", "prices")
+
+    def __init__(self, products: Iterable[dict]):
+        self.products = sorted(products, key=_price_key)
+        self.prices = [p["price"] for p in self.products]
+
+    def updated(self, removed: Iterable[dict], added: Iterable[dict]) -> "PriceIndex":
+        """A new index without ``removed`` and with ``added``; this one is left as is."""
+        index = PriceIndex(())
+        products, prices = list(self.products), list(self.prices)
+        for product in removed:
+            i = bisect.bisect_left(products, _price_key(product), key=_price_key)
+            if i < len(products) and products[i]["id"] == product["id"]:
+                del products[i]
+                del prices[i]
+        for product in added:
+            i = bisect.bisect_left(products, _price_key(product), key=_price_key)
+            products.insert(i, product)
+            prices.insert(i, product["price"])
+        index.products, index.prices = products, prices
+        return index
+
+    def _bounds(self, min_price: Optional[float], max_price: Optional[float]):
+        lo = 0 if min_price is None else bisect.bisect_left(self.prices, min_price)
+        hi = len(self.prices) if max_price is None else bisect.bisect_right(self.prices, max_price)
+        return lo, max(lo, hi)
+
+    def range(self, min_price: Optional[float] = None, max_price: Optional[float] = None) -> List[dict]:
+        lo, hi = self._bounds(min_price, max_price)
+        return self.products[lo:hi]
+
+    def count(self, min_price: Optional[float] = None, max_price: Optional[float] = None) -> int:
+        lo, hi = self._bounds(min_price, max_price)
+        return hi - lo
+
+
+
+
+class CatalogChange:
+    """What an incremental update changed, as handed to derived-structure updaters.
+
+    ``upserted`` pairs each added or replaced product with its previous
+    version (None when added); ``removed`` holds the previous versions of the
+    products that are gone.
+    """
+
+    def __init__(self, upserted: List[Tuple[Optional[dict], dict]], removed: List[dict], categories_changed: bool = False):
+        self.upserted = upserted
+        self.removed = removed
+        self.categories_changed = categories_changed
+        # Products were added or removed, so catalog positions moved
+        self.membership = bool(removed) or any(old is None for old, _ in upserted)
+        # Product fields whose value differs between the two versions of a product
+        self.fields: Set[str] = set()
+        for old, new in upserted:
+            if old is None:
+                self.fields.update(new)
+            else:
+                self.fields.update(key for key in old.keys() | new.keys() if old.get(key) != new.get(key))
+
+    def __bool__(self) -> bool:
+        return bool(self.upserted or self.removed or self.categories_changed)
+
+    @property
+    def before(self) -> List[dict]:
+        """Previous versions of the replaced and removed products."""
+        return [old for old, _ in self.upserted if old is not None] + self.removed
+
+    @property
+    def after(self) -> List[dict]:
+        """Current versions of the added and replaced products."""
+        return [new for _, new in self.upserted]
+
+    def touches(self, fields: Iterable[str]) -> bool:
+        """True if products were added or removed, or any of ``fields`` changed."""
+        return self.membership or not self.fields.isdisjoint(fields)
+
+    def categories(self) -> Set[str]:
+        """Product categories that gained, lost or replaced a member."""
+        return {p["category"] for p in self.before} | {p["category"] for p in self.after}
+
+
+class CatalogSnapshot:
+    __slots__ = (
+        "version", "content_hash", "products", "categories", "by_id", "positions", "by_category",
+        "price_index", "category_price_index", "search_index", "derived", "id_ordered", "_digests", "_digest_total",
+    )
+
+    def __init__(self, version: int, products: List[dict], categories: List[dict], search_index: NGramIndex):
+        by_id: Dict[int, dict] = {}
+        positions: Dict[int, int] = {}
+        by_category: Dict[str, List[dict]] = {}
+        for position, product in enumerate(products):
+            by_id[product["id"]] = product
+            positions[product["id"]] = position
+            by_category.setdefault(product["category"], []).append(product)
+
+        self.version = version
+        self.products = products
+        self.categories = categories
+        # Catalog.update keeps id-ordered snapshots in id order and patches their lists by binary search
+        self.id_ordered = _is_id_ordered(products)
+        self._digests = {product["id"]: _digest(product) for product in products}
+        self._digest_total = sum(self._digests.values()) % (1 << 256)
+        self.content_hash = self._content_hash()
+        self.by_id = by_id
+        # Catalog order, used as the tie-breaker when ordering search results
+        self.positions = positions
+        self.by_category = by_category
+        self.price_index = PriceIndex(products)
+        self.category_price_index = {category: PriceIndex(items) for category, items in by_category.items()}
+        self.search_index = search_index
+        # Structures built by Catalog.add_derived builders before the snapshot is published
+        self.derived: Dict[str, Any] = {}
+
+    @classmethod
+    def updated(cls, previous: "CatalogSnapshot", version: int, change: CatalogChange, categories: List[dict]) -> "CatalogSnapshot":
+        """``previous`` with ``change`` applied, copying its maps and patching only the entries the change touches.
+
+        ``previous`` must be id-ordered; so is the result.
+        """
+        snapshot = cls.__new__(cls)
+        snapshot.version = version
+        snapshot.categories = categories
+        snapshot.id_ordered = True
+
+        by_id, digests, total = dict(previous.by_id), dict(previous._digests), previous._digest_total
+        for product in change.removed:
+            del by_id[product["id"]]
+            total -= digests.pop(product["id"])
+        for _, product in change.upserted:
+            by_id[product["id"]] = product
+            digest = _digest(product)
+            total += digest - digests.get(product["id"], 0)
+            digests[product["id"]] = digest
+        snapshot.by_id, snapshot._digests, snapshot._digest_total = by_id, digests, total % (1 << 256)
+        snapshot.content_hash = snapshot._content_hash()
+
+        products = patch_sorted(previous.products, change.removed, [new for old, new in change.upserted if old is None], _id_key)
+        for old, new in change.upserted:
+            if old is not None:
+                products[bisect.bisect_left(products, new["id"], key=_id_key)] = new
+        snapshot.products = products
+        snapshot.positions = (
+            {product["id"]: position for position, product in enumerate(products)} if change.membership else previous.positions
+        )
+
+        removed_from: Dict[str, List[dict]] = {}
+        added_to: Dict[str, List[dict]] = {}
+        for product in change.before:
+            removed_from.setdefault(product["category"], []).append(product)
+        for product in change.after:
+            added_to.setdefault(product["category"], []).append(product)
+        by_category, category_price_index = dict(previous.by_category), dict(previous.category_price_index)
+        for category in removed_from.keys() | added_to.keys():
+            removed, added = removed_from.get(category, []), added_to.get(category, [])
+            members = patch_sorted(by_category.get(category, ()), removed, added, _id_key)
+            if not members:
+                by_category.pop(category, None)
+                category_price_index.pop(category, None)
+            elif category in category_price_index:
+                by_category[category] = members
+                category_price_index[category] = category_price_index[category].updated(removed, added)
+            else:
+                by_category[category] = members
+                category_price_index[category] = PriceIndex(members)
+        snapshot.by_category = by_category
+        snapshot.category_price_index = category_price_index
+        snapshot.price_index = previous.price_index.updated(change.before, change.after)
+
+        snapshot.search_index = previous.search_index.copy()
+        snapshot.search_index.update(change.after, [p["id"] for p in change.removed], snapshot.positions)
+        snapshot.derived = {}
+        return snapshot
+
+    def _content_hash(self) -> str:
+        # Stable across processes, unlike version, so it can back shared HTTP validators. Products
+        # are hashed one by one and summed, so an update only hashes the products it changed
+        parts = [f"{self._digest_total:064x}".encode(), orjson.dumps(self.categories, option=orjson.OPT_SORT_KEYS, default=str)]
+        if not self.id_ordered:
+            parts.append(orjson.dumps([product["id"] for product in self.products]))
+        return hashlib.sha256(b"|".join(parts)).hexdigest()
+
+    def get(self, product_id: int) -> Optional[dict]:
+        return self.by_id.get(product_id)
+
+    def in_category(self, category: Optional[str]) -> List[dict]:
+        if not category:
+            return self.products
+        return self.by_category.get(category, [])
+
+    def prices_in(self, category: Optional[str]) -> PriceIndex:
+        if not category:
+            return self.price_index
+        return self.category_price_index.get(category) or PriceIndex(())
+
+    def search(self, query: str) -> List[dict]:
+        if not query:
+            return self.products
+        return self.search_index.search(query)
+
+
+class _Derived(NamedTuple):
+    build: Callable[[CatalogSnapshot], Any]
+    update: Optional[Callable[[Any, CatalogSnapshot, CatalogChange], Any]]
+    depends_on: Optional[Tuple[str, ...]]
+
+
+class Catalog:
+    def __init__(self, products: Iterable[dict] = (), categories: Iterable[dict] = ()):
+        self._lock = threading.Lock()
+        self._derived: Dict[str, _Derived] = {}
+        self._snapshot = CatalogSnapshot(0, [], [], NGramIndex(fields=("name", "nameEn")))
+        self.load(products, categories)
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def load(self, products: Iterable[dict], categories: Optional[Iterable[dict]] = None) -> CatalogSnapshot:
+        """Publish a snapshot for ``products``.
+
+        ``categories`` defaults to the current ones. If the current and new
+        products are both in id order and few of them differ, the difference
+        is applied as with :meth:`update`. Otherwise a new snapshot is built;
+        its search index is copied from the current one and synced, so only
+        products whose names changed are re-indexed.
+        """
+        products = list(products)
+        with self._lock:
+            current = self._snapshot
+            categories = current.categories if categories is None else list(categories)
+            if current.id_ordered and _is_id_ordered(products):
+                change = self._diff(current, products, categories)
+                if len(change.upserted) + len(change.removed) <= FULL_REBUILD_RATIO * max(len(products), len(current.products)):
+                    return self._apply(current, change, categories)
+            search_index = current.search_index.copy()
+            search_index.sync(products)
+            snapshot = CatalogSnapshot(current.version + 1, products, categories, search_index)
+            self._derive(snapshot)
+            self._snapshot = snapshot
+        return snapshot
+
+    def update(
+        self, upserts: Iterable[dict] = (), removed_ids: Iterable[int] = (), categories: Optional[Iterable[dict]] = None
+    ) -> CatalogSnapshot:
+        """Publish the current snapshot with ``upserts`` added or replaced and ``removed_ids`` dropped.
+
+        The id, category and price maps and the search postings are patched
+        and derived structures are only rebuilt if their inputs changed, so
+        the cost follows the size of the change rather than of the catalog.
+        """
+        upserts = {product["id"]: product for product in upserts}
+        with self._lock:
+            current = self._snapshot
+            categories = current.categories if categories is None else list(categories)
+            upserted = [(current.by_id.get(product_id), product) for product_id, product in upserts.items()]
+            removed = [
+                current.by_id[product_id] for product_id in dict.fromkeys(removed_ids)
+                if product_id in current.by_id and product_id not in upserts
+            ]
+            change = CatalogChange([(old, new) for old, new in upserted if old != new], removed, categories != current.categories)
+            return self._apply(current, change, categories)
+
+    @staticmethod
+    def _diff(current: CatalogSnapshot, products: List[dict], categories: List[dict]) -> CatalogChange:
+        upserted, ids = [], set()
+        for product in products:
+            ids.add(product["id"])
+            old = current.by_id.get(product["id"])
+            if old != product:
+                upserted.append((old, product))
+        removed = [product for product in current.products if product["id"] not in ids]
+        return CatalogChange(upserted, removed, categories != current.categories)
+
+    def _apply(self, current: CatalogSnapshot, change: CatalogChange, categories: List[dict]) -> CatalogSnapshot:
+        if not change:
+            return current
+        if current.id_ordered:
+            snapshot = CatalogSnapshot.updated(current, current.version + 1, change, categories)
+            self._derive(snapshot, current, change)
+        else:
+            # No order to patch by binary search: keep the current order, new products last
+            upserts = {product["id"]: product for product in change.after}
+            removed_ids = {product["id"] for product in change.removed}
+            products = [upserts.pop(p["id"], p) for p in current.products if p["id"] not in removed_ids]
+            products.extend(upserts.values())
+            search_index = current.search_index.copy()
+            search_index.sync(products)
+            snapshot = CatalogSnapshot(current.version + 1, products, categories, search_index)
+            self._derive(snapshot)
+        self._snapshot = snapshot
+        return snapshot
+
+    def _derive(self, snapshot: CatalogSnapshot, previous: Optional[CatalogSnapshot] = None, change: Optional[CatalogChange] = None) -> None:
+        for name, derived in self._derived.items():
+            if change is None or name not in previous.derived:
+                snapshot.derived[name] = derived.build(snapshot)
+            elif derived.depends_on is not None and not change.touches(derived.depends_on):
+                snapshot.derived[name] = previous.derived[name]
+            elif derived.update is not None:
+                snapshot.derived[name] = derived.update(previous.derived[name], snapshot, change)
+            else:
+                snapshot.derived[name] = derived.build(snapshot)
+
+    def add_derived(
+        self,
+        name: str,
+        builder: Callable[[CatalogSnapshot], Any],
+        update: Optional[Callable[[Any, CatalogSnapshot, CatalogChange], Any]] = None,
+        depends_on: Optional[Iterable[str]] = None,
+    ) -> None:
+        """Register ``builder`` to attach ``derived[name]`` to every snapshot, starting with the current one.
+
+        When :meth:`update` adds or removes no product and changes none of the
+        ``depends_on`` product fields (None: any field), the previous value is
+        kept, so such a value must not hand out product dicts. Otherwise
+        ``update(previous_value, snapshot, change)`` derives the new value from
+        the previous one if given, or ``builder`` rebuilds it.
+        """
+        with self._lock:
+            self._derived[name] = _Derived(builder, update, None if depends_on is None else tuple(depends_on))
+            self._snapshot.derived[name] = builder(self._snapshot)
@@ -0,0 +1,327 @@
+"""Streaming product feed import.
+
+Feeds are CSV (a header row, then one product per record; quoted fields may
+span lines) or JSON Lines. Rows are validated one at a time against the ``Product`` model and written in
+unordered ``bulk_write`` batches of upserts keyed by ``id``, so memory use
+depends on the batch size and not on the size of the feed. Every write sets
+``updated_at`` so the catalog sync picks it up; a row with ``deleted`` set to
+true only needs an ``id`` and removes the product.
+
+Progress is checkpointed as the last line of the last batch written. An
+import restarted from that line skips everything up to it; rows are upserts,
+so replaying a partly written batch is harmless.
+
+A line (or a CSV record spanning several lines) longer than
+``max_line_length`` fails the import rather than being buffered without limit.
+
+Usage::
+
+    python catalog_import.py feed.jsonl [--format jsonl|csv] [--batch-size 1000]
+                             [--checkpoint feed.checkpoint] [--errors feed.errors.jsonl]
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+from pymongo import UpdateOne
+
+from models import Product
+
+FORMATS = ("jsonl", "csv")
+TRUE_VALUES = ("1", "true", "yes")
+# Longest line, or multi-line CSV record, accepted before the import fails
+MAX_LINE_LENGTH = 1024 * 1024
+
+
+class InvalidFeed(ValueError):
+    pass
+
+
+class ImportProgress:
+    def __init__(self, start_line: int = 0, error_limit: int = 100):
+        self.start_line = start_line
+        self.checkpoint_line = start_line
+        self.rows = 0
+        self.upserted = 0
+        self.deleted = 0
+        self.errors = 0
+        self.batches = 0
+        self.error_limit = error_limit
+        self.error_samples: List[Dict[str, Any]] = []
+        self._started_at = time.monotonic()
+
+    def add_error(self, line: int, message: str) -> None:
+        self.errors += 1
+        if len(self.error_samples) < self.error_limit:
+            self.error_samples.append({"line": line, "error": message})
+
+    def as_dict(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._started_at
+        return {
+            "rows": self.rows,
+            "upserted": self.upserted,
+            "deleted": self.deleted,
+            "errors": self.errors,
+            "batches": self.batches,
+            "checkpoint_line": self.checkpoint_line,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed > 0 else 0.0,
+            "error_samples": self.error_samples,
+        }
+
+
+async def iter_lines(chunks: AsyncIterable[bytes], max_line_length: int = MAX_LINE_LENGTH) -> AsyncIterator[str]:
+    """Decode a byte stream (e.g. a request body) into lines without buffering it whole.
+
+    Raises InvalidFeed once a line grows past ``max_line_length`` bytes, so a
+    body without newlines is not buffered without limit.
+    """
+    buffer = b""
+    line_number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if len(line) > max_line_length:
+                raise InvalidFeed(f"Line {line_number} is longer than {max_line_length} bytes")
+            yield line.decode("utf-8-sig").rstrip("\r")
+        if len(buffer) > max_line_length:
+            raise InvalidFeed(f"Line {line_number + 1} is longer than {max_line_length} bytes")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+
+async def _aiter(lines: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[str]:
+    if hasattr(lines, "__aiter__"):
+        async for line in lines:
+            yield line
+    else:
+        for line in lines:
+            yield line
+
+
+class _LineQueue:
+    """Iterator over queued lines that a csv.reader keeps reading from as more are queued."""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def _records(
+    lines: AsyncIterator[str], fmt: str, max_length: int
+) -> AsyncIterator[Tuple[int, int, str, Union[str, List[str], csv.Error]]]:
+    """(first line, last line, text, data) per record: the line itself for JSON Lines, the values for CSV.
+
+    One csv.reader reads the whole feed. Lines are queued for it once they
+    complete a record, i.e. hold an even number of quote characters, so it
+    never runs out of input inside a quoted field; a CSV error is passed on
+    as the record's data.
+    """
+    if fmt == "jsonl":
+        line_number = 0
+        async for line in lines:
+            line_number += 1
+            yield line_number, line_number, line, line
+        return
+
+    queue = _LineQueue()
+    reader = csv.reader(queue)
+    record: List[str] = []
+    quotes = length = line_number = 0
+    async for line in lines:
+        line_number += 1
+        record.append(line)
+        quotes += line.count('"')
+        length += len(line) + 1
+        if quotes % 2:
+            if length > max_length:
+                raise InvalidFeed(
+                    f"Quoted field from line {line_number - len(record) + 1} runs past {max_length} characters"
+                )
+            continue
+        queue.lines.extend(f"{text}\n" for text in record)
+        try:
+            values = next(reader)
+        except csv.Error as e:
+            values = e
+        queue.lines.clear()
+        yield line_number - len(record) + 1, line_number, "\n".join(record), values
+        record, quotes, length = [], 0, 0
+    if record:
+        yield line_number - len(record) + 1, line_number, "\n".join(record), csv.Error("Unterminated quoted field")
+
+
+def _parse_row(fmt: str, header: Optional[List[str]], data: Union[str, List[str], csv.Error]) -> Dict[str, Any]:
+    if fmt == "jsonl":
+        row = json.loads(data)
+        if not isinstance(row, dict):
+            raise ValueError("Expected a JSON object")
+        return row
+    if isinstance(data, csv.Error):
+        raise ValueError(str(data))
+    values = data
+    if len(values) != len(header):
+        raise ValueError(f"Expected {len(header)} columns, got {len(values)}")
+    # Empty cells fall back to the model defaults
+    return {key: value for key, value in zip(header, values) if value != ""}
+
+
+def _is_deleted(row: Dict[str, Any]) -> bool:
+    value = row.get("deleted")
+    return value is True or str(value).lower() in TRUE_VALUES
+
+
+async def import_feed(
+    lines: Union[Iterable[str], AsyncIterable[str]],
+    fmt: str,
+    collection,
+    model: type,
+    batch_size: int = 1000,
+    start_line: int = 0,
+    on_batch: Optional[Callable[[ImportProgress], Awaitable[None]]] = None,
+    on_error: Optional[Callable[[int, str, str], None]] = None,
+    max_line_length: int = MAX_LINE_LENGTH,
+) -> ImportProgress:
+    """Validate and upsert the rows of a feed; lines up to ``start_line`` are skipped.
+
+    ``on_batch`` runs after each written batch (checkpointing, progress) and
+    ``on_error`` for each rejected row with its first line number, error and
+    text. A CSV record spanning more than ``max_line_length`` characters
+    raises InvalidFeed.
+    """
+    if fmt not in FORMATS:
+        raise InvalidFeed(f"Invalid format, expected one of: {', '.join(FORMATS)}")
+    progress = ImportProgress(start_line)
+    header: Optional[List[str]] = None
+    operations: List[UpdateOne] = []
+    deletes = 0
+
+    async def flush(last_line: int) -> None:
+        nonlocal deletes
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+            progress.batches += 1
+            progress.upserted += len(operations) - deletes
+            progress.deleted += deletes
+            operations.clear()
+            deletes = 0
+        progress.checkpoint_line = last_line
+        if on_batch:
+            await on_batch(progress)
+
+    line_number = 0
+    async for first_line, line_number, text, data in _records(_aiter(lines), fmt, max_line_length):
+        if fmt == "csv" and header is None:
+            if isinstance(data, csv.Error):
+                raise InvalidFeed(f"Invalid CSV header: {str(data)}")
+            header = [name.strip() for name in data]
+            if "id" not in header:
+                raise InvalidFeed("CSV header must include an id column")
+            continue
+        if line_number <= start_line or not text.strip():
+            continue
+
+        progress.rows += 1
+        now = datetime.now(timezone.utc)
+        try:
+            row = _parse_row(fmt, header, data)
+            if _is_deleted(row):
+                operations.append(UpdateOne({"id": int(row["id"])}, {"$set": {"deleted": True, "updated_at": now}}))
+                deletes += 1
+            else:
+                product = model.model_validate(row).model_dump()
+                operations.append(UpdateOne(
+                    {"id": product["id"]},
+                    {"$set": {**product, "updated_at": now}, "$unset": {"deleted": ""}},
+                    upsert=True
+                ))
+        except (ValidationError, ValueError, KeyError, TypeError) as e:
+            message = f"Missing field {e}" if isinstance(e, KeyError) else str(e)
+            progress.add_error(first_line, message)
+            if on_error:
+                on_error(first_line, message, text)
+            continue
+
+        if len(operations) >= batch_size:
+            await flush(line_number)
+
+    await flush(max(line_number, start_line))
+    return progress
+
+
+async def _main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Import a CSV or JSON Lines product feed into the products collection")
+    parser.add_argument("feed", type=Path)
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--checkpoint", type=Path, help="resume from and record progress in this file")
+    parser.add_argument("--errors", type=Path, help="write rejected rows to this JSON Lines file")
+    args = parser.parse_args(argv)
+    fmt = args.format or ("csv" if args.feed.suffix.lower() == ".csv" else "jsonl")
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    start_line = 0
+    if args.checkpoint and args.checkpoint.exists():
+        start_line = json.loads(args.checkpoint.read_text()).get("line", 0)
+        print(f"Resuming after line {start_line}")
+
+    errors_file = args.errors.open("a" if start_line else "w", encoding="utf-8") if args.errors else None
+
+    def on_error(line: int, message: str, text: str) -> None:
+        if errors_file:
+            errors_file.write(json.dumps({"line": line, "error": message, "row": text}, ensure_ascii=False) + "\n")
+
+    async def on_batch(progress: ImportProgress) -> None:
+        if args.checkpoint:
+            args.checkpoint.write_text(json.dumps({"feed": str(args.feed), "line": progress.checkpoint_line}))
+        stats = progress.as_dict()
+        print(f"line {progress.checkpoint_line}: {stats['upserted']} upserted, {stats['deleted']} deleted, "
+              f"{stats['errors']} errors, {stats['rows_per_second']} rows/s", flush=True)
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        with args.feed.open(encoding="utf-8-sig", newline="") as feed:
+            progress = await import_feed(
+                (line.rstrip("\r\n") for line in feed),
+                fmt,
+                client[os.environ['DB_NAME']].products,
+                Product,
+                batch_size=args.batch_size,
+                start_line=start_line,
+                on_batch=on_batch,
+                on_error=on_error
+            )
+    finally:
+        client.close()
+        if errors_file:
+            errors_file.close()
+    stats = progress.as_dict()
+    print(f"Done: {stats['rows']} rows, {stats['upserted']} upserted, {stats['deleted']} deleted, "
+          f"{stats['errors']} errors in {stats['elapsed_seconds']}s")
+    return 1 if progress.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,260 @@
+"""Keeps the in-memory catalog in step with the ``products`` collection.
+
+The collection is the source of truth; request handlers only ever read
+``catalog.snapshot``. A background task follows the collection through a
+change stream, or, where change streams are unavailable (standalone
+servers), by polling for documents whose ``updated_at`` moved past the last
+seen watermark. Changes are gathered into a working copy and published as a
+new snapshot, which is swapped in atomically: pending upserts and deletes go
+through ``Catalog.update``, which patches the current snapshot, and full
+reloads through ``Catalog.load``.
+
+Writers must set ``updated_at`` on every change. With polling, a product is
+removed by setting ``deleted: true`` (and bumping ``updated_at``); hard
+deletes are only noticed by the periodic full reload.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+from catalog import Catalog
+
+logger = logging.getLogger(__name__)
+
+# Bookkeeping fields that are not part of the product served to clients
+INTERNAL_FIELDS = ("_id", "updated_at", "deleted")
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class CatalogSync:
+    def __init__(
+        self,
+        collection,
+        catalog: Catalog,
+        seed: Iterable[dict] = (),
+        use_change_streams: bool = True,
+        poll_interval: float = 5.0,
+        full_reload_interval: float = 600.0,
+        max_batch_delay: float = 1.0,
+        retry_interval: float = 5.0,
+    ):
+        self.collection = collection
+        self.catalog = catalog
+        self.seed = list(seed)
+        self.use_change_streams = use_change_streams
+        self.poll_interval = poll_interval
+        self.full_reload_interval = full_reload_interval
+        self.max_batch_delay = max_batch_delay
+        self.retry_interval = retry_interval
+        self._task: Optional[asyncio.Task] = None
+
+        # Working copy of the collection, keyed by product id, plus the _id -> id
+        # map needed to resolve change stream deletes
+        self._products: Dict[Any, dict] = {}
+        self._ids: Dict[Any, Any] = {}
+        # Changes since the last publish: product id -> new version, or None once deleted
+        self._changed: Dict[Any, Optional[dict]] = {}
+        self._reload_pending = False
+        self._watermark: Optional[datetime] = None
+        self._oldest_pending: Optional[datetime] = None
+        self._dirty = False
+        self._loaded = False
+        self._last_full_reload = 0.0
+
+        # "static" until the collection has been loaded
+        self.mode = "static"
+        self.refreshes = 0
+        self.errors = 0
+        self.last_refresh_at: Optional[float] = None
+        self.last_refresh_lag_seconds = 0.0
+
+    # ----- loading -----
+
+    async def start(self) -> None:
+        """Load the collection (seeding it if empty), publish it and start following changes.
+
+        If the initial load fails the current snapshot stays in place and the
+        background task keeps retrying.
+        """
+        try:
+            await self._seed_if_empty()
+            await self._full_reload()
+        except Exception as e:
+            logger.error(f"Loading the catalog from Mongo failed, serving the built-in catalog: {str(e)}")
+            self.errors += 1
+        self._task = asyncio.create_task(self._run())
+
+    async def _seed_if_empty(self) -> None:
+        if not self.seed or await self.collection.find_one({}, {"_id": 1}) is not None:
+            return
+        now = datetime.now(timezone.utc)
+        await self.collection.insert_many([{**product, "updated_at": now} for product in self.seed], ordered=False)
+        logger.info(f"Seeded the products collection with {len(self.seed)} products")
+
+    async def _full_reload(self) -> None:
+        products, ids, watermark = {}, {}, None
+        async for doc in self.collection.find({"deleted": {"$ne": True}}).sort("id", 1):
+            updated_at = _as_utc(doc.get("updated_at"))
+            if updated_at is not None and (watermark is None or updated_at > watermark):
+                watermark = updated_at
+            ids[doc["_id"]] = doc["id"]
+            products[doc["id"]] = self._product(doc)
+        if products != self._products or not self._loaded:
+            self._mark_dirty(None)
+            self._reload_pending = True
+        self._products, self._ids = products, ids
+        self._watermark = watermark or self._watermark
+        self._last_full_reload = time.monotonic()
+        self._loaded = True
+        await self._publish()
+
+    @staticmethod
+    def _product(doc: dict) -> dict:
+        return {key: value for key, value in doc.items() if key not in INTERNAL_FIELDS}
+
+    # ----- applying changes -----
+
+    def _upsert(self, doc: dict, changed_at: Optional[datetime]) -> None:
+        if doc.get("deleted"):
+            self._delete(doc["_id"], changed_at)
+            return
+        product = self._product(doc)
+        self._ids[doc["_id"]] = doc["id"]
+        if self._products.get(doc["id"]) != product:
+            self._products[doc["id"]] = product
+            self._changed[doc["id"]] = product
+            self._mark_dirty(changed_at)
+
+    def _delete(self, object_id: Any, changed_at: Optional[datetime]) -> None:
+        product_id = self._ids.pop(object_id, None)
+        if product_id is not None and self._products.pop(product_id, None) is not None:
+            self._changed[product_id] = None
+            self._mark_dirty(changed_at)
+
+    def _mark_dirty(self, changed_at: Optional[datetime]) -> None:
+        changed_at = _as_utc(changed_at) or datetime.now(timezone.utc)
+        if self._oldest_pending is None or changed_at < self._oldest_pending:
+            self._oldest_pending = changed_at
+        self._dirty = True
+
+    async def _publish(self) -> None:
+        if not self._dirty:
+            return
+        # Building the snapshot is CPU-bound; keep it off the event loop
+        if self._reload_pending:
+            products = sorted(self._products.values(), key=lambda p: p["id"])
+            await asyncio.to_thread(self.catalog.load, products)
+        else:
+            upserts = [product for product in self._changed.values() if product is not None]
+            removed = [product_id for product_id, product in self._changed.items() if product is None]
+            await asyncio.to_thread(self.catalog.update, upserts, removed)
+        self._changed = {}
+        self._reload_pending = False
+        now = datetime.now(timezone.utc)
+        if self._oldest_pending is not None:
+            self.last_refresh_lag_seconds = max(0.0, (now - self._oldest_pending).total_seconds())
+        self._oldest_pending = None
+        self._dirty = False
+        self.refreshes += 1
+        self.last_refresh_at = time.time()
+
+    # ----- following the collection -----
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if not self._loaded:
+                    # The initial load failed; retry it before following changes
+                    await self._seed_if_empty()
+                    await self._full_reload()
+                if self.use_change_streams:
+                    await self._watch()
+                else:
+                    await self._poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Catalog refresh failed: {str(e)}")
+                self.errors += 1
+                await asyncio.sleep(self.retry_interval)
+
+    async def _watch(self) -> None:
+        try:
+            stream = self.collection.watch(
+                full_document="updateLookup",
+                max_await_time_ms=int(self.max_batch_delay * 1000)
+            )
+            change = await stream.try_next()
+        except Exception as e:
+            logger.warning(f"Change streams unavailable, polling the products collection instead: {str(e)}")
+            self.use_change_streams = False
+            return
+
+        self.mode = "change_stream"
+        async with stream:
+            # Changes between the last load and the stream opening would be missed otherwise
+            await self._full_reload()
+            first_pending = None
+            while True:
+                if change is not None:
+                    cluster_time = change.get("clusterTime")
+                    changed_at = datetime.fromtimestamp(cluster_time.time, timezone.utc) if cluster_time else None
+                    if change["operationType"] in ("insert", "update", "replace") and change.get("fullDocument"):
+                        self._upsert(change["fullDocument"], changed_at)
+                    elif change["operationType"] == "delete":
+                        self._delete(change["documentKey"]["_id"], changed_at)
+                    elif change["operationType"] in ("drop", "rename", "invalidate"):
+                        await self._full_reload()
+                    first_pending = first_pending or time.monotonic()
+                # Publish once the stream goes quiet, or after max_batch_delay under a steady stream
+                if self._dirty and (change is None or time.monotonic() - first_pending >= self.max_batch_delay):
+                    await self._publish()
+                    first_pending = None
+                elif not self._dirty:
+                    first_pending = None
+                change = await stream.try_next()
+
+    async def _poll(self) -> None:
+        self.mode = "polling"
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if time.monotonic() - self._last_full_reload >= self.full_reload_interval:
+                await self._full_reload()
+                continue
+            # $gte: a write landing in the same millisecond as the watermark is not skipped;
+            # re-reading unchanged documents is a no-op
+            query = {"updated_at": {"$gte": self._watermark}} if self._watermark else {}
+            async for doc in self.collection.find(query).sort("updated_at", 1):
+                updated_at = _as_utc(doc.get("updated_at"))
+                self._upsert(doc, updated_at)
+                if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                    self._watermark = updated_at
+            await self._publish()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "version": self.catalog.version,
+            "products": len(self.catalog.snapshot.products),
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "last_refresh_lag_seconds": self.last_refresh_lag_seconds,
+            "seconds_since_refresh": time.time() - self.last_refresh_at if self.last_refresh_at else None,
+        }
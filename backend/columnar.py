@@ -0,0 +1,179 @@
+"""Columnar, NumPy-backed product storage.
+
+Numeric fields live in typed arrays (8 bytes per price, 1 per flag) and text
+fields in one UTF-8 buffer per field with an offsets array, so a large
+catalog costs well under half the ~600 bytes per product of a list of dicts.
+Category, price and flag filters are vectorized masks applied to sort orders
+computed once at build time, and dict rows are only built for the products a
+caller actually reads.
+"""
+from collections.abc import Sequence as SequenceABC
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+
+class StringColumn:
+    """Strings stored back to back in one UTF-8 buffer."""
+    __slots__ = ("_data", "_offsets")
+
+    def __init__(self, values: Iterable[str]):
+        encoded = [value.encode() for value in values]
+        self._offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded)), out=self._offsets[1:])
+        self._data = b"".join(encoded)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self._data[self._offsets[row]:self._offsets[row + 1]].decode()
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._data) + self._offsets.nbytes
+
+
+class Rows(SequenceABC):
+    """Lazy sequence over selected row numbers; rows are materialized on access."""
+
+    def __init__(self, indices: np.ndarray, materialize: Callable[[int], dict]):
+        self._indices = indices
+        self._materialize = materialize
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._materialize(row) for row in self._indices[item].tolist()]
+        return self._materialize(int(self._indices[item]))
+
+
+class ColumnarCatalog:
+    """Products as columns; row ``i`` is the ``i``-th product it was built from."""
+
+    def __init__(self, products: Iterable[dict], text_fields: Sequence[str] = ("name", "nameEn", "image")):
+        products = products if isinstance(products, list) else list(products)
+        count = len(products)
+        codes: Dict[str, int] = {}
+
+        self.ids = np.fromiter((p["id"] for p in products), dtype=np.int64, count=count)
+        self.prices = np.fromiter((p["price"] for p in products), dtype=np.float64, count=count)
+        self.is_new = np.fromiter((bool(p.get("isNew")) for p in products), dtype=np.bool_, count=count)
+        self.category_codes = np.fromiter(
+            (codes.setdefault(p["category"], len(codes)) for p in products), dtype=np.int32, count=count
+        )
+        self.category_names: List[str] = list(codes)
+        self._codes = codes
+        self.text: Dict[str, StringColumn] = {
+            field: StringColumn(str(p.get(field) or "") for p in products) for field in text_fields
+        }
+        self._sort()
+
+    def _sort(self) -> None:
+        # Row orders for each sort; same tie-breaks as product_search.sort_key
+        price_asc = np.lexsort((self.ids, self.prices))
+        self._orders = {
+            "relevance": None,
+            "price_asc": price_asc,
+            "price_desc": price_asc[::-1],
+            "newest": np.lexsort((-self.ids, ~self.is_new)),
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def updated(self, changed: Iterable[dict] = (), removed_ids: Iterable[int] = ()) -> "ColumnarCatalog":
+        """A copy with ``changed`` products replaced or added and ``removed_ids`` dropped.
+
+        Rows must be in id order, as they are for an id-ordered catalog
+        snapshot: existing rows are found and new ones placed by binary search
+        on ``ids``, so the copy's rows stay in step with the snapshot's
+        products. Sort orders are recomputed with NumPy.
+        """
+        changed = sorted(changed, key=lambda p: p["id"])
+        removed = np.fromiter(removed_ids, dtype=np.int64)
+        keep = np.isin(self.ids, removed, invert=True) if len(removed) else np.ones(len(self), dtype=np.bool_)
+        kept_rows = np.flatnonzero(keep)
+
+        clone = ColumnarCatalog((), text_fields=())
+        clone._codes = dict(self._codes)
+        ids, prices, is_new, codes = self.ids[keep], self.prices[keep], self.is_new[keep], self.category_codes[keep]
+        changed_ids = np.fromiter((p["id"] for p in changed), dtype=np.int64, count=len(changed))
+        changed_prices = np.fromiter((p["price"] for p in changed), dtype=np.float64, count=len(changed))
+        changed_is_new = np.fromiter((bool(p.get("isNew")) for p in changed), dtype=np.bool_, count=len(changed))
+        changed_codes = np.fromiter(
+            (clone._codes.setdefault(p["category"], len(clone._codes)) for p in changed), dtype=np.int32, count=len(changed)
+        )
+        rows = np.searchsorted(ids, changed_ids)
+        existing = ids[np.minimum(rows, len(ids) - 1)] == changed_ids if len(ids) else np.zeros(len(changed), dtype=np.bool_)
+        for column, values in ((prices, changed_prices), (is_new, changed_is_new), (codes, changed_codes)):
+            column[rows[existing]] = values[existing]
+        added, at = ~existing, rows[~existing]
+        clone.ids = np.insert(ids, at, changed_ids[added])
+        clone.prices = np.insert(prices, at, changed_prices[added])
+        clone.is_new = np.insert(is_new, at, changed_is_new[added])
+        clone.category_codes = np.insert(codes, at, changed_codes[added])
+        clone.category_names = list(clone._codes)
+
+        for field, column in self.text.items():
+            values = [column[row] for row in kept_rows.tolist()]
+            for row, product in zip(rows[existing].tolist(), [p for p, e in zip(changed, existing.tolist()) if e]):
+                values[row] = str(product.get(field) or "")
+            for offset, (row, product) in enumerate(zip(at.tolist(), [p for p, e in zip(changed, existing.tolist()) if not e])):
+                values.insert(row + offset, str(product.get(field) or ""))
+            clone.text[field] = StringColumn(values)
+        clone._sort()
+        return clone
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.ids, self.prices, self.is_new, self.category_codes, *self._orders.values()]
+        # Views (price_desc) share their base's buffer
+        owned = sum(a.nbytes for a in arrays if a is not None and a.base is None)
+        return owned + sum(c.nbytes for c in self.text.values())
+
+    def find(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        is_new: Optional[bool] = None,
+        sort: str = "relevance",
+    ) -> np.ndarray:
+        """Row numbers of the matching products, in ``sort`` order."""
+        if sort not in self._orders:
+            raise ValueError(f"Unknown sort: {sort}")
+        conditions = []
+        if category:
+            code = self._codes.get(category)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            conditions.append(self.category_codes == code)
+        if min_price is not None:
+            conditions.append(self.prices >= min_price)
+        if max_price is not None:
+            conditions.append(self.prices <= max_price)
+        if is_new is not None:
+            conditions.append(self.is_new == is_new)
+
+        order = self._orders[sort]
+        if not conditions:
+            return np.arange(len(self)) if order is None else order
+        mask = np.logical_and.reduce(conditions) if len(conditions) > 1 else conditions[0]
+        return np.flatnonzero(mask) if order is None else order[mask[order]]
+
+    def row(self, row: int) -> dict:
+        product = {
+            "id": int(self.ids[row]),
+            "category": self.category_names[self.category_codes[row]],
+            "price": float(self.prices[row]),
+            "isNew": bool(self.is_new[row]),
+        }
+        for field, column in self.text.items():
+            product[field] = column[row]
+        return product
+
+    def rows(self, indices: np.ndarray, materialize: Optional[Callable[[int], dict]] = None) -> Rows:
+        return Rows(indices, materialize or self.row)
@@ -0,0 +1,244 @@
+"""Declarative MongoDB index registry.
+
+``INDEXES`` lists the indexes every collection needs and ``QUERY_SHAPES`` the
+filter/sort shapes the API handlers issue. ``ensure_indexes`` is run at
+startup (in the background via ``ensure_indexes_with_retry``, so an
+unreachable server does not stop the app from booting);
+``verify_query_plans`` explains each shape and reports any that would fall
+back to a collection scan.
+
+Usage::
+
+    python db_indexes.py          # create missing indexes
+    python db_indexes.py --check  # create, then fail if any query shape COLLSCANs
+"""
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "wishlists": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "addresses": [
+        IndexModel([("user_id", ASCENDING), ("id", ASCENDING)], name="user_id_id"),
+    ],
+    "orders": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_id_created_at_id"),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("session_id", ASCENDING)], name="session_id"),
+    ],
+    "payment_transactions": [
+        IndexModel([("session_id", ASCENDING)], name="session_id_unique", unique=True),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "catalog_imports": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "status_checks": [
+        IndexModel([("timestamp", ASCENDING), ("id", ASCENDING)], name="timestamp_id"),
+        IndexModel([("client_name", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)], name="client_name_timestamp_id"),
+    ],
+    "webhook_events": [
+        IndexModel([("event_id", ASCENDING)], name="event_id_unique", unique=True),
+        IndexModel([("processed_at", ASCENDING)], name="processed_at"),
+    ],
+}
+
+
+async def dedupe_wishlists(collection) -> int:
+    """Merge each user's duplicate wishlists into their oldest; returns the documents removed.
+
+    Older versions could create several wishlists per user, which blocks the
+    unique ``user_id`` index that wishlist updates rely on. Items keep their
+    order, first occurrence of each product wins.
+    """
+    if "user_id_unique" in await collection.index_information():
+        return 0
+    removed = 0
+    pipeline = [
+        {"$group": {"_id": "$user_id", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    async for group in collection.aggregate(pipeline):
+        docs = await collection.find({"user_id": group["_id"]}).sort("_id", ASCENDING).to_list(None)
+        items = {}
+        for doc in docs:
+            for item in doc.get("items") or []:
+                items.setdefault(item.get("product_id"), item)
+        updated_at = max((doc["updated_at"] for doc in docs if doc.get("updated_at")), default=None)
+        await collection.update_one(
+            {"_id": docs[0]["_id"]},
+            {"$set": {"items": list(items.values()), "updated_at": updated_at}},
+        )
+        result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs[1:]]}})
+        removed += result.deleted_count
+    if removed:
+        logger.warning(f"Merged {removed} duplicate wishlists")
+    return removed
+
+
+# Collections whose unique indexes request handlers rely on for correctness: duplicate
+# webhook deliveries, concurrent first wishlist writes and concurrent registrations
+REQUIRED_FOR_WRITES = ("users", "wishlists", "webhook_events")
+
+# Run before a collection's indexes are created, to repair data that would block them
+BEFORE_INDEXING = {
+    "wishlists": dedupe_wishlists,
+}
+
+
+class QueryShape(NamedTuple):
+    name: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[List[Tuple[str, int]]] = None
+
+
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape("login/register by email", "users", {"email": "user@example.com"}),
+    QueryShape("current user by id", "users", {"id": "user-id"}),
+    QueryShape("wishlist by user", "wishlists", {"user_id": "user-id"}),
+    QueryShape("addresses by user", "addresses", {"user_id": "user-id"}),
+    QueryShape("address by id", "addresses", {"id": "address-id", "user_id": "user-id"}),
+    QueryShape("order history", "orders", {"user_id": "user-id"}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    QueryShape(
+        "order history next page",
+        "orders",
+        {"$and": [
+            {"user_id": "user-id"},
+            {"$or": [{"created_at": {"$lt": "2026-01-01"}}, {"created_at": "2026-01-01", "id": {"$lt": "order-id"}}]},
+        ]},
+        [("created_at", DESCENDING), ("id", DESCENDING)],
+    ),
+    QueryShape("order by id", "orders", {"id": "order-id", "user_id": "user-id"}),
+    QueryShape("order by checkout session", "orders", {"session_id": "cs_test"}),
+    QueryShape("transaction by checkout session", "payment_transactions", {"session_id": "cs_test"}),
+    QueryShape("catalog load", "products", {"deleted": {"$ne": True}}, [("id", ASCENDING)]),
+    QueryShape(
+        "catalog changes since watermark",
+        "products",
+        {"updated_at": {"$gte": datetime(2026, 1, 1, tzinfo=timezone.utc)}},
+        [("updated_at", ASCENDING)],
+    ),
+    QueryShape("import job by id", "catalog_imports", {"id": "job-id"}),
+    QueryShape("status checks", "status_checks", {}, [("timestamp", ASCENDING), ("id", ASCENDING)]),
+    QueryShape(
+        "status checks in window",
+        "status_checks",
+        {"timestamp": {"$gte": datetime(2026, 1, 1, tzinfo=timezone.utc), "$lt": datetime(2026, 1, 2, tzinfo=timezone.utc)}},
+        [("timestamp", ASCENDING), ("id", ASCENDING)],
+    ),
+    QueryShape(
+        "status checks by client in window",
+        "status_checks",
+        {"client_name": "pinger", "timestamp": {"$gte": datetime(2026, 1, 1, tzinfo=timezone.utc)}},
+        [("timestamp", ASCENDING), ("id", ASCENDING)],
+    ),
+    QueryShape("status checks to convert", "status_checks", {"timestamp": {"$type": "string"}}),
+    QueryShape("webhook event by id", "webhook_events", {"event_id": "evt_test"}),
+    QueryShape("unprocessed webhook events", "webhook_events", {"processed_at": None}),
+]
+
+
+async def ensure_indexes(db, collections: Optional[Iterable[str]] = None) -> List[str]:
+    """Create the registered indexes (of ``collections`` only, if given); returns the collections that failed.
+
+    A failure (e.g. existing duplicates blocking a unique index) is logged
+    and does not stop the other collections from being indexed. Connection
+    errors are raised: no other collection would fare any better.
+    """
+    failed = []
+    for collection in collections or INDEXES:
+        models = INDEXES[collection]
+        try:
+            if collection in BEFORE_INDEXING:
+                await BEFORE_INDEXING[collection](db[collection])
+            await db[collection].create_indexes(models)
+        except ConnectionFailure:
+            raise
+        except PyMongoError as e:
+            logger.error(f"Creating indexes on {collection} failed: {str(e)}")
+            failed.append(collection)
+    return failed
+
+
+async def ensure_indexes_with_retry(db, retry_interval: float = 30.0) -> List[str]:
+    """``ensure_indexes``, retried every ``retry_interval`` seconds until the server answers."""
+    while True:
+        try:
+            return await ensure_indexes(db)
+        except ConnectionFailure as e:
+            logger.error(f"Creating indexes failed, retrying in {retry_interval:g}s: {str(e)}")
+            await asyncio.sleep(retry_interval)
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def verify_query_plans(db) -> List[str]:
+    """Return the names of query shapes whose winning plan is a collection scan."""
+    collscans = []
+    for shape in QUERY_SHAPES:
+        cursor = db[shape.collection].find(shape.filter)
+        if shape.sort:
+            cursor = cursor.sort(shape.sort)
+        explain = await cursor.explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            collscans.append(f"{shape.name} ({shape.collection})")
+    return collscans
+
+
+async def _main(check: bool) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        failed = await ensure_indexes(db)
+        for collection in failed:
+            print(f"FAILED: indexes on {collection}")
+        print(f"Indexes ensured on {len(INDEXES) - len(failed)}/{len(INDEXES)} collections")
+        if not check:
+            return 1 if failed else 0
+        collscans = await verify_query_plans(db)
+        for name in collscans:
+            print(f"COLLSCAN: {name}")
+        print(f"{len(QUERY_SHAPES) - len(collscans)}/{len(QUERY_SHAPES)} query shapes use an index")
+        return 1 if failed or collscans else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(check="--check" in sys.argv[1:])))
@@ -0,0 +1,111 @@
+"""Search facets: hits per category and a bucketed price histogram.
+
+Facets follow the usual sidebar rules: category counts ignore the selected
+category (so the other options still show how many hits they would give) and
+the price histogram ignores the selected price range.
+
+Without a text query every count comes from the snapshot's sorted price
+indexes or from histograms precomputed per category; with one, only the
+matched products are counted.
+"""
+import bisect
+import math
+from collections import Counter
+from typing import Dict, List, Optional
+
+from catalog import CatalogSnapshot
+
+
+class PriceHistogram:
+    """Equal-width price buckets over the catalog's price range."""
+
+    def __init__(self, edges: List[float]):
+        # Bucket i covers [edges[i], edges[i + 1]); the last one includes its upper edge
+        self.edges = edges
+
+    @classmethod
+    def for_prices(cls, prices: List[float], buckets: int) -> "PriceHistogram":
+        if not prices:
+            return cls([])
+        low, high = math.floor(prices[0]), math.ceil(prices[-1])
+        width = max(1, math.ceil((high - low) / max(1, buckets)))
+        count = max(1, math.ceil((high - low) / width))
+        return cls([low + i * width for i in range(count + 1)])
+
+    def bucket(self, price: float) -> Optional[int]:
+        if not self.edges or price < self.edges[0] or price > self.edges[-1]:
+            return None
+        return min(bisect.bisect_right(self.edges, price) - 1, len(self.edges) - 2)
+
+    def count_sorted(self, prices: List[float]) -> List[int]:
+        counts = []
+        for i in range(len(self.edges) - 1):
+            lo = bisect.bisect_left(prices, self.edges[i])
+            last = i == len(self.edges) - 2
+            hi = (bisect.bisect_right if last else bisect.bisect_left)(prices, self.edges[i + 1])
+            counts.append(hi - lo)
+        return counts
+
+    def count(self, prices) -> List[int]:
+        counts = [0] * max(0, len(self.edges) - 1)
+        for price in prices:
+            i = self.bucket(price)
+            if i is not None:
+                counts[i] += 1
+        return counts
+
+    def render(self, counts: List[int]) -> List[dict]:
+        return [
+            {"min": self.edges[i], "max": self.edges[i + 1], "count": count}
+            for i, count in enumerate(counts)
+        ]
+
+
+class Facets:
+    """Per-snapshot facet structures; rebuilt when a catalog change touches prices or categories."""
+
+    def __init__(self, snapshot: CatalogSnapshot, buckets: int):
+        self.histogram = PriceHistogram.for_prices(snapshot.price_index.prices, buckets)
+        # Histograms for the "no text query" case, keyed by category ("" for all)
+        self.histogram_counts: Dict[str, List[int]] = {"": self.histogram.count_sorted(snapshot.price_index.prices)}
+        for category, index in snapshot.category_price_index.items():
+            self.histogram_counts[category] = self.histogram.count_sorted(index.prices)
+
+    def compute(
+        self,
+        snapshot: CatalogSnapshot,
+        matches: Optional[List[dict]],
+        category: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        is_new: Optional[bool] = None,
+    ) -> dict:
+        """Facets for a search; ``matches`` are the text-query hits before any filter, or None without a query."""
+        if is_new is not None:
+            # No precomputed counts per flag; count the flagged products directly
+            matches = [p for p in (snapshot.products if matches is None else matches) if bool(p.get("isNew")) == is_new]
+        if matches is None:
+            category_counts = {
+                c: index.count(min_price, max_price) for c, index in snapshot.category_price_index.items()
+            }
+            histogram_counts = self.histogram_counts.get(category or "", [0] * len(self.histogram_counts[""]))
+        else:
+            category_counts = Counter(
+                p["category"] for p in matches
+                if (min_price is None or p["price"] >= min_price) and (max_price is None or p["price"] <= max_price)
+            )
+            histogram_counts = self.histogram.count(
+                p["price"] for p in matches if not category or p["category"] == category
+            )
+
+        return {
+            "categories": [{"id": c["id"], "count": category_counts.get(c["id"], 0)} for c in snapshot.categories],
+            "price_histogram": self.histogram.render(histogram_counts),
+        }
+
+
+def facets_builder(buckets: int):
+    """``Catalog.add_derived`` builder attaching a :class:`Facets` to each snapshot."""
+    def build(snapshot: CatalogSnapshot) -> Facets:
+        return Facets(snapshot, buckets)
+    return build
@@ -0,0 +1,126 @@
+"""HTTP validators, freshness headers and pre-encoded bodies for cacheable GET responses."""
+import gzip
+import hashlib
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are skipped without the package
+    brotli = None
+
+
+class CachePolicy:
+    def __init__(self, max_age: int = 60, stale_while_revalidate: int = 0):
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+
+    def cache_control(self) -> str:
+        value = f"public, max-age={self.max_age}"
+        if self.stale_while_revalidate:
+            value += f", stale-while-revalidate={self.stale_while_revalidate}"
+        return value
+
+    def headers(self, etag: str) -> Dict[str, str]:
+        return {"ETag": etag, "Cache-Control": self.cache_control()}
+
+
+def request_etag(content_hash: str, request: Request) -> str:
+    """Strong ETag for a response fully determined by ``content_hash`` and the request URL."""
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    key = hashlib.sha256(f"{content_hash}|{request.url.path}?{query}".encode()).hexdigest()[:32]
+    return f'"{key}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates
+
+
+def not_modified(request: Request, response: Response, etag: str, policy: CachePolicy) -> Optional[Response]:
+    """Return a bodiless 304 if the client already has ``etag``; otherwise tag ``response``."""
+    headers = policy.headers(etag)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    prefs = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        prefs[coding.strip().lower()] = q
+    return prefs
+
+
+class PrecompressedBody:
+    """A response body encoded once; gzip and Brotli variants are compressed on first use and kept.
+
+    Bodies are rebuilt on every catalog reload, most of them never requested
+    in every coding, so nothing is compressed up front. Levels are moderate:
+    Brotli 11 / gzip 9 cost seconds per megabyte for a few percent of size.
+    """
+
+    # Preference order when the client weighs several codings equally
+    CODINGS = ("br", "gzip", "identity")
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 5
+
+    def __init__(self, content: bytes, media_type: str = "application/json"):
+        self.media_type = media_type
+        self.variants = {"identity": content}
+        self.codings = {"identity", "gzip"} | ({"br"} if brotli is not None else set())
+
+    def variant(self, coding: str) -> bytes:
+        data = self.variants.get(coding)
+        if data is None:
+            content = self.variants["identity"]
+            if coding == "gzip":
+                data = gzip.compress(content, compresslevel=self.GZIP_LEVEL, mtime=0)
+            else:
+                data = brotli.compress(content, quality=self.BROTLI_QUALITY)
+            self.variants[coding] = data
+        return data
+
+    def choose_coding(self, accept_encoding: Optional[str]) -> str:
+        prefs = parse_accept_encoding(accept_encoding)
+        best, best_q = "identity", 0.0
+        for coding in self.CODINGS:
+            if coding not in self.codings:
+                continue
+            # identity stays acceptable unless excluded, but only as a last resort
+            default = prefs.get("*", 0.001 if coding == "identity" else 0.0)
+            q = prefs.get(coding, default)
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def response(self, request: Request, etag: str, policy: CachePolicy) -> Response:
+        coding = self.choose_coding(request.headers.get("accept-encoding"))
+        if coding != "identity":
+            # Each content-coding is a different representation and needs its own strong validator
+            etag = f'{etag[:-1]}-{coding}"'
+        headers = policy.headers(etag)
+        headers["Vary"] = "Accept-Encoding"
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.variant(coding), media_type=self.media_type, headers=headers)
@@ -0,0 +1,318 @@
+"""Resized product image derivatives.
+
+:class:`ImageService` serves product images at a requested width and format.
+Originals come from a pluggable :class:`ImageSource` (HTTP, or a local
+directory so it works without network access). Derivatives are cached in
+memory and on disk under content-addressed keys: a key hashes the original's
+bytes together with the width, format and quality, so a changed original can
+never serve a stale derivative. Both caches evict least recently used
+entries once over their byte budget.
+
+Decoding and encoding are CPU-bound and run on a process pool, off the event
+loop and outside the GIL. Requested widths are rounded up to a fixed ladder
+so the number of derivatives per image stays small.
+"""
+import abc
+import asyncio
+import hashlib
+import io
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+from urllib.parse import urlparse
+
+import httpx
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from cache import SingleFlight, SizedLRUCache, TTLCache
+from executors import BoundedExecutor
+
+MEDIA_TYPES = {"webp": "image/webp", "avif": "image/avif", "jpeg": "image/jpeg"}
+WIDTHS = (160, 320, 480, 640, 960, 1280, 1920)
+LOCAL_EXTENSIONS = ("", ".jpg", ".jpeg", ".png", ".webp")
+
+
+class ImageNotFound(Exception):
+    pass
+
+
+class ImageSourceError(Exception):
+    pass
+
+
+def available_formats() -> Sequence[str]:
+    """Output formats this Pillow build can encode."""
+    return tuple(fmt for fmt in MEDIA_TYPES if fmt == "jpeg" or features.check(fmt))
+
+
+def snap_width(width: int, widths: Sequence[int] = WIDTHS) -> int:
+    for candidate in widths:
+        if candidate >= width:
+            return candidate
+    return widths[-1]
+
+
+def render(original: bytes, width: int, fmt: str, quality: int) -> bytes:
+    """Decode ``original``, scale it down to ``width`` (never up) and encode it as ``fmt``.
+
+    Runs in a worker process, so it must stay a module-level function.
+    """
+    with Image.open(io.BytesIO(original)) as image:
+        if image.width > width:
+            # Lets the JPEG decoder downscale by a power of two while decoding
+            image.draft("RGB", (width, image.height * width // image.width))
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        mode = "RGBA" if has_alpha and fmt != "jpeg" else "RGB"
+        if image.mode != mode:
+            image = image.convert(mode)
+
+        out = io.BytesIO()
+        if fmt == "jpeg":
+            image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+        elif fmt == "webp":
+            image.save(out, "WEBP", quality=quality, method=4)
+        else:
+            image.save(out, "AVIF", quality=quality, speed=8)
+        return out.getvalue()
+
+
+class ImageSource(abc.ABC):
+    """Where originals come from; ``fetch`` returns the bytes for an image URL."""
+
+    @abc.abstractmethod
+    async def fetch(self, url: str) -> bytes:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalImageSource(ImageSource):
+    """Originals stored in one directory, named after the last path segment of their URL.
+
+    ``https://images.unsplash.com/photo-123`` is looked up as ``photo-123``,
+    then with a ``.jpg``, ``.jpeg``, ``.png`` or ``.webp`` extension.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _read(self, url: str) -> bytes:
+        name = Path(urlparse(url).path).name
+        if name:
+            for extension in LOCAL_EXTENSIONS:
+                path = self.root / f"{name}{extension}"
+                if path.is_file():
+                    return path.read_bytes()
+        raise ImageNotFound(f"No local image for {url}")
+
+    async def fetch(self, url: str) -> bytes:
+        return await asyncio.to_thread(self._read, url)
+
+
+class HTTPImageSource(ImageSource):
+    def __init__(self, max_connections: int = 10, timeout: float = 10.0, max_bytes: int = 20 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+            follow_redirects=True,
+        )
+
+    async def fetch(self, url: str) -> bytes:
+        try:
+            async with self._client.stream("GET", url) as response:
+                if response.status_code == 404:
+                    raise ImageNotFound(f"Image not found at {url}")
+                response.raise_for_status()
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body += chunk
+                    if len(body) > self.max_bytes:
+                        raise ImageSourceError(f"Image at {url} exceeds {self.max_bytes} bytes")
+                return bytes(body)
+        except httpx.HTTPError as e:
+            raise ImageSourceError(f"Fetching {url} failed: {str(e)}")
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class DiskCache:
+    """Files under ``root`` named by key, evicted least recently used first.
+
+    Reads bump a file's mtime, which is what eviction orders by. Writes go
+    through a temporary file and a rename, so readers never see partial
+    files, and several processes can share one directory.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.nbytes = sum(path.stat().st_size for path in self._files())
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _files(self):
+        return (path for path in self.root.glob("*/*") if path.is_file() and not path.name.startswith("."))
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def _set(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.parent / f".{key}.{os.getpid()}.tmp"
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        self.nbytes += len(data)
+        if self.nbytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self) -> None:
+        # Trim to 90% of the budget so eviction does not rescan on every write
+        entries = sorted(((p.stat(), p) for p in self._files()), key=lambda entry: entry[0].st_mtime)
+        self.nbytes = sum(stat.st_size for stat, _ in entries)
+        for stat, path in entries:
+            if self.nbytes <= self.max_bytes * 0.9:
+                break
+            path.unlink(missing_ok=True)
+            self.nbytes -= stat.st_size
+            self.evictions += 1
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = await asyncio.to_thread(self._get, key)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    async def set(self, key: str, data: bytes) -> None:
+        await asyncio.to_thread(self._set, key, data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class Derivative:
+    __slots__ = ("key", "data", "media_type")
+
+    def __init__(self, key: str, data: bytes, media_type: str):
+        self.key = key
+        self.data = data
+        self.media_type = media_type
+
+
+class ImageService:
+    def __init__(
+        self,
+        source: ImageSource,
+        executor: BoundedExecutor,
+        disk_cache: DiskCache,
+        memory_bytes: int = 64 * 1024 * 1024,
+        quality: int = 75,
+        widths: Sequence[int] = WIDTHS,
+        digest_ttl: float = 3600.0,
+    ):
+        self.source = source
+        self.executor = executor
+        self.disk = disk_cache
+        self.memory = SizedLRUCache(memory_bytes)
+        self.quality = quality
+        self.widths = tuple(sorted(widths))
+        self.formats = available_formats()
+        # Original URL -> content digest, so cache hits skip fetching the original;
+        # the TTL bounds how long a replaced original keeps its old derivatives
+        self._digests = TTLCache(maxsize=10000, ttl=digest_ttl)
+        self._renders = SingleFlight()
+        self.fetches = 0
+        self.renders = 0
+        self.render_seconds = 0.0
+
+    def derivative_key(self, digest: str, width: int, fmt: str) -> str:
+        return hashlib.sha256(f"{digest}:{width}:{fmt}:{self.quality}".encode()).hexdigest()
+
+    async def get(self, url: str, width: int, fmt: str) -> Derivative:
+        """``url`` at ``width`` (rounded up to the width ladder) encoded as ``fmt``."""
+        if fmt not in self.formats:
+            raise ValueError(f"Unsupported format: {fmt}")
+        width = snap_width(width, self.widths)
+
+        digest = self._digests.get(url)
+        if digest is not None:
+            derivative = await self._cached(self.derivative_key(digest, width, fmt), fmt)
+            if derivative is not None:
+                return derivative
+        return await self._renders.do((url, width, fmt), lambda: self._render(url, width, fmt))
+
+    async def _cached(self, key: str, fmt: str) -> Optional[Derivative]:
+        data = self.memory.get(key)
+        if data is None:
+            data = await self.disk.get(key)
+            if data is None:
+                return None
+            self.memory.set(key, data)
+        return Derivative(key, data, MEDIA_TYPES[fmt])
+
+    async def _render(self, url: str, width: int, fmt: str) -> Derivative:
+        original = await self.source.fetch(url)
+        self.fetches += 1
+        digest = hashlib.sha256(original).hexdigest()
+        self._digests.set(url, digest)
+        key = self.derivative_key(digest, width, fmt)
+        derivative = await self._cached(key, fmt)
+        if derivative is not None:
+            return derivative
+
+        start = time.perf_counter()
+        try:
+            data = await self.executor.run(render, original, width, fmt, self.quality)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+            # DecompressionBombError: the original is over twice Image.MAX_IMAGE_PIXELS
+            raise ImageSourceError(f"Could not decode the image at {url}: {str(e)}")
+        self.renders += 1
+        self.render_seconds += time.perf_counter() - start
+
+        self.memory.set(key, data)
+        await self.disk.set(key, data)
+        return Derivative(key, data, MEDIA_TYPES[fmt])
+
+    async def close(self) -> None:
+        await self.source.close()
+        self.executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "formats": list(self.formats),
+            "fetches": self.fetches,
+            "renders": self.renders,
+            "avg_render_ms": round(self.render_seconds / self.renders * 1000, 2) if self.renders else 0.0,
+            "memory_cache": self.memory.stats(),
+            "disk_cache": self.disk.stats(),
+            "executor": self.executor.stats(),
+        }
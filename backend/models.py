@@ -0,0 +1,13 @@
+"""Models shared by the API and the command-line tools that must not import the app."""
+from pydantic import BaseModel
+
+
+# Product Model (for search results and catalog imports)
+class Product(BaseModel):
+    id: int
+    name: str
+    nameEn: str
+    category: str
+    price: float
+    image: str
+    isNew: bool = False
@@ -0,0 +1,106 @@
+"""Keyset (cursor) pagination over Mongo collections.
+
+A page is read with a range filter on the sort keys of the last document of
+the previous page, so every page costs the same index seek however deep the
+client scrolls. The position is handed to clients as an opaque token.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+SortSpec = Sequence[Tuple[str, int]]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, size: int) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Malformed cursor")
+    try:
+        return [_decode_value(v) for v in values]
+    except (TypeError, ValueError):
+        raise InvalidCursor("Malformed cursor")
+
+
+def after_filter(sort: SortSpec, values: Sequence[Any]) -> Dict[str, Any]:
+    """Filter matching documents that sort strictly after ``values``."""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prev_field: values[j] for j, (prev_field, _) in enumerate(sort[:i])}
+        clause[field] = {"$gt" if direction > 0 else "$lt": values[i]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def clamp_page_size(limit: Optional[int], default: int, maximum: int) -> int:
+    if limit is None:
+        return default
+    return max(1, min(limit, maximum))
+
+
+def parse_projection(
+    fields: Optional[str],
+    required: Iterable[str],
+    allowed: Optional[Iterable[str]] = None,
+) -> Dict[str, int]:
+    """Mongo projection for a comma-separated ``fields`` list, or all fields when empty.
+
+    ``_id`` and ``$`` operators are never projected, and names outside
+    ``allowed`` (when given) are ignored; a list with no usable names
+    projects just ``required``.
+    """
+    projection = {"_id": 0}
+    requested = [f.strip() for f in (fields or "").split(",") if f.strip()]
+    if requested:
+        required = list(required)
+        allowed = set(allowed) if allowed is not None else None
+        for field in [*requested, *required]:
+            if field != "_id" and "$" not in field and (allowed is None or field in allowed or field in required):
+                projection[field] = 1
+    return projection
+
+
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    sort: SortSpec,
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[Dict[str, int]] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """Read one page; returns the documents and the token for the next page (None at the end)."""
+    if cursor:
+        query = {"$and": [query, after_filter(sort, decode_cursor(cursor, len(sort)))]}
+    docs = await collection.find(query, projection or {"_id": 0}).sort(list(sort)).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor([docs[-1].get(field) for field, _ in sort])
+    return docs, next_cursor
@@ -0,0 +1,88 @@
+"""Application-lifetime Stripe checkout clients.
+
+The Stripe SDK sends every request through ``stripe.default_http_client``.
+:class:`StripeClientRegistry` installs one pooled, keep-alive client there at
+startup and hands out one ``StripeCheckout`` per webhook URL, so checkout,
+status and webhook calls reuse connections instead of opening new ones.
+"""
+import ssl
+from typing import Dict, Optional
+
+import httpx
+import stripe
+from emergentintegrations.payments.stripe.checkout import StripeCheckout
+
+
+# Payment statuses after which a "complete" checkout session cannot change again
+SETTLED_PAYMENT_STATUSES = {"paid", "no_payment_required"}
+
+
+class PaymentsNotConfigured(Exception):
+    pass
+
+
+def checkout_settled(status: Optional[dict]) -> bool:
+    """Whether Stripe will report nothing new for a checkout session.
+
+    A "complete" session paid with a delayed method (bank debits, vouchers)
+    stays "unpaid" until the payment clears or fails, so it is not settled.
+    """
+    if not status:
+        return False
+    if status.get("status") == "expired":
+        return True
+    return status.get("status") == "complete" and status.get("payment_status") in SETTLED_PAYMENT_STATUSES
+
+
+class PooledHTTPXClient(stripe.HTTPXClient):
+    """Stripe SDK HTTP client backed by httpx pools with explicit limits and timeouts."""
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        verify_ssl_certs: bool = True,
+    ):
+        http_timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        super().__init__(timeout=http_timeout, allow_sync_methods=True, verify_ssl_certs=verify_ssl_certs)
+
+        # Replace the SDK's default clients (no pool limits) before they open any connection
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        verify = ssl.create_default_context(cafile=stripe.ca_bundle_path) if verify_ssl_certs else False
+        self._client_async = httpx.AsyncClient(verify=verify, limits=limits, timeout=http_timeout)
+        self._client = httpx.Client(verify=verify, limits=limits, timeout=http_timeout)
+
+
+class StripeClientRegistry:
+    def __init__(self, api_key: Optional[str], http_client: stripe.HTTPXClient, api_base: Optional[str] = None):
+        self.api_key = api_key
+        self.http_client = http_client
+        self.api_base = api_base
+        self._clients: Dict[str, StripeCheckout] = {}
+
+        stripe.default_http_client = http_client
+        if api_base:
+            stripe.api_base = api_base.rstrip('/')
+
+    def get(self, webhook_url: str) -> StripeCheckout:
+        stripe_checkout = self._clients.get(webhook_url)
+        if stripe_checkout is None:
+            if not self.api_key:
+                raise PaymentsNotConfigured("Stripe API key not configured")
+            stripe_checkout = StripeCheckout(api_key=self.api_key, webhook_url=webhook_url)
+            self._clients[webhook_url] = stripe_checkout
+        return stripe_checkout
+
+    async def close(self) -> None:
+        self._clients.clear()
+        await self.http_client.close_async()
+        self.http_client.close()
+        if stripe.default_http_client is self.http_client:
+            stripe.default_http_client = None
@@ -0,0 +1,169 @@
+"""Filtering, ordering and paging of product search results.
+
+Without a text query, price-ordered ranges are cut out of the snapshot's
+:class:`~catalog.PriceIndex` with binary searches, other orders come from
+masks over the :class:`~columnar.ColumnarCatalog`, and the unfiltered listings
+for every sort order are built once per snapshot, so such a request only pays
+for the page it returns.
+"""
+import bisect
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from catalog import CatalogChange, CatalogSnapshot, patch_sorted
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+from search_index import normalize_text, tokenize
+
+SORTS = ("relevance", "price_asc", "price_desc", "newest")
+
+# substring: names containing the query, in catalog order.
+# ranked: BM25 with typo-tolerant term matching, best match first.
+MODES = ("substring", "ranked")
+
+
+class InvalidSort(ValueError):
+    pass
+
+
+class InvalidMode(ValueError):
+    pass
+
+
+def match_products(snapshot: CatalogSnapshot, q: str, mode: str = "substring") -> Tuple[Optional[List[dict]], Optional[Dict[int, float]]]:
+    """Text-query hits in relevance order and, in ranked mode, their scores; (None, None) without a query."""
+    if mode not in MODES:
+        raise InvalidMode(f"Invalid mode, expected one of: {', '.join(MODES)}")
+    if not q:
+        return None, None
+    if mode == "ranked":
+        # The ranking index is kept across snapshots whose names did not change; return current products
+        return snapshot.derived["ranking"].search(q, snapshot.by_id)
+    return snapshot.search(q), None
+
+
+def query_key(q: str, mode: str) -> Tuple[bool, str]:
+    """Cache key for ``q``: spellings that are guaranteed to search identically share it."""
+    if mode == "ranked":
+        # Ranking only sees the tokens
+        return bool(q), " ".join(tokenize(q))
+    return bool(q), normalize_text(q)
+
+
+def sort_key(snapshot: CatalogSnapshot, sort: str, scores: Optional[Dict[int, float]] = None) -> Callable[[dict], Tuple]:
+    """Ascending key for ``sort``; also what a page cursor records for its last product."""
+    if sort == "price_asc":
+        return lambda p: (p["price"], p["id"])
+    if sort == "price_desc":
+        return lambda p: (-p["price"], -p["id"])
+    if sort == "newest":
+        # No creation dates on products: new arrivals first, then the most recently added ids
+        return lambda p: (0 if p.get("isNew") else 1, -p["id"])
+    if sort == "relevance":
+        positions = snapshot.positions
+        if scores is not None:
+            return lambda p: (-scores[p["id"]], positions[p["id"]])
+        return lambda p: (positions[p["id"]],)
+    raise InvalidSort(f"Invalid sort, expected one of: {', '.join(SORTS)}")
+
+
+def build_listings(snapshot: CatalogSnapshot) -> Dict[Tuple[str, str], List[dict]]:
+    """``Catalog.add_derived`` builder: every category ("" for all) in every sort order."""
+    listings = {}
+    for category in ["", *snapshot.by_category]:
+        products = snapshot.in_category(category)
+        index = snapshot.prices_in(category)
+        listings[("relevance", category)] = products
+        listings[("price_asc", category)] = index.products
+        listings[("price_desc", category)] = index.products[::-1]
+        listings[("newest", category)] = sorted(products, key=sort_key(snapshot, "newest"))
+    return listings
+
+
+def update_listings(
+    previous: Dict[Tuple[str, str], List[dict]], snapshot: CatalogSnapshot, change: CatalogChange
+) -> Dict[Tuple[str, str], List[dict]]:
+    """``Catalog.add_derived`` update for :func:`build_listings`: only the changed categories are redone."""
+    listings = dict(previous)
+    newest = sort_key(snapshot, "newest")
+    for category in ["", *change.categories()]:
+        if category and category not in snapshot.by_category:
+            for sort in SORTS:
+                listings.pop((sort, category), None)
+            continue
+        index = snapshot.prices_in(category)
+        listings[("relevance", category)] = snapshot.in_category(category)
+        listings[("price_asc", category)] = index.products
+        listings[("price_desc", category)] = index.products[::-1]
+        if ("newest", category) in previous:
+            before = [p for p in change.before if not category or p["category"] == category]
+            after = [p for p in change.after if not category or p["category"] == category]
+            listings[("newest", category)] = patch_sorted(previous[("newest", category)], before, after, newest)
+        else:
+            listings[("newest", category)] = sorted(snapshot.in_category(category), key=newest)
+    return listings
+
+
+def find_products(
+    snapshot: CatalogSnapshot,
+    matches: Optional[List[dict]],
+    category: Optional[str],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    sort: str = "relevance",
+    is_new: Optional[bool] = None,
+) -> Sequence[dict]:
+    """All products passing the filters, in ``sort`` order.
+
+    ``matches`` are the text-query hits in relevance order, or None to search
+    the whole catalog.
+    """
+    key = sort_key(snapshot, sort)
+    if matches is not None:
+        results = [
+            p for p in matches
+            if (not category or p["category"] == category)
+            and (min_price is None or p["price"] >= min_price)
+            and (max_price is None or p["price"] <= max_price)
+            and (is_new is None or bool(p.get("isNew")) == is_new)
+        ]
+        return results if sort == "relevance" else sorted(results, key=key)
+
+    if is_new is not None:
+        # The flag has no precomputed listing or price index; mask the columns
+        columns = snapshot.derived["columns"]
+        return columns.rows(columns.find(category, min_price, max_price, is_new, sort), snapshot.products.__getitem__)
+
+    if min_price is None and max_price is None:
+        return snapshot.derived["listings"].get((sort, category or ""), [])
+
+    if sort == "price_asc":
+        return snapshot.prices_in(category).range(min_price, max_price)
+    if sort == "price_desc":
+        return snapshot.prices_in(category).range(min_price, max_price)[::-1]
+    # Other orders: vectorized masks over the columnar store's precomputed orders,
+    # materializing only the rows the caller reads
+    columns = snapshot.derived["columns"]
+    return columns.rows(columns.find(category, min_price, max_price, sort=sort), snapshot.products.__getitem__)
+
+
+def page(
+    snapshot: CatalogSnapshot,
+    results: Sequence[dict],
+    sort: str,
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    scores: Optional[Dict[int, float]] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of ``results``; the cursor resumes after the last product even if the catalog reloads."""
+    key = sort_key(snapshot, sort, scores)
+    start = max(0, offset)
+    if cursor:
+        after = tuple(decode_cursor(cursor, len(key(results[0])) if results else 1))
+        try:
+            start = bisect.bisect_right(results, after, key=key)
+        except TypeError:
+            raise InvalidCursor("Malformed cursor")
+    end = start + limit
+    items = results[start:end]
+    next_cursor = encode_cursor(list(key(items[-1]))) if items and end < len(results) else None
+    return items, next_cursor
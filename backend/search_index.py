@@ -0,0 +1,453 @@
+"""In-memory text indexes for the product catalog."""
+import bisect
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+# Harakat, Quranic annotation marks, superscript alef and tatweel
+_TASHKEEL_RE = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+
+_ARABIC_CHAR_MAP = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ؤ": "و",
+    "ئ": "ي",
+    "ة": "ه",
+    "ى": "ي",
+})
+
+
+def normalize_text(text: str) -> str:
+    """Fold Arabic spelling variants and case so equivalent spellings compare equal."""
+    return _TASHKEEL_RE.sub("", text).translate(_ARABIC_CHAR_MAP).lower()
+
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+def term_trigrams(term: str) -> Set[str]:
+    # Padded like pg_trgm, so short terms and word starts still share grams
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NGramIndex:
+    """Character n-gram inverted index with substring lookup.
+
+    Every gram of length 1..n of each normalized field is posted to the
+    documents containing it, so a query of up to ``n`` characters is answered
+    from a single posting list and longer queries by intersecting their
+    n-gram postings and confirming the candidates with a substring test.
+    Results come back in the order the documents were synced.
+    """
+
+    def __init__(self, fields: Sequence[str] = ("name", "nameEn"), n: int = 3):
+        if n < 1:
+            raise ValueError("n must be at least 1")
+        self.fields = tuple(fields)
+        self.n = n
+        self._postings: Dict[str, Set[int]] = {}
+        self._texts: Dict[int, Tuple[str, ...]] = {}
+        self._docs: Dict[int, dict] = {}
+        self._order: Dict[int, int] = {}
+        # Grams whose posting set this index may modify; None while no copy shares them
+        self._owned: Optional[Set[str]] = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def copy(self) -> "NGramIndex":
+        """Independent copy that can be synced without disturbing readers of this one.
+
+        Posting sets are shared until one side changes them, so copying costs
+        a dict copy and changing a few documents only clones their grams' sets.
+        """
+        clone = NGramIndex(self.fields, self.n)
+        clone._postings = dict(self._postings)
+        clone._texts = dict(self._texts)
+        clone._docs = dict(self._docs)
+        clone._order = dict(self._order)
+        self._owned = set()
+        clone._owned = set()
+        return clone
+
+    def _normalized_fields(self, doc: dict) -> Tuple[str, ...]:
+        return tuple(normalize_text(str(doc.get(field) or "")) for field in self.fields)
+
+    def _doc_grams(self, texts: Iterable[str]) -> Set[str]:
+        grams = set()
+        for text in texts:
+            for size in range(1, self.n + 1):
+                grams.update(text[i:i + size] for i in range(len(text) - size + 1))
+        return grams
+
+    def _posting(self, gram: str) -> Optional[Set[int]]:
+        """Posting set of ``gram`` that this index may modify, cloning it if a copy shares it."""
+        posting = self._postings.get(gram)
+        if posting is not None and self._owned is not None and gram not in self._owned:
+            posting = self._postings[gram] = set(posting)
+            self._owned.add(gram)
+        return posting
+
+    def _post(self, doc_id: int, grams: Iterable[str]) -> None:
+        for gram in grams:
+            posting = self._posting(gram)
+            if posting is None:
+                posting = self._postings[gram] = set()
+                if self._owned is not None:
+                    self._owned.add(gram)
+            posting.add(doc_id)
+
+    def _unpost(self, doc_id: int, grams: Iterable[str]) -> None:
+        for gram in grams:
+            posting = self._posting(gram)
+            if posting is None:
+                continue
+            posting.discard(doc_id)
+            if not posting:
+                del self._postings[gram]
+
+    def _index(self, doc_id: int, texts: Tuple[str, ...]) -> None:
+        previous = self._texts.get(doc_id)
+        if previous == texts:
+            return
+        # Only grams gained or lost are touched; the others' posting sets stay shared with copies
+        old = self._doc_grams(previous) if previous is not None else set()
+        new = self._doc_grams(texts)
+        self._unpost(doc_id, old - new)
+        self._post(doc_id, new - old)
+        self._texts[doc_id] = texts
+
+    def _deindex(self, doc_id: int) -> None:
+        texts = self._texts.pop(doc_id, None)
+        if texts is not None:
+            self._unpost(doc_id, self._doc_grams(texts))
+
+    def add(self, doc: dict) -> None:
+        """Index ``doc``, replacing any previous version with the same id."""
+        doc_id = doc["id"]
+        self._index(doc_id, self._normalized_fields(doc))
+        self._docs[doc_id] = doc
+        self._order.setdefault(doc_id, len(self._order))
+
+    def remove(self, doc_id: int) -> None:
+        self._deindex(doc_id)
+        self._docs.pop(doc_id, None)
+        self._order.pop(doc_id, None)
+
+    def sync(self, docs: Iterable[dict]) -> None:
+        """Bring the index in line with ``docs``.
+
+        Only documents whose indexed fields changed are re-posted; documents
+        missing from ``docs`` are dropped and result order follows ``docs``.
+        """
+        order: Dict[int, int] = {}
+        for doc in docs:
+            self.add(doc)
+            order[doc["id"]] = len(order)
+        for doc_id in [doc_id for doc_id in self._docs if doc_id not in order]:
+            self.remove(doc_id)
+        self._order = order
+
+    def update(self, docs: Iterable[dict], removed_ids: Iterable[int], order: Dict[int, int]) -> None:
+        """Apply changed ``docs`` and drop ``removed_ids`` without visiting the other documents.
+
+        ``order`` maps every remaining id to its result position; it is kept,
+        not copied.
+        """
+        for doc_id in removed_ids:
+            self._deindex(doc_id)
+            self._docs.pop(doc_id, None)
+        for doc in docs:
+            self._index(doc["id"], self._normalized_fields(doc))
+            self._docs[doc["id"]] = doc
+        self._order = order
+
+    def search_ids(self, query: str) -> List[int]:
+        """Ids of documents with a field containing ``query`` (after normalization)."""
+        needle = normalize_text(query)
+        if not needle:
+            return sorted(self._docs, key=self._order.__getitem__)
+
+        size = min(len(needle), self.n)
+        grams = {needle[i:i + size] for i in range(len(needle) - size + 1)}
+        postings = []
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+
+        if len(needle) > self.n:
+            candidates = {
+                doc_id for doc_id in candidates
+                if any(needle in text for text in self._texts[doc_id])
+            }
+        return sorted(candidates, key=self._order.__getitem__)
+
+    def search(self, query: str) -> List[dict]:
+        return [self._docs[doc_id] for doc_id in self.search_ids(query)]
+
+
+class RankedIndex:
+    """BM25 ranking over tokenized fields, with typo-tolerant term matching.
+
+    Each query term is matched to the indexed terms whose trigram similarity
+    (Jaccard over padded trigrams) reaches ``fuzzy_threshold``; a match
+    contributes its BM25 weight scaled by that similarity. Documents flagged
+    ``isNew`` get their score multiplied by ``1 + new_boost``.
+
+    The index keeps term frequencies and document lengths and works out idf
+    and length normalization at query time, since both shift with every
+    document; that lets :meth:`updated` derive the next snapshot's index by
+    re-tokenizing only the documents that changed.
+    """
+
+    def __init__(
+        self,
+        docs: Iterable[dict],
+        fields: Sequence[str] = ("name", "nameEn"),
+        k1: float = 1.2,
+        b: float = 0.75,
+        fuzzy_threshold: float = 0.3,
+        new_boost: float = 0.1,
+    ):
+        self.fields = tuple(fields)
+        self.k1 = k1
+        self.b = b
+        self.fuzzy_threshold = fuzzy_threshold
+        self.new_boost = new_boost
+        self._docs: Dict[int, dict] = {}
+        self._order: Dict[int, int] = {}
+        self._term_freqs: Dict[int, Counter] = {}
+        self._lengths: Dict[int, int] = {}
+        self._total_length = 0
+        # term -> {doc_id: frequency of the term in that document}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._term_grams: Dict[str, Set[str]] = {}
+        self._gram_terms: Dict[str, Set[str]] = {}
+        for doc in docs:
+            self._order[doc["id"]] = len(self._order)
+            self._add(doc, Counter(self._tokens(doc)))
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _tokens(self, doc: dict) -> List[str]:
+        return [t for field in self.fields for t in tokenize(str(doc.get(field) or ""))]
+
+    def _add(self, doc: dict, freqs: Counter) -> None:
+        doc_id = doc["id"]
+        self._docs[doc_id] = doc
+        self._term_freqs[doc_id] = freqs
+        self._lengths[doc_id] = length = sum(freqs.values())
+        self._total_length += length
+        for term, tf in freqs.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+            if term not in self._term_grams:
+                self._term_grams[term] = grams = term_trigrams(term)
+                for gram in grams:
+                    self._gram_terms.setdefault(gram, set()).add(term)
+
+    def _remove(self, doc_id: int) -> None:
+        self._docs.pop(doc_id, None)
+        freqs = self._term_freqs.pop(doc_id, None)
+        if freqs is None:
+            return
+        self._total_length -= self._lengths.pop(doc_id)
+        for term in freqs:
+            posting = self._postings[term]
+            del posting[doc_id]
+            if posting:
+                continue
+            del self._postings[term]
+            for gram in self._term_grams.pop(term):
+                terms = self._gram_terms[gram]
+                terms.discard(term)
+                if not terms:
+                    del self._gram_terms[gram]
+
+    def updated(self, docs: Iterable[dict], removed_ids: Iterable[int], order: Dict[int, int]) -> "RankedIndex":
+        """A new index with ``docs`` added or replaced and ``removed_ids`` dropped; this one is left as is.
+
+        Only the changed documents are re-tokenized, and only the postings of
+        their terms are copied. ``order`` maps every remaining id to its
+        position for tie-breaking; it is kept, not copied.
+        """
+        clone = RankedIndex((), self.fields, self.k1, self.b, self.fuzzy_threshold, self.new_boost)
+        clone._docs = dict(self._docs)
+        clone._term_freqs = dict(self._term_freqs)
+        clone._lengths = dict(self._lengths)
+        clone._total_length = self._total_length
+        clone._postings = dict(self._postings)
+        clone._term_grams = dict(self._term_grams)
+        clone._gram_terms = dict(self._gram_terms)
+
+        retired = [doc_id for doc_id in removed_ids if doc_id in self._docs]
+        fresh = []
+        for doc in docs:
+            freqs = Counter(self._tokens(doc))
+            if freqs == self._term_freqs.get(doc["id"]):
+                clone._docs[doc["id"]] = doc
+                continue
+            retired.append(doc["id"])
+            fresh.append((doc, freqs))
+
+        # Posting dicts and gram sets are shared with this index; copy the ones about to change.
+        # A gram's terms only change when a term enters the vocabulary or may leave it
+        retired_ids = set(retired)
+        terms = {term for doc_id in retired for term in self._term_freqs.get(doc_id, ())}
+        vocabulary_changes = {term for term in terms if retired_ids.issuperset(self._postings[term])}
+        for _, freqs in fresh:
+            terms.update(freqs)
+            vocabulary_changes.update(term for term in freqs if term not in self._postings)
+        for term in terms:
+            if term in self._postings:
+                clone._postings[term] = dict(self._postings[term])
+        for term in vocabulary_changes:
+            for gram in self._term_grams.get(term) or term_trigrams(term):
+                if gram in self._gram_terms:
+                    clone._gram_terms[gram] = set(self._gram_terms[gram])
+
+        for doc_id in retired:
+            clone._remove(doc_id)
+        for doc, freqs in fresh:
+            clone._add(doc, freqs)
+        clone._order = order
+        return clone
+
+    def similar_terms(self, term: str) -> List[Tuple[str, float]]:
+        """Indexed terms close enough to ``term``, with their similarity (1.0 for an exact match)."""
+        similar = [(term, 1.0)] if term in self._postings else []
+        grams = term_trigrams(term)
+        shared = Counter(t for gram in grams for t in self._gram_terms.get(gram, ()) if t != term)
+        for candidate, overlap in shared.items():
+            similarity = overlap / (len(grams) + len(self._term_grams[candidate]) - overlap)
+            if similarity >= self.fuzzy_threshold:
+                similar.append((candidate, similarity))
+        return similar
+
+    def scores(self, query: str) -> Dict[int, float]:
+        k1, b, lengths = self.k1, self.b, self._lengths
+        count = len(lengths)
+        average_length = self._total_length / count if count else 0.0
+        scores: Dict[int, float] = {}
+        for term in dict.fromkeys(tokenize(query)):
+            # A query term counts once per document, through its best-matching indexed term
+            best: Dict[int, float] = {}
+            for candidate, similarity in self.similar_terms(term):
+                posting = self._postings[candidate]
+                idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    norm = k1 * (1 - b + b * lengths[doc_id] / average_length) if average_length else k1
+                    contribution = similarity * idf * tf * (k1 + 1) / (tf + norm)
+                    if contribution > best.get(doc_id, 0.0):
+                        best[doc_id] = contribution
+            for doc_id, contribution in best.items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + contribution
+        if self.new_boost:
+            for doc_id in scores:
+                if self._docs[doc_id].get("isNew"):
+                    scores[doc_id] *= 1 + self.new_boost
+        return scores
+
+    def search(self, query: str, docs: Optional[Dict[int, dict]] = None) -> Tuple[List[dict], Dict[int, float]]:
+        """Matching documents, best first (ties in index order), and their scores by id.
+
+        ``docs`` maps ids to the documents to return, for callers holding
+        newer versions of them than the index; it defaults to the indexed ones.
+        """
+        scores = self.scores(query)
+        ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], self._order[doc_id]))
+        docs = self._docs if docs is None else docs
+        return [docs[doc_id] for doc_id in ranked], scores
+
+
+class PrefixIndex:
+    """Autocomplete over normalized names, backed by sorted key arrays.
+
+    Each name is filed under its full text and under every later word start,
+    so "bag" completes "Luxury Leather Bag" as well as "Bags ...". A lookup
+    is a binary search followed by a forward scan of the keys sharing the
+    prefix. Completions at the start of a name come before mid-name ones;
+    within each group they are in key order.
+    """
+
+    def __init__(self, docs: Iterable[dict], fields: Sequence[str] = ("name", "nameEn")):
+        self.fields = tuple(fields)
+        groups: Tuple[List, List] = ([], [])
+        for doc in docs:
+            for group, key, text in self._entries(doc):
+                groups[group].append((key, doc, text))
+
+        self._groups = []
+        for entries in groups:
+            entries.sort(key=lambda entry: (entry[0], entry[1]["id"]))
+            self._groups.append(([entry[0] for entry in entries], [entry[1:] for entry in entries]))
+
+    def _entries(self, doc: dict):
+        """(group, key, text) for each key ``doc`` is filed under: group 0 for name starts, 1 for word starts."""
+        for field in self.fields:
+            text = str(doc.get(field) or "")
+            normalized = " ".join(normalize_text(text).split())
+            if not normalized:
+                continue
+            yield 0, normalized, text
+            for match in _TOKEN_RE.finditer(normalized):
+                if match.start() > 0:
+                    yield 1, normalized[match.start():], text
+
+    def updated(self, removed: Iterable[dict], added: Iterable[dict]) -> "PrefixIndex":
+        """A new index without the keys of the ``removed`` documents and with those of ``added``.
+
+        The key arrays are copied and patched by binary search; this index is
+        left as is.
+        """
+        clone = PrefixIndex((), self.fields)
+        clone._groups = [(list(keys), list(entries)) for keys, entries in self._groups]
+        for doc in removed:
+            for group, key, _ in self._entries(doc):
+                keys, entries = clone._groups[group]
+                i = bisect.bisect_left(keys, key)
+                while i < len(keys) and keys[i] == key:
+                    if entries[i][0]["id"] == doc["id"]:
+                        del keys[i]
+                        del entries[i]
+                        break
+                    i += 1
+        for doc in added:
+            for group, key, text in self._entries(doc):
+                keys, entries = clone._groups[group]
+                # Same key: ordered by id, as in __init__
+                i = bisect.bisect_left(keys, key)
+                while i < len(keys) and keys[i] == key and entries[i][0]["id"] < doc["id"]:
+                    i += 1
+                keys.insert(i, key)
+                entries.insert(i, (doc, text))
+        return clone
+
+    def complete(self, prefix: str, limit: int = 8) -> List[dict]:
+        """Up to ``limit`` distinct products with a name or name word starting with ``prefix``."""
+        needle = " ".join(normalize_text(prefix).split())
+        if not needle or limit < 1:
+            return []
+        suggestions, seen = [], set()
+        for keys, entries in self._groups:
+            i = bisect.bisect_left(keys, needle)
+            while i < len(keys) and keys[i].startswith(needle) and len(suggestions) < limit:
+                doc, text = entries[i]
+                if doc["id"] not in seen:
+                    seen.add(doc["id"])
+                    suggestions.append({"id": doc["id"], "text": text, "name": doc.get("name"), "nameEn": doc.get("nameEn")})
+                i += 1
+        return suggestions
@@ -1,14 +1,22 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends, Query
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
+import asyncio
 import os
 import logging
+import multiprocessing
+import orjson
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, field_validator
 from typing import List, Optional, Dict
 import uuid
+import hmac
 from datetime import datetime, timezone, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
@@ -18,6 +26,24 @@ from emergentintegrations.payments.stripe.checkout import (
     CheckoutStatusResponse, 
     CheckoutSessionRequest
 )
+from cache import SingleFlight, TTLCache
+from catalog import Catalog
+from catalog_import import FORMATS as IMPORT_FORMATS, InvalidFeed, import_feed, iter_lines
+from catalog_sync import CatalogSync
+from columnar import ColumnarCatalog
+from db_indexes import REQUIRED_FOR_WRITES, ensure_indexes, ensure_indexes_with_retry, verify_query_plans
+from executors import BoundedExecutor, ExecutorSaturated
+from facets import facets_builder
+from http_cache import CachePolicy, PrecompressedBody, etag_matches, not_modified, request_etag
+from images import DiskCache, HTTPImageSource, ImageNotFound, ImageService, ImageSourceError, LocalImageSource
+from models import Product
+from pagination import InvalidCursor, clamp_page_size, fetch_page, parse_projection
+from payments import SETTLED_PAYMENT_STATUSES, PaymentsNotConfigured, PooledHTTPXClient, StripeClientRegistry, checkout_settled
+from product_search import InvalidMode, InvalidSort, build_listings, find_products, match_products, page, query_key, update_listings
+from search_index import PrefixIndex, RankedIndex, normalize_text
+from status_checks import InvalidWindow, as_utc, migrate_timestamps, rollup, window_query
+from webhooks import WebhookPipeline
+from write_buffer import BufferFull, WriteBehindBuffer
 
 
 ROOT_DIR = Path(__file__).parent
@@ -28,19 +54,135 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Set DB_INDEX_CHECK=1 to refuse to start if any handler query would COLLSCAN
+DB_INDEX_CHECK = os.environ.get('DB_INDEX_CHECK', '').lower() in ('1', 'true', 'yes')
+# Otherwise the unique indexes writes rely on are built before serving and the rest in the
+# background, retried while Mongo is unreachable
+DB_INDEX_RETRY_SECONDS = float(os.environ.get('DB_INDEX_RETRY_SECONDS', '30'))
+# Collections whose indexes failed to build; writes relying on REQUIRED_FOR_WRITES wait for
+# them (503) until they exist, and /api/health reports a failure
+index_state = {"ready": False, "failed": []}
+
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production-7777')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Authenticated user cache (keyed by user id, invalidated on writes to db.users)
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '60'))
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt runs on its own bounded pool so a login burst cannot block the event loop
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE', '64'))
+password_executor = BoundedExecutor(
+    "password-hash",
+    max_workers=PASSWORD_HASH_WORKERS,
+    max_queue=PASSWORD_HASH_QUEUE_SIZE
+)
+
+# Stripe: one pooled HTTP client per process, one checkout client per webhook URL
+stripe_clients = StripeClientRegistry(
+    api_key=os.environ.get('STRIPE_API_KEY'),
+    http_client=PooledHTTPXClient(
+        max_connections=int(os.environ.get('STRIPE_MAX_CONNECTIONS', '20')),
+        max_keepalive_connections=int(os.environ.get('STRIPE_MAX_KEEPALIVE_CONNECTIONS', '10')),
+        keepalive_expiry=float(os.environ.get('STRIPE_KEEPALIVE_EXPIRY_SECONDS', '30')),
+        timeout=float(os.environ.get('STRIPE_TIMEOUT_SECONDS', '30')),
+        connect_timeout=float(os.environ.get('STRIPE_CONNECT_TIMEOUT_SECONDS', '5'))
+    ),
+    api_base=os.environ.get('STRIPE_API_BASE')
+)
+
+# Product image derivatives: originals from IMAGE_SOURCE (http or a local directory),
+# resized on a process pool and cached in memory and on disk
+IMAGE_SOURCE = os.environ.get('IMAGE_SOURCE', 'http').lower()
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', str(min(4, os.cpu_count() or 1))))
+image_service = ImageService(
+    source=(
+        LocalImageSource(Path(os.environ.get('IMAGE_SOURCE_DIR', str(ROOT_DIR / 'images'))))
+        if IMAGE_SOURCE == 'local'
+        else HTTPImageSource(
+            max_connections=int(os.environ.get('IMAGE_MAX_CONNECTIONS', '10')),
+            timeout=float(os.environ.get('IMAGE_FETCH_TIMEOUT_SECONDS', '10'))
+        )
+    ),
+    # spawn: forking a process that already runs the event loop and Motor's threads is unsafe
+    executor=BoundedExecutor(
+        "image-resize",
+        max_workers=IMAGE_WORKERS,
+        max_queue=int(os.environ.get('IMAGE_QUEUE_SIZE', '32')),
+        executor=ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    ),
+    disk_cache=DiskCache(
+        Path(os.environ.get('IMAGE_CACHE_DIR', str(ROOT_DIR / 'image_cache'))),
+        max_bytes=int(os.environ.get('IMAGE_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+    ),
+    memory_bytes=int(os.environ.get('IMAGE_MEMORY_CACHE_BYTES', str(64 * 1024 * 1024))),
+    quality=int(os.environ.get('IMAGE_QUALITY', '75'))
+)
+IMAGE_DEFAULT_WIDTH = int(os.environ.get('IMAGE_DEFAULT_WIDTH', '640'))
+image_cache_policy = CachePolicy(max_age=int(os.environ.get('IMAGE_CACHE_MAX_AGE', '86400')))
+
+# Checkout status polling: concurrent polls share one Stripe call and
+# non-terminal results are reused for a short while
+CHECKOUT_STATUS_CACHE_TTL_SECONDS = float(os.environ.get('CHECKOUT_STATUS_CACHE_TTL_SECONDS', '2'))
+checkout_status_cache = TTLCache(maxsize=10000, ttl=CHECKOUT_STATUS_CACHE_TTL_SECONDS)
+checkout_status_flights = SingleFlight()
+
+# Pagination: default and maximum page sizes for list endpoints
+ORDERS_PAGE_SIZE = int(os.environ.get('ORDERS_PAGE_SIZE', '50'))
+ORDERS_PAGE_SIZE_MAX = int(os.environ.get('ORDERS_PAGE_SIZE_MAX', '100'))
+# Fields GET /api/orders?fields= may select
+ORDER_FIELDS = (
+    "id", "user_id", "session_id", "items", "shipping_address", "discount_code", "subtotal", "tax",
+    "shipping_cost", "total", "currency", "status", "payment_status", "created_at", "updated_at",
+)
+STATUS_PAGE_SIZE = int(os.environ.get('STATUS_PAGE_SIZE', '100'))
+STATUS_PAGE_SIZE_MAX = int(os.environ.get('STATUS_PAGE_SIZE_MAX', '1000'))
+STATUS_ROLLUP_MAX_BUCKETS = int(os.environ.get('STATUS_ROLLUP_MAX_BUCKETS', '1440'))
+SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', '50'))
+SEARCH_PAGE_SIZE_MAX = int(os.environ.get('SEARCH_PAGE_SIZE_MAX', '200'))
+# Filtered and ordered search results per (catalog version, normalized query, filters, sort);
+# a reload moves to new keys and the old entries age out. Besides the entry count the cache
+# is bounded by the products its match lists, score maps and result lists refer to in total
+search_cache = TTLCache(
+    maxsize=int(os.environ.get('SEARCH_CACHE_SIZE', '2048')),
+    max_weight=int(os.environ.get('SEARCH_CACHE_MAX_PRODUCTS', '1000000')),
+    weigh=lambda entry: sum(len(part or ()) for part in entry)
+)
+
+# Admin endpoints are disabled unless ADMIN_API_KEY is set; clients send it as X-Admin-Key
+ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY')
+CATALOG_IMPORT_BATCH_SIZE = int(os.environ.get('CATALOG_IMPORT_BATCH_SIZE', '1000'))
+# Longest feed line (or multi-line CSV record) before an import fails
+CATALOG_IMPORT_MAX_LINE_BYTES = int(os.environ.get('CATALOG_IMPORT_MAX_LINE_BYTES', str(1024 * 1024)))
+
+PRODUCT_BATCH_MAX_IDS = int(os.environ.get('PRODUCT_BATCH_MAX_IDS', '200'))
+SUGGEST_LIMIT = int(os.environ.get('SUGGEST_LIMIT', '8'))
+SUGGEST_LIMIT_MAX = int(os.environ.get('SUGGEST_LIMIT_MAX', '20'))
+
+# Autocomplete results per (catalog version, prefix, limit); a reload moves to new keys
+suggest_cache = TTLCache(
+    maxsize=int(os.environ.get('SUGGEST_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('SUGGEST_CACHE_TTL_SECONDS', '300'))
+)
+
+# HTTP caching for catalog endpoints (ETags follow the catalog content hash)
+catalog_cache_policy = CachePolicy(
+    max_age=int(os.environ.get('CATALOG_CACHE_MAX_AGE', '60')),
+    stale_while_revalidate=int(os.environ.get('CATALOG_CACHE_STALE_WHILE_REVALIDATE', '300'))
+)
+
 # Security
 security = HTTPBearer(auto_error=False)
 
-# Create the main app
-app = FastAPI()
+# Create the main app; dict/list results are encoded with orjson
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create router with /api prefix
 api_router = APIRouter(prefix="/api")
@@ -54,6 +196,12 @@ class StatusCheck(BaseModel):
     client_name: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+    @field_validator("timestamp")
+    @classmethod
+    def timestamp_utc(cls, value: datetime) -> datetime:
+        # Stored as a BSON date, which comes back from Mongo without a timezone
+        return as_utc(value)
+
 class StatusCheckCreate(BaseModel):
     client_name: str
 
@@ -150,6 +298,9 @@ class WishlistItem(BaseModel):
     price: float
     image: str
 
+class WishlistSync(BaseModel):
+    items: List[WishlistItem] = Field(default_factory=list, max_length=500)
+
 # Search Model
 class SearchQuery(BaseModel):
     query: str
@@ -157,24 +308,28 @@ class SearchQuery(BaseModel):
     min_price: Optional[float] = None
     max_price: Optional[float] = None
 
-# Product Model (for search results)
-class Product(BaseModel):
-    id: int
-    name: str
-    nameEn: str
-    category: str
-    price: float
-    image: str
-    isNew: bool = False
+class ProductBatchRequest(BaseModel):
+    ids: List[int] = Field(max_length=PRODUCT_BATCH_MAX_IDS)
+    fields: Optional[List[str]] = None
 
 
 # ===================== AUTH HELPERS =====================
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def run_password_hasher(func, *args):
+    try:
+        return await password_executor.run(func, *args)
+    except ExecutorSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many authentication requests, please retry",
+            headers={"Retry-After": "1"}
+        )
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await run_password_hasher(pwd_context.verify, plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await run_password_hasher(pwd_context.hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -191,8 +346,13 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         user_id: str = payload.get("sub")
         if user_id is None:
             return None
-        user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
-        return user
+        user = user_cache.get(user_id)
+        if user is None:
+            user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+            if user is None:
+                return None
+            user_cache.set(user_id, user)
+        return dict(user)
     except JWTError:
         return None
 
@@ -202,6 +362,135 @@ async def require_auth(credentials: HTTPAuthorizationCredentials = Depends(secur
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
+async def require_admin(request: Request) -> None:
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if not hmac.compare_digest(request.headers.get("x-admin-key", ""), ADMIN_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid admin key")
+
+async def require_unique_indexes() -> None:
+    # Duplicate webhook and concurrent wishlist/registration handling depend on unique indexes
+    if any(collection in REQUIRED_FOR_WRITES for collection in index_state["failed"]):
+        raise HTTPException(status_code=503, detail="Database indexes are missing")
+    if not index_state["ready"]:
+        raise HTTPException(status_code=503, detail="Database is not ready, please retry", headers={"Retry-After": "5"})
+
+
+# ===================== PAYMENT HELPERS =====================
+
+def get_stripe_checkout(request: Request) -> StripeCheckout:
+    webhook_url = f"{str(request.base_url).rstrip('/')}/api/webhook/stripe"
+    try:
+        return stripe_clients.get(webhook_url)
+    except PaymentsNotConfigured as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def fetch_checkout_status(stripe_checkout: StripeCheckout, session_id: str) -> dict:
+    transaction = await db.payment_transactions.find_one(
+        {"session_id": session_id},
+        {"_id": 0, "stripe_status": 1, "status": 1, "payment_status": 1, "amount": 1, "currency": 1}
+    )
+    stored = transaction.get("stripe_status") if transaction else None
+    
+    # Sessions already settled are answered from Mongo without calling Stripe
+    if checkout_settled(stored):
+        return stored
+    # A checkout.session.completed webhook may have settled it before any poll stored Stripe's answer
+    if transaction and transaction.get("status") == "completed" and transaction.get("payment_status") in SETTLED_PAYMENT_STATUSES:
+        stored = stored or {}
+        return {
+            "status": "complete",
+            "payment_status": transaction["payment_status"],
+            "amount_total": stored.get("amount_total", round(transaction["amount"] * 100)),
+            "currency": stored.get("currency", transaction["currency"]),
+            "metadata": stored.get("metadata", {})
+        }
+    
+    checkout_status: CheckoutStatusResponse = await stripe_checkout.get_checkout_status(session_id)
+    result = {
+        "status": checkout_status.status,
+        "payment_status": checkout_status.payment_status,
+        "amount_total": checkout_status.amount_total,
+        "currency": checkout_status.currency,
+        "metadata": checkout_status.metadata
+    }
+    
+    # Only write when Stripe reports something new
+    if result != stored:
+        update_data = {
+            "status": checkout_status.status,
+            "payment_status": checkout_status.payment_status,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        
+        # A settling webhook applied while Stripe was being polled has the final word
+        not_completed = {
+            "session_id": session_id,
+            "$nor": [{"status": "completed", "payment_status": {"$in": list(SETTLED_PAYMENT_STATUSES)}}]
+        }
+        await db.payment_transactions.update_one(
+            not_completed,
+            {"$set": {**update_data, "stripe_status": result}}
+        )
+        
+        await db.orders.update_one(
+            not_completed,
+            {"$set": update_data}
+        )
+    
+    if not checkout_settled(result):
+        checkout_status_cache.set(session_id, result)
+    return result
+
+async def apply_stripe_events(events: List[dict]):
+    now = datetime.now(timezone.utc).isoformat()
+    operations = []
+    for event in events:
+        if event["event_type"] != "checkout.session.completed":
+            continue
+        operations.append(UpdateOne(
+            {"session_id": event["session_id"]},
+            {"$set": {
+                "status": "completed",
+                "payment_status": event["payment_status"],
+                "updated_at": now
+            }}
+        ))
+        checkout_status_cache.invalidate(event["session_id"])
+    
+    if not operations:
+        return
+    await db.payment_transactions.bulk_write(operations, ordered=False)
+    await db.orders.bulk_write(operations, ordered=False)
+
+# Verified Stripe events are journaled and acknowledged, then applied in batches
+webhook_pipeline = WebhookPipeline(
+    db.webhook_events,
+    apply_stripe_events,
+    batch_size=int(os.environ.get('WEBHOOK_BATCH_SIZE', '100')),
+    max_queue=int(os.environ.get('WEBHOOK_QUEUE_SIZE', '10000'))
+)
+
+
+# Status checks are written directly by default; STATUS_WRITE_MODE=buffered acknowledges
+# them immediately and writes them in batches (unflushed checks are lost on a crash and
+# reads can lag writes by up to STATUS_FLUSH_INTERVAL_SECONDS)
+STATUS_WRITE_BEHIND = os.environ.get('STATUS_WRITE_MODE', 'direct').lower() == 'buffered'
+status_writer = WriteBehindBuffer(
+    db.status_checks,
+    batch_size=int(os.environ.get('STATUS_BATCH_SIZE', '500')),
+    flush_interval=float(os.environ.get('STATUS_FLUSH_INTERVAL_SECONDS', '0.1')),
+    max_buffer=int(os.environ.get('STATUS_BUFFER_SIZE', '10000'))
+)
+
+# ===================== RESPONSE HELPERS =====================
+
+def model_response(model: BaseModel) -> Response:
+    # The model was validated when it was built; returning a Response skips
+    # FastAPI's dump-and-revalidate against response_model and encodes in pydantic-core.
+    # response_model stays on the route for the OpenAPI schema.
+    return Response(content=model.model_dump_json(), media_type="application/json")
+
 
 # ===================== MOCK PRODUCTS DATA =====================
 
@@ -220,6 +509,100 @@ PRODUCTS = [
     {"id": 12, "name": "جاكيت جلدي فاخر", "nameEn": "Luxury Leather Jacket", "category": "jackets", "price": 1499, "image": "https://images.unsplash.com/photo-1686491730848-0c86413833e5", "isNew": True},
 ]
 
+CATEGORIES = [
+    {"id": "bags", "name": "الحقائب", "nameEn": "Bags"},
+    {"id": "jackets", "name": "الجاكيتات", "nameEn": "Jackets"},
+    {"id": "shirts", "name": "القمصان", "nameEn": "Shirts"},
+    {"id": "pants", "name": "البناطيل", "nameEn": "Pants"},
+]
+
+# Id/category maps and the name search index; catalog.load()/update() swap in a new snapshot
+catalog = Catalog(PRODUCTS, CATEGORIES)
+
+# The products collection is the source of truth (CATALOG_SOURCE=mongo): it is seeded
+# with PRODUCTS when empty and followed in the background. PRODUCTS is served until
+# the first load completes, or for good with CATALOG_SOURCE=static.
+CATALOG_SOURCE = os.environ.get('CATALOG_SOURCE', 'mongo').lower()
+catalog_sync = CatalogSync(
+    db.products,
+    catalog,
+    seed=PRODUCTS,
+    use_change_streams=os.environ.get('CATALOG_CHANGE_STREAMS', 'true').lower() in ('1', 'true', 'yes'),
+    poll_interval=float(os.environ.get('CATALOG_POLL_INTERVAL_SECONDS', '5')),
+    full_reload_interval=float(os.environ.get('CATALOG_FULL_RELOAD_SECONDS', '600'))
+)
+
+def render_json(content) -> PrecompressedBody:
+    # Same encoding as the app's default ORJSONResponse, so cached and dynamic bodies match
+    return PrecompressedBody(orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY))
+
+def render_catalog_bodies(snapshot) -> Dict[str, PrecompressedBody]:
+    bodies = {
+        "products": render_json({"products": snapshot.products}),
+        "categories": render_json({"categories": snapshot.categories}),
+    }
+    for category, products in snapshot.by_category.items():
+        bodies[f"products:{category}"] = render_json({"products": products})
+    return bodies
+
+def update_catalog_bodies(previous, snapshot, change) -> Dict[str, PrecompressedBody]:
+    # Re-render the full listing and only the categories the change touched
+    bodies = dict(previous)
+    if change.upserted or change.removed:
+        bodies["products"] = render_json({"products": snapshot.products})
+    if change.categories_changed:
+        bodies["categories"] = render_json({"categories": snapshot.categories})
+    for category in change.categories():
+        if category in snapshot.by_category:
+            bodies[f"products:{category}"] = render_json({"products": snapshot.by_category[category]})
+        else:
+            bodies.pop(f"products:{category}", None)
+    return bodies
+
+# Anonymous catalog listings are served as pre-encoded, pre-compressed bytes
+catalog.add_derived("bodies", render_catalog_bodies, update=update_catalog_bodies)
+
+# Unfiltered search listings in every sort order
+catalog.add_derived("listings", build_listings, update=update_listings)
+
+# Price/category/flag columns for text-free searches filtered by price or isNew; rows come
+# from the snapshot's products. Updates patch the columns, which keep the snapshot's id order
+catalog.add_derived(
+    "columns",
+    lambda snapshot: ColumnarCatalog(snapshot.products, text_fields=()),
+    update=lambda previous, snapshot, change: previous.updated(change.after, [p["id"] for p in change.removed]),
+    depends_on=("price", "category", "isNew")
+)
+
+# BM25 term statistics and the fuzzy-match vocabulary for /products/search?mode=ranked
+def build_ranked_index(snapshot) -> RankedIndex:
+    return RankedIndex(
+        snapshot.products,
+        fuzzy_threshold=float(os.environ.get('SEARCH_FUZZY_THRESHOLD', '0.3')),
+        new_boost=float(os.environ.get('SEARCH_NEW_BOOST', '0.1'))
+    )
+
+def update_ranked_index(previous, snapshot, change) -> RankedIndex:
+    return previous.updated(change.after, [p["id"] for p in change.removed], snapshot.positions)
+
+catalog.add_derived("ranking", build_ranked_index, update=update_ranked_index, depends_on=("name", "nameEn", "isNew"))
+
+# Name and word-start completions for /products/suggest
+catalog.add_derived(
+    "suggest",
+    lambda snapshot: PrefixIndex(snapshot.products),
+    update=lambda previous, snapshot, change: previous.updated(change.before, change.after),
+    depends_on=("name", "nameEn")
+)
+
+# Category counts and price histogram structures for /products/search?facets=true; cheap to
+# rebuild from the price indexes, so only price and category changes do
+catalog.add_derived(
+    "facets",
+    facets_builder(int(os.environ.get('SEARCH_PRICE_HISTOGRAM_BUCKETS', '5'))),
+    depends_on=("price", "category")
+)
+
 
 # ===================== ROUTES =====================
 
@@ -228,27 +611,91 @@ PRODUCTS = [
 async def root():
     return {"message": "Hello World"}
 
+@api_router.get("/metrics")
+async def get_metrics():
+    return {
+        "user_cache": user_cache.stats(),
+        "password_hashing": password_executor.stats(),
+        "checkout_status": {
+            "cache": checkout_status_cache.stats(),
+            "upstream": checkout_status_flights.stats(),
+        },
+        "webhooks": webhook_pipeline.stats(),
+        "indexes": index_state,
+        "catalog": catalog_sync.stats(),
+        "search_cache": search_cache.stats(),
+        "suggest_cache": suggest_cache.stats(),
+        "images": image_service.stats(),
+        "status_writes": {"mode": "buffered" if STATUS_WRITE_BEHIND else "direct", **status_writer.stats()},
+    }
+
+@api_router.get("/health")
+async def health():
+    required_failed = [c for c in index_state["failed"] if c in REQUIRED_FOR_WRITES]
+    status = "failed" if required_failed else "ok" if index_state["ready"] else "starting"
+    body = {"status": status, "indexes": {"ready": index_state["ready"], "failed": index_state["failed"]}}
+    return ORJSONResponse(body, status_code=200 if status == "ok" else 503)
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.model_dump()
     status_obj = StatusCheck(**status_dict)
     doc = status_obj.model_dump()
-    doc['timestamp'] = doc['timestamp'].isoformat()
-    await db.status_checks.insert_one(doc)
-    return status_obj
+    if STATUS_WRITE_BEHIND:
+        try:
+            status_writer.submit(doc)
+        except BufferFull:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many status checks, please retry",
+                headers={"Retry-After": "1"}
+            )
+    else:
+        await db.status_checks.insert_one(doc)
+    return model_response(status_obj)
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find({}, {"_id": 0}).to_list(1000)
-    for check in status_checks:
-        if isinstance(check['timestamp'], str):
-            check['timestamp'] = datetime.fromisoformat(check['timestamp'])
+async def get_status_checks(
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    client_name: Optional[str] = None
+):
+    # The body stays a plain list; the next page token goes in X-Next-Cursor
+    try:
+        status_checks, next_cursor = await fetch_page(
+            db.status_checks,
+            window_query(start, end, client_name),
+            [("timestamp", 1), ("id", 1)],
+            clamp_page_size(limit, STATUS_PAGE_SIZE, STATUS_PAGE_SIZE_MAX),
+            cursor
+        )
+    except (InvalidCursor, InvalidWindow) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return status_checks
 
+@api_router.get("/status/rollup")
+async def get_status_rollup(
+    bucket: str = "minute",
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    client_name: Optional[str] = None
+):
+    # One row per minute or hour in [from, to), empty buckets included; the
+    # window defaults to the last hour (minute buckets) or day (hour buckets)
+    try:
+        return await rollup(db.status_checks, bucket, start, end, client_name, max_buckets=STATUS_ROLLUP_MAX_BUCKETS)
+    except InvalidWindow as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
 # ===================== AUTH ROUTES =====================
 
-@api_router.post("/auth/register", response_model=TokenResponse)
+@api_router.post("/auth/register", response_model=TokenResponse, dependencies=[Depends(require_unique_indexes)])
 async def register(user_data: UserRegister):
     # Check if user exists
     existing = await db.users.find_one({"email": user_data.email.lower()})
@@ -262,7 +709,7 @@ async def register(user_data: UserRegister):
     user_doc = {
         "id": user_id,
         "email": user_data.email.lower(),
-        "password": get_password_hash(user_data.password),
+        "password": await get_password_hash(user_data.password),
         "name": user_data.name,
         "phone": user_data.phone,
         "created_at": now,
@@ -274,7 +721,7 @@ async def register(user_data: UserRegister):
     # Create token
     access_token = create_access_token(data={"sub": user_id})
     
-    return TokenResponse(
+    return model_response(TokenResponse(
         access_token=access_token,
         user=UserResponse(
             id=user_id,
@@ -283,17 +730,17 @@ async def register(user_data: UserRegister):
             phone=user_doc["phone"],
             created_at=now
         )
-    )
+    ))
 
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email.lower()})
-    if not user or not verify_password(credentials.password, user["password"]):
+    if not user or not await verify_password(credentials.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     access_token = create_access_token(data={"sub": user["id"]})
     
-    return TokenResponse(
+    return model_response(TokenResponse(
         access_token=access_token,
         user=UserResponse(
             id=user["id"],
@@ -302,17 +749,17 @@ async def login(credentials: UserLogin):
             phone=user.get("phone"),
             created_at=user["created_at"]
         )
-    )
+    ))
 
 @api_router.get("/auth/me", response_model=UserResponse)
 async def get_me(user: dict = Depends(require_auth)):
-    return UserResponse(
+    return model_response(UserResponse(
         id=user["id"],
         email=user["email"],
         name=user["name"],
         phone=user.get("phone"),
         created_at=user["created_at"]
-    )
+    ))
 
 @api_router.put("/auth/profile")
 async def update_profile(
@@ -327,6 +774,7 @@ async def update_profile(
         update_data["phone"] = phone
     
     await db.users.update_one({"id": user["id"]}, {"$set": update_data})
+    user_cache.invalidate(user["id"])
     return {"message": "Profile updated successfully"}
 
 
@@ -334,56 +782,156 @@ async def update_profile(
 
 @api_router.get("/products/search")
 async def search_products(
+    request: Request,
+    response: Response,
     q: str = "",
     category: Optional[str] = None,
     min_price: Optional[float] = None,
-    max_price: Optional[float] = None
+    max_price: Optional[float] = None,
+    is_new: Optional[bool] = None,
+    sort: str = "relevance",
+    limit: Optional[int] = None,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    mode: str = "substring",
+    facets: bool = False
 ):
-    results = []
-    query_lower = q.lower()
+    snapshot = catalog.snapshot
+    cached = not_modified(request, response, request_etag(snapshot.content_hash, request), catalog_cache_policy)
+    if cached:
+        return cached
     
-    for product in PRODUCTS:
-        # Text search (name in Arabic or English)
-        if query_lower and query_lower not in product["name"].lower() and query_lower not in product["nameEn"].lower():
-            continue
-        
-        # Category filter
-        if category and product["category"] != category:
-            continue
-        
-        # Price filters
-        if min_price and product["price"] < min_price:
-            continue
-        if max_price and product["price"] > max_price:
-            continue
-        
-        results.append(product)
+    # Text search (name in Arabic or English) resolved through the n-gram index,
+    # or scored with BM25 and fuzzy term matching in ranked mode; category and
+    # price filters are applied on top, or resolved from the category and price
+    # indexes when there is no text
+    try:
+        key = (snapshot.version, mode, query_key(q, mode), category or None, min_price, max_price, is_new, sort)
+        entry = search_cache.get(key)
+        response.headers["X-Search-Cache"] = "miss" if entry is None else "hit"
+        if entry is None:
+            matches, scores = match_products(snapshot, q, mode)
+            entry = (matches, scores, find_products(snapshot, matches, category, min_price, max_price, sort, is_new))
+            search_cache.set(key, entry)
+        matches, scores, results = entry
+        products, next_cursor = page(
+            snapshot,
+            results,
+            sort,
+            clamp_page_size(limit, SEARCH_PAGE_SIZE, SEARCH_PAGE_SIZE_MAX),
+            offset,
+            cursor,
+            scores
+        )
+    except (InvalidMode, InvalidSort, InvalidCursor) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    result = {"products": products, "total": len(results), "next_cursor": next_cursor}
+    if facets:
+        result["facets"] = snapshot.derived["facets"].compute(snapshot, matches, category, min_price, max_price, is_new)
+    return result
+
+@api_router.get("/products/suggest")
+async def suggest_products(prefix: str = "", limit: Optional[int] = None):
+    snapshot = catalog.snapshot
+    limit = clamp_page_size(limit, SUGGEST_LIMIT, SUGGEST_LIMIT_MAX)
+    key = (snapshot.version, " ".join(normalize_text(prefix).split()), limit)
+    suggestions = suggest_cache.get(key)
+    if suggestions is None:
+        suggestions = snapshot.derived["suggest"].complete(prefix, limit)
+        suggest_cache.set(key, suggestions)
+    return {"prefix": prefix, "suggestions": suggestions}
+
+def resolve_product_batch(snapshot, ids: List[int], fields: Optional[str]) -> dict:
+    # Requested order, first occurrence of each id; fields=id,name,price trims each product
+    projection = [field for field in parse_projection(fields, required=["id"]) if field != "_id"]
+    products, missing = [], []
+    for product_id in dict.fromkeys(ids):
+        product = snapshot.get(product_id)
+        if product is None:
+            missing.append(product_id)
+        elif projection:
+            products.append({field: product[field] for field in projection if field in product})
+        else:
+            products.append(product)
+    return {"products": products, "missing": missing}
+
+@api_router.get("/products/batch")
+async def get_products_batch(request: Request, response: Response, ids: str = "", fields: Optional[str] = None):
+    try:
+        product_ids = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if len(product_ids) > PRODUCT_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {PRODUCT_BATCH_MAX_IDS} ids per request")
+    
+    snapshot = catalog.snapshot
+    cached = not_modified(request, response, request_etag(snapshot.content_hash, request), catalog_cache_policy)
+    if cached:
+        return cached
+    return resolve_product_batch(snapshot, product_ids, fields)
+
+@api_router.post("/products/batch")
+async def post_products_batch(batch: ProductBatchRequest):
+    # Same as GET, for id lists too long for a URL
+    return resolve_product_batch(catalog.snapshot, batch.ids, ",".join(batch.fields or []))
+
+@api_router.get("/images/{product_id}")
+async def get_product_image(request: Request, product_id: int, w: Optional[int] = None, fmt: str = "webp"):
+    product = catalog.snapshot.get(product_id)
+    if product is None or not product.get("image"):
+        raise HTTPException(status_code=404, detail="Product not found")
+    if fmt not in image_service.formats:
+        raise HTTPException(status_code=400, detail=f"Invalid format, expected one of: {', '.join(image_service.formats)}")
+    if w is not None and w < 1:
+        raise HTTPException(status_code=400, detail="Width must be positive")
+    
+    try:
+        derivative = await image_service.get(product["image"], w or IMAGE_DEFAULT_WIDTH, fmt)
+    except ImageNotFound:
+        raise HTTPException(status_code=404, detail="Image not found")
+    except ImageSourceError as e:
+        logging.error(f"Image for product {product_id} unavailable: {str(e)}")
+        raise HTTPException(status_code=502, detail="Image source unavailable")
+    except ExecutorSaturated:
+        raise HTTPException(status_code=503, detail="Too many image requests, please retry", headers={"Retry-After": "1"})
     
-    return {"products": results, "total": len(results)}
+    headers = image_cache_policy.headers(f'"{derivative.key[:32]}"')
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=derivative.data, media_type=derivative.media_type, headers=headers)
 
 @api_router.get("/products/{product_id}")
-async def get_product(product_id: int):
-    for product in PRODUCTS:
-        if product["id"] == product_id:
-            return product
-    raise HTTPException(status_code=404, detail="Product not found")
+async def get_product(request: Request, response: Response, product_id: int):
+    snapshot = catalog.snapshot
+    product = snapshot.get(product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    cached = not_modified(request, response, request_etag(snapshot.content_hash, request), catalog_cache_policy)
+    if cached:
+        return cached
+    return product
 
 @api_router.get("/products")
-async def get_all_products(category: Optional[str] = None):
-    if category:
-        return {"products": [p for p in PRODUCTS if p["category"] == category]}
-    return {"products": PRODUCTS}
+async def get_all_products(request: Request, response: Response, category: Optional[str] = None):
+    snapshot = catalog.snapshot
+    body = snapshot.derived["bodies"].get(f"products:{category}" if category else "products")
+    if body is not None:
+        return body.response(request, request_etag(snapshot.content_hash, request), catalog_cache_policy)
+    
+    cached = not_modified(request, response, request_etag(snapshot.content_hash, request), catalog_cache_policy)
+    if cached:
+        return cached
+    return {"products": snapshot.in_category(category)}
 
 @api_router.get("/categories")
-async def get_categories():
-    return {
-        "categories": [
-            {"id": "bags", "name": "الحقائب", "nameEn": "Bags"},
-            {"id": "jackets", "name": "الجاكيتات", "nameEn": "Jackets"},
-            {"id": "shirts", "name": "القمصان", "nameEn": "Shirts"},
-            {"id": "pants", "name": "البناطيل", "nameEn": "Pants"},
-        ]
-    }
+async def get_categories(request: Request):
+    snapshot = catalog.snapshot
+    return snapshot.derived["bodies"]["categories"].response(
+        request,
+        request_etag(snapshot.content_hash, request),
+        catalog_cache_policy
+    )
 
 
 # ===================== WISHLIST ROUTES =====================
@@ -395,30 +943,73 @@ async def get_wishlist(user: dict = Depends(require_auth)):
         return {"items": []}
     return {"items": wishlist.get("items", [])}
 
-@api_router.post("/wishlist/add")
+def wishlist_contains(product_id: int) -> dict:
+    return {"$in": [product_id, {"$ifNull": ["$items.product_id", []]}]}
+
+async def update_wishlist(user_id: str, pipeline: List[dict], projection: Optional[dict] = None) -> dict:
+    # Pipeline updates decide on the server whether a product is already listed,
+    # so every mutation is one atomic round trip. A racing first write for the
+    # same user hits the unique user_id index; the retry then updates that document.
+    kwargs = {
+        "projection": projection or {"_id": 0},
+        "upsert": True,
+        "return_document": ReturnDocument.AFTER
+    }
+    try:
+        return await db.wishlists.find_one_and_update({"user_id": user_id}, pipeline, **kwargs)
+    except DuplicateKeyError:
+        return await db.wishlists.find_one_and_update({"user_id": user_id}, pipeline, **kwargs)
+
+@api_router.post("/wishlist/add", dependencies=[Depends(require_unique_indexes)])
 async def add_to_wishlist(item: WishlistItem, user: dict = Depends(require_auth)):
-    wishlist = await db.wishlists.find_one({"user_id": user["id"]})
-    
-    if not wishlist:
-        await db.wishlists.insert_one({
-            "user_id": user["id"],
-            "items": [item.model_dump()],
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        })
-    else:
-        # Check if item already exists
-        existing = [i for i in wishlist.get("items", []) if i["product_id"] == item.product_id]
-        if not existing:
-            await db.wishlists.update_one(
-                {"user_id": user["id"]},
-                {
-                    "$push": {"items": item.model_dump()},
-                    "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-                }
-            )
+    await update_wishlist(user["id"], [{"$set": {
+        "items": {"$cond": [
+            wishlist_contains(item.product_id),
+            "$items",
+            {"$concatArrays": [{"$ifNull": ["$items", []]}, {"$literal": [item.model_dump()]}]}
+        ]},
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }}], projection={"_id": 1})
     
     return {"message": "Added to wishlist"}
 
+@api_router.post("/wishlist/toggle", dependencies=[Depends(require_unique_indexes)])
+async def toggle_wishlist(item: WishlistItem, user: dict = Depends(require_auth)):
+    wishlist = await update_wishlist(user["id"], [{"$set": {
+        "items": {"$cond": [
+            wishlist_contains(item.product_id),
+            {"$filter": {"input": "$items", "cond": {"$ne": ["$$this.product_id", item.product_id]}}},
+            {"$concatArrays": [{"$ifNull": ["$items", []]}, {"$literal": [item.model_dump()]}]}
+        ]},
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }}], projection={"_id": 0, "items.product_id": 1})
+    
+    in_wishlist = any(i["product_id"] == item.product_id for i in wishlist.get("items", []))
+    return {
+        "in_wishlist": in_wishlist,
+        "message": "Added to wishlist" if in_wishlist else "Removed from wishlist"
+    }
+
+@api_router.post("/wishlist/sync", dependencies=[Depends(require_unique_indexes)])
+async def sync_wishlist(payload: WishlistSync, user: dict = Depends(require_auth)):
+    # Merge a client-side wishlist: products not yet listed are appended in order
+    incoming = {}
+    for item in payload.items:
+        incoming.setdefault(item.product_id, item.model_dump())
+    
+    wishlist = await update_wishlist(user["id"], [{"$set": {
+        "items": {"$concatArrays": [
+            {"$ifNull": ["$items", []]},
+            {"$filter": {
+                "input": {"$literal": list(incoming.values())},
+                "cond": {"$not": [{"$in": ["$$this.product_id", {"$ifNull": ["$items.product_id", []]}]}]}
+            }}
+        ]},
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }}])
+    
+    return {"items": wishlist.get("items", [])}
+
 @api_router.delete("/wishlist/{product_id}")
 async def remove_from_wishlist(product_id: int, user: dict = Depends(require_auth)):
     await db.wishlists.update_one(
@@ -458,7 +1049,7 @@ async def add_address(address: AddressCreate, user: dict = Depends(require_auth)
     
     await db.addresses.insert_one(address_doc)
     
-    return AddressResponse(id=address_id, **address.model_dump())
+    return model_response(AddressResponse(id=address_id, **address.model_dump()))
 
 @api_router.delete("/addresses/{address_id}")
 async def delete_address(address_id: str, user: dict = Depends(require_auth)):
@@ -471,12 +1062,26 @@ async def delete_address(address_id: str, user: dict = Depends(require_auth)):
 # ===================== ORDER HISTORY ROUTES =====================
 
 @api_router.get("/orders")
-async def get_orders(user: dict = Depends(require_auth)):
-    orders = await db.orders.find(
-        {"user_id": user["id"]}, 
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    return {"orders": orders}
+async def get_orders(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user: dict = Depends(require_auth)
+):
+    # fields=id,status,total,created_at limits the payload for list views
+    sort = [("created_at", -1), ("id", -1)]
+    try:
+        orders, next_cursor = await fetch_page(
+            db.orders,
+            {"user_id": user["id"]},
+            sort,
+            clamp_page_size(limit, ORDERS_PAGE_SIZE, ORDERS_PAGE_SIZE_MAX),
+            cursor,
+            parse_projection(fields, required=[field for field, _ in sort], allowed=ORDER_FIELDS)
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"orders": orders, "next_cursor": next_cursor}
 
 @api_router.get("/orders/{order_id}")
 async def get_order(order_id: str, user: dict = Depends(require_auth)):
@@ -489,6 +1094,88 @@ async def get_order(order_id: str, user: dict = Depends(require_auth)):
     return order
 
 
+# ===================== ADMIN ROUTES =====================
+
+@api_router.post("/admin/catalog/import")
+async def import_catalog_feed(
+    request: Request,
+    format: str = "jsonl",
+    batch_size: Optional[int] = None,
+    job_id: Optional[str] = None,
+    _: None = Depends(require_admin)
+):
+    # The request body (CSV or JSON Lines) is streamed into batched upserts on the products
+    # collection; the catalog sync publishes the result. Posting the same feed again with
+    # the returned job_id resumes after the last written batch.
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format, expected one of: {', '.join(IMPORT_FORMATS)}")
+    
+    start_line = 0
+    if job_id:
+        job = await db.catalog_imports.find_one({"id": job_id}, {"_id": 0})
+        if not job:
+            raise HTTPException(status_code=404, detail="Import job not found")
+        # Checkpoints count lines of the original feed; another format would skip the wrong rows
+        if job["format"] != format:
+            raise HTTPException(status_code=400, detail=f"Import job {job_id} is a {job['format']} import, not {format}")
+        if job["status"] == "completed":
+            return job
+        start_line = job["checkpoint_line"]
+    else:
+        job_id = str(uuid.uuid4())
+        await db.catalog_imports.insert_one({
+            "id": job_id,
+            "format": format,
+            "status": "running",
+            "checkpoint_line": 0,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        })
+    
+    async def save_progress(progress, status="running"):
+        await db.catalog_imports.update_one({"id": job_id}, {"$set": {
+            "status": status,
+            "checkpoint_line": progress.checkpoint_line,
+            "progress": progress.as_dict(),
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }})
+    
+    progress = None
+    async def on_batch(batch_progress):
+        nonlocal progress
+        progress = batch_progress
+        await save_progress(batch_progress)
+    
+    try:
+        progress = await import_feed(
+            iter_lines(request.stream(), CATALOG_IMPORT_MAX_LINE_BYTES),
+            format,
+            db.products,
+            Product,
+            batch_size=clamp_page_size(batch_size, CATALOG_IMPORT_BATCH_SIZE, 10000),
+            start_line=start_line,
+            on_batch=on_batch,
+            max_line_length=CATALOG_IMPORT_MAX_LINE_BYTES
+        )
+    except InvalidFeed as e:
+        await db.catalog_imports.update_one({"id": job_id}, {"$set": {"status": "failed", "error": str(e)}})
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        # Disconnects and write errors leave the job resumable from its last checkpoint
+        logging.error(f"Catalog import {job_id} interrupted: {str(e)}")
+        await db.catalog_imports.update_one({"id": job_id}, {"$set": {"status": "interrupted", "error": str(e)}})
+        raise
+    
+    await save_progress(progress, status="completed")
+    return {"id": job_id, "status": "completed", "checkpoint_line": progress.checkpoint_line, "progress": progress.as_dict()}
+
+@api_router.get("/admin/catalog/import/{job_id}")
+async def get_catalog_import(job_id: str, _: None = Depends(require_admin)):
+    job = await db.catalog_imports.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
 # ===================== CHECKOUT ROUTES =====================
 
 @api_router.post("/checkout/create-session")
@@ -498,14 +1185,7 @@ async def create_checkout_session(
     user: Optional[dict] = Depends(get_current_user)
 ):
     try:
-        stripe_api_key = os.environ.get('STRIPE_API_KEY')
-        if not stripe_api_key:
-            raise HTTPException(status_code=500, detail="Stripe API key not configured")
-        
-        host_url = str(request.base_url).rstrip('/')
-        webhook_url = f"{host_url}/api/webhook/stripe"
-        
-        stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+        stripe_checkout = get_stripe_checkout(request)
         
         total_amount = sum(item.price * item.quantity for item in checkout_req.items)
         
@@ -583,82 +1263,39 @@ async def create_checkout_session(
 @api_router.get("/checkout/status/{session_id}")
 async def get_checkout_status(request: Request, session_id: str):
     try:
-        stripe_api_key = os.environ.get('STRIPE_API_KEY')
-        if not stripe_api_key:
-            raise HTTPException(status_code=500, detail="Stripe API key not configured")
-        
-        host_url = str(request.base_url).rstrip('/')
-        webhook_url = f"{host_url}/api/webhook/stripe"
+        cached = checkout_status_cache.get(session_id)
+        if cached is not None:
+            return cached
         
-        stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
-        
-        checkout_status: CheckoutStatusResponse = await stripe_checkout.get_checkout_status(session_id)
-        
-        # Update transaction and order status
-        update_data = {
-            "status": checkout_status.status,
-            "payment_status": checkout_status.payment_status,
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        await db.payment_transactions.update_one(
-            {"session_id": session_id},
-            {"$set": update_data}
-        )
-        
-        await db.orders.update_one(
-            {"session_id": session_id},
-            {"$set": update_data}
+        stripe_checkout = get_stripe_checkout(request)
+        return await checkout_status_flights.do(
+            session_id,
+            lambda: fetch_checkout_status(stripe_checkout, session_id)
         )
         
-        return {
-            "status": checkout_status.status,
-            "payment_status": checkout_status.payment_status,
-            "amount_total": checkout_status.amount_total,
-            "currency": checkout_status.currency,
-            "metadata": checkout_status.metadata
-        }
-        
     except Exception as e:
         logging.error(f"Error getting checkout status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@api_router.post("/webhook/stripe")
+@api_router.post("/webhook/stripe", dependencies=[Depends(require_unique_indexes)])
 async def stripe_webhook(request: Request):
     try:
-        stripe_api_key = os.environ.get('STRIPE_API_KEY')
-        if not stripe_api_key:
-            raise HTTPException(status_code=500, detail="Stripe API key not configured")
-        
-        host_url = str(request.base_url).rstrip('/')
-        webhook_url = f"{host_url}/api/webhook/stripe"
-        
-        stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+        stripe_checkout = get_stripe_checkout(request)
         
         body = await request.body()
         signature = request.headers.get("Stripe-Signature")
         
         webhook_response = await stripe_checkout.handle_webhook(body, signature)
         
-        if webhook_response.event_type == "checkout.session.completed":
-            update_data = {
-                "status": "completed",
-                "payment_status": webhook_response.payment_status,
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }
-            
-            await db.payment_transactions.update_one(
-                {"session_id": webhook_response.session_id},
-                {"$set": update_data}
-            )
-            
-            await db.orders.update_one(
-                {"session_id": webhook_response.session_id},
-                {"$set": update_data}
-            )
+        accepted = await webhook_pipeline.submit({
+            "event_id": webhook_response.event_id,
+            "event_type": webhook_response.event_type,
+            "session_id": webhook_response.session_id,
+            "payment_status": webhook_response.payment_status
+        })
         
-        return {"status": "processed"}
+        return {"status": "accepted" if accepted else "duplicate"}
         
     except Exception as e:
         logging.error(f"Webhook error: {str(e)}")
@@ -675,6 +1312,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Search-Cache"],
 )
 
 # Logging
@@ -684,6 +1322,65 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def convert_status_timestamps() -> None:
+    try:
+        converted = await migrate_timestamps(db.status_checks)
+        if converted:
+            logger.info(f"Converted {converted} status check timestamps to dates")
+    except Exception as e:
+        logger.error(f"Converting status check timestamps failed: {str(e)}")
+
+def record_index_result(failed: List[str]) -> None:
+    index_state["failed"] = failed
+    required_failed = [collection for collection in failed if collection in REQUIRED_FOR_WRITES]
+    if required_failed:
+        logger.critical(f"Unique indexes on {required_failed} are missing; dependent writes are refused")
+    index_state["ready"] = not required_failed
+
+async def prepare_database() -> None:
+    """Create indexes and convert old status check timestamps once Mongo answers."""
+    record_index_result(await ensure_indexes_with_retry(db, DB_INDEX_RETRY_SECONDS))
+    await convert_status_timestamps()
+
+database_setup: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_background_workers():
+    global database_setup
+    if DB_INDEX_CHECK:
+        # Fails startup if Mongo is unreachable, an index is missing or a query would COLLSCAN
+        failed = await ensure_indexes(db)
+        collscans = await verify_query_plans(db)
+        if failed or collscans:
+            raise RuntimeError(f"Index check failed: missing on {failed}, COLLSCAN for {collscans}")
+        record_index_result(failed)
+        await convert_status_timestamps()
+    else:
+        # The unique indexes writes rely on exist before traffic is accepted; if Mongo is
+        # unreachable those writes answer 503 until the background setup has built them
+        try:
+            failed = await ensure_indexes(db, REQUIRED_FOR_WRITES)
+        except ConnectionFailure as e:
+            logger.error(f"Mongo unreachable at startup, building indexes in the background: {str(e)}")
+        else:
+            if failed:
+                raise RuntimeError(f"Unique indexes on {failed} could not be built")
+            index_state["ready"] = True
+        database_setup = asyncio.create_task(prepare_database())
+    if CATALOG_SOURCE == 'mongo':
+        await catalog_sync.start()
+    await webhook_pipeline.start()
+    if STATUS_WRITE_BEHIND:
+        await status_writer.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if database_setup is not None:
+        database_setup.cancel()
+    await catalog_sync.stop()
+    await webhook_pipeline.stop()
+    await status_writer.stop()
     client.close()
+    password_executor.shutdown(wait=False)
+    await image_service.close()
+    await stripe_clients.close()
@@ -0,0 +1,109 @@
+"""Status check time-window queries and downsampled rollups.
+
+Status checks store ``timestamp`` as a native BSON date, so time windows are
+index range scans. Rollups group a window into per-minute or per-hour
+buckets on the server and return one row per bucket (check count and
+distinct clients), empty buckets included, so dashboards read a few hundred
+rows instead of every check.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+BUCKETS = {
+    "minute": (timedelta(minutes=1), "%Y-%m-%dT%H:%M"),
+    "hour": (timedelta(hours=1), "%Y-%m-%dT%H"),
+}
+# Window used when a rollup request gives no ``from``
+DEFAULT_WINDOWS = {"minute": timedelta(hours=1), "hour": timedelta(days=1)}
+
+
+class InvalidWindow(ValueError):
+    pass
+
+
+def as_utc(value: datetime) -> datetime:
+    """Naive datetimes (as Mongo returns them, or as clients send them) are UTC."""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def window_query(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    client_name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Filter for checks in ``[start, end)``, optionally from one client."""
+    if start and end and as_utc(start) >= as_utc(end):
+        raise InvalidWindow("from must be before to")
+    query: Dict[str, Any] = {}
+    if client_name:
+        query["client_name"] = client_name
+    timestamp = {}
+    if start:
+        timestamp["$gte"] = as_utc(start)
+    if end:
+        timestamp["$lt"] = as_utc(end)
+    if timestamp:
+        query["timestamp"] = timestamp
+    return query
+
+
+def truncate(value: datetime, bucket: str) -> datetime:
+    value = as_utc(value)
+    if bucket == "hour":
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(second=0, microsecond=0)
+
+
+async def rollup(
+    collection,
+    bucket: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    client_name: Optional[str] = None,
+    max_buckets: int = 1440,
+) -> Dict[str, Any]:
+    if bucket not in BUCKETS:
+        raise InvalidWindow(f"Invalid bucket, expected one of: {', '.join(BUCKETS)}")
+    step, date_format = BUCKETS[bucket]
+    end = as_utc(end) if end else datetime.now(timezone.utc)
+    start = as_utc(start) if start else end - DEFAULT_WINDOWS[bucket]
+    first, last = truncate(start, bucket), truncate(end - timedelta(microseconds=1), bucket)
+    if (last - first) // step + 1 > max_buckets:
+        raise InvalidWindow(f"Window spans more than {max_buckets} {bucket} buckets")
+
+    # $dateToString (UTC) rather than $dateTrunc (5.0+) so any server version can run it
+    pipeline = [
+        {"$match": window_query(start, end, client_name)},
+        {"$group": {
+            "_id": {"$dateToString": {"date": "$timestamp", "format": date_format}},
+            "count": {"$sum": 1},
+            "clients": {"$addToSet": "$client_name"},
+        }},
+    ]
+    counts = {}
+    async for row in collection.aggregate(pipeline):
+        counts[row["_id"]] = (row["count"], len(row["clients"]))
+
+    buckets: List[Dict[str, Any]] = []
+    current = first
+    while current <= last:
+        count, clients = counts.get(current.strftime(date_format), (0, 0))
+        buckets.append({"start": current, "count": count, "clients": clients})
+        current += step
+    return {"bucket": bucket, "from": start, "to": end, "buckets": buckets}
+
+
+async def migrate_timestamps(collection, batch_size: int = 1000) -> int:
+    """Convert ISO-string timestamps written by older versions to BSON dates; returns the count."""
+    converted = 0
+    while True:
+        docs = await collection.find({"timestamp": {"$type": "string"}}, {"_id": 1, "timestamp": 1}).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return converted
+        await collection.bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"timestamp": as_utc(datetime.fromisoformat(doc["timestamp"]))}})
+            for doc in docs
+        ], ordered=False)
+        converted += len(docs)
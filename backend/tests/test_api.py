@@ -1,10 +1,14 @@
 """
 Backend API Tests for 7777 Fashion E-commerce Store
-Tests: Health check, Status API, Checkout API
+Tests: Health check, Status API, Checkout API, Product images
 """
 import pytest
 import requests
 import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
 
@@ -21,6 +25,38 @@ class TestHealthCheck:
         assert data["message"] == "Hello World"
         print(f"Root endpoint test passed: {data}")
 
+    def test_health_reports_indexes_ready(self):
+        """Test that the health check passes once the unique indexes writes rely on exist"""
+        response = requests.get(f"{BASE_URL}/api/health")
+        assert response.status_code == 200, f"Health check failed: {response.text}"
+        data = response.json()
+        assert data["status"] == "ok"
+        assert data["indexes"]["ready"] is True
+        print(f"Health: {data}")
+
+    def test_metrics_endpoint(self):
+        """Test that cache counters are exposed"""
+        response = requests.get(f"{BASE_URL}/api/metrics")
+        assert response.status_code == 200
+        data = response.json()
+        assert "user_cache" in data
+        for key in ["hits", "misses", "size", "hit_rate"]:
+            assert key in data["user_cache"]
+        for key in ["in_flight", "queued", "rejected", "saturated"]:
+            assert key in data["password_hashing"]
+        for key in ["queue_depth", "processed", "duplicates", "last_batch_lag_seconds", "throughput_per_second"]:
+            assert key in data["webhooks"]
+        for key in ["mode", "version", "products", "last_refresh_lag_seconds", "seconds_since_refresh"]:
+            assert key in data["catalog"]
+        for key in ["renders", "memory_cache", "disk_cache", "executor"]:
+            assert key in data["images"]
+        for key in ["mode", "buffered", "written", "rejected", "throughput_per_second"]:
+            assert key in data["status_writes"]
+        for cache in ["search_cache", "suggest_cache"]:
+            for key in ["hits", "misses", "hit_rate"]:
+                assert key in data[cache]
+        print(f"Metrics: {data}")
+
 
 class TestStatusAPI:
     """Status API CRUD tests"""
@@ -51,6 +87,132 @@ class TestStatusAPI:
         data = response.json()
         assert isinstance(data, list)
         print(f"Retrieved {len(data)} status checks")
+    
+    def test_get_status_checks_paginated(self):
+        """Test following X-Next-Cursor through status check pages"""
+        for i in range(3):
+            requests.post(f"{BASE_URL}/api/status", json={"client_name": f"TEST_pytest_page_{i}"})
+        
+        response = requests.get(f"{BASE_URL}/api/status?limit=2")
+        assert response.status_code == 200
+        first_page = response.json()
+        assert len(first_page) == 2
+        cursor = response.headers.get("X-Next-Cursor")
+        assert cursor, "Expected a cursor for the next page"
+        
+        response = requests.get(f"{BASE_URL}/api/status", params={"limit": 2, "cursor": cursor})
+        assert response.status_code == 200
+        second_page = response.json()
+        assert second_page
+        assert not {c["id"] for c in first_page} & {c["id"] for c in second_page}
+        assert second_page[0]["timestamp"] >= first_page[-1]["timestamp"]
+        print("Status check pages follow each other without overlap")
+    
+    def test_get_status_checks_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        response = requests.get(f"{BASE_URL}/api/status?cursor=%%%")
+        assert response.status_code == 400
+        print("Malformed status cursor correctly rejected")
+
+    def test_concurrent_status_checks_written(self):
+        """Test that a burst of status checks is stored (immediately, or within a flush interval when buffered)"""
+        def create(i):
+            return requests.post(f"{BASE_URL}/api/status", json={"client_name": f"TEST_pytest_burst_{i}"})
+
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            responses = list(pool.map(create, range(30)))
+        assert all(r.status_code == 200 for r in responses)
+        created = {r.json()["id"] for r in responses}
+
+        found = set()
+        for _ in range(20):
+            cursor = None
+            while True:
+                params = {"limit": 1000, **({"cursor": cursor} if cursor else {})}
+                response = requests.get(f"{BASE_URL}/api/status", params=params)
+                found |= {c["id"] for c in response.json()} & created
+                cursor = response.headers.get("X-Next-Cursor")
+                if not cursor:
+                    break
+            if found == created:
+                break
+            time.sleep(0.1)
+        assert found == created
+
+        mode = requests.get(f"{BASE_URL}/api/metrics").json()["status_writes"]["mode"]
+        print(f"{len(created)} concurrent status checks stored ({mode} writes)")
+
+    def test_get_status_checks_time_window(self):
+        """Test filtering status checks by client and [from, to) window"""
+        client_name = f"TEST_pytest_window_{uuid.uuid4().hex[:8]}"
+        created = {requests.post(f"{BASE_URL}/api/status", json={"client_name": client_name}).json()["id"] for _ in range(3)}
+        now = datetime.now(timezone.utc)
+        window = {"client_name": client_name, "from": (now - timedelta(minutes=5)).isoformat(), "to": (now + timedelta(minutes=1)).isoformat()}
+
+        for _ in range(20):
+            response = requests.get(f"{BASE_URL}/api/status", params=window)
+            assert response.status_code == 200
+            if {c["id"] for c in response.json()} == created:
+                break
+            time.sleep(0.1)
+        data = response.json()
+        assert {c["id"] for c in data} == created
+        assert all(c["client_name"] == client_name for c in data)
+        assert all(datetime.fromisoformat(c["timestamp"]).tzinfo is not None for c in data)
+
+        response = requests.get(f"{BASE_URL}/api/status", params={**window, "from": (now + timedelta(minutes=1)).isoformat(), "to": (now + timedelta(minutes=2)).isoformat()})
+        assert response.status_code == 200
+        assert response.json() == []
+        print(f"Time window returned {len(data)} checks for {client_name}")
+
+    def test_get_status_checks_invalid_window(self):
+        """Test that a window ending before it starts is rejected"""
+        now = datetime.now(timezone.utc)
+        response = requests.get(f"{BASE_URL}/api/status", params={"from": now.isoformat(), "to": (now - timedelta(hours=1)).isoformat()})
+        assert response.status_code == 400
+        print("Inverted time window correctly rejected")
+
+    def test_status_rollup_per_minute(self):
+        """Test per-minute rollups count checks and fill empty buckets"""
+        client_name = f"TEST_pytest_rollup_{uuid.uuid4().hex[:8]}"
+        for _ in range(4):
+            requests.post(f"{BASE_URL}/api/status", json={"client_name": client_name})
+        now = datetime.now(timezone.utc)
+        params = {"bucket": "minute", "client_name": client_name, "from": (now - timedelta(minutes=10)).isoformat(), "to": (now + timedelta(minutes=1)).isoformat()}
+
+        for _ in range(20):
+            response = requests.get(f"{BASE_URL}/api/status/rollup", params=params)
+            assert response.status_code == 200
+            if sum(b["count"] for b in response.json()["buckets"]) == 4:
+                break
+            time.sleep(0.1)
+        data = response.json()
+        assert data["bucket"] == "minute"
+        assert len(data["buckets"]) in (11, 12)
+        assert sum(b["count"] for b in data["buckets"]) == 4
+        assert max(b["clients"] for b in data["buckets"]) == 1
+        starts = [b["start"] for b in data["buckets"]]
+        assert starts == sorted(starts)
+        print(f"Rollup: {len(data['buckets'])} minute buckets, {sum(b['count'] for b in data['buckets'])} checks")
+
+    def test_status_rollup_per_hour_default_window(self):
+        """Test hourly rollups default to the last day"""
+        response = requests.get(f"{BASE_URL}/api/status/rollup", params={"bucket": "hour"})
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["buckets"]) in (24, 25)
+        assert sum(b["count"] for b in data["buckets"]) > 0
+        print(f"Hourly rollup over the last day: {sum(b['count'] for b in data['buckets'])} checks")
+
+    def test_status_rollup_invalid(self):
+        """Test unknown buckets and oversized windows are rejected"""
+        response = requests.get(f"{BASE_URL}/api/status/rollup", params={"bucket": "second"})
+        assert response.status_code == 400
+
+        now = datetime.now(timezone.utc)
+        response = requests.get(f"{BASE_URL}/api/status/rollup", params={"bucket": "minute", "from": (now - timedelta(days=30)).isoformat()})
+        assert response.status_code == 400
+        print("Invalid rollup requests correctly rejected")
 
 
 class TestCheckoutAPI:
@@ -171,6 +333,35 @@ class TestCheckoutAPI:
         assert "payment_status" in data
         print(f"Session status retrieved: status={data['status']}, payment_status={data['payment_status']}")
 
+    def test_concurrent_status_polls_agree(self):
+        """Test that concurrent polls for one session all succeed with the same answer"""
+        create_payload = {
+            "origin_url": "https://sevens-fashion-hub.preview.emergentagent.com",
+            "items": [
+                {
+                    "product_id": 1,
+                    "name": "TEST_Concurrent Poll Item",
+                    "price": 100.0,
+                    "quantity": 1,
+                    "size": "S"
+                }
+            ]
+        }
+        create_response = requests.post(f"{BASE_URL}/api/checkout/create-session", json=create_payload)
+        assert create_response.status_code == 200
+        session_id = create_response.json()["session_id"]
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(
+                lambda _: requests.get(f"{BASE_URL}/api/checkout/status/{session_id}"),
+                range(8)
+            ))
+        
+        assert all(r.status_code == 200 for r in responses)
+        bodies = [r.json() for r in responses]
+        assert all(body == bodies[0] for body in bodies)
+        print(f"{len(bodies)} concurrent polls returned status={bodies[0]['status']}")
+
 
 class TestCheckoutDifferentSizes:
     """Test checkout with different size options"""
@@ -198,5 +389,39 @@ class TestCheckoutDifferentSizes:
         print(f"Checkout with size {size} successful")
 
 
+class TestProductImages:
+    """Product image derivative tests"""
+    
+    def test_get_resized_webp(self):
+        """Test a product image is served as a resized WebP with validators"""
+        response = requests.get(f"{BASE_URL}/api/images/1", params={"w": 300, "fmt": "webp"})
+        
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "image/webp"
+        assert response.content[:4] == b"RIFF" and response.content[8:12] == b"WEBP"
+        assert "ETag" in response.headers
+        assert "max-age" in response.headers["Cache-Control"]
+        
+        cached = requests.get(
+            f"{BASE_URL}/api/images/1",
+            params={"w": 300, "fmt": "webp"},
+            headers={"If-None-Match": response.headers["ETag"]}
+        )
+        assert cached.status_code == 304
+        print(f"Image derivative: {len(response.content)} bytes, revalidated with 304")
+    
+    def test_image_unknown_product(self):
+        """Test images for unknown products return 404"""
+        response = requests.get(f"{BASE_URL}/api/images/999999")
+        assert response.status_code == 404
+        print("Unknown product image returns 404")
+    
+    def test_image_invalid_format(self):
+        """Test unsupported formats are rejected"""
+        response = requests.get(f"{BASE_URL}/api/images/1", params={"fmt": "gif"})
+        assert response.status_code == 400
+        print("Invalid image format rejected")
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
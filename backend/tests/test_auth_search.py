@@ -6,6 +6,7 @@ import pytest
 import requests
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
 
@@ -167,6 +168,26 @@ class TestAuthMe:
         assert data["email"] == TEST_EMAIL.lower()
         
         print(f"Get current user successful: {data['name']}")
+
+    def test_profile_update_visible_on_next_request(self):
+        """Test that a profile update is not hidden by the user cache"""
+        global auth_token
+        
+        if not auth_token:
+            pytest.skip("No auth token available - skipping authenticated test")
+        
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        # Warm the cache
+        assert requests.get(f"{BASE_URL}/api/auth/me", headers=headers).status_code == 200
+        
+        response = requests.put(f"{BASE_URL}/api/auth/profile", params={"name": "Renamed User"}, headers=headers)
+        assert response.status_code == 200, f"Profile update failed: {response.text}"
+        
+        data = requests.get(f"{BASE_URL}/api/auth/me", headers=headers).json()
+        assert data["name"] == "Renamed User"
+        
+        requests.put(f"{BASE_URL}/api/auth/profile", params={"name": TEST_NAME}, headers=headers)
+        print("Profile update reflected immediately in /me")
     
     def test_get_current_user_no_token(self):
         """Test that /me requires authentication"""
@@ -234,7 +255,37 @@ class TestProductSearch:
         
         assert "products" in data
         print(f"Arabic search 'حقيبة': {data['total']} products found")
-    
+
+    def test_search_arabic_spelling_variants_match(self):
+        """Test that tashkeel and taa marbuta/haa variants return the same products"""
+        baseline = requests.get(f"{BASE_URL}/api/products/search?q=حقيبة").json()
+        assert baseline["total"] > 0
+
+        for variant in ["حقيبه", "حَقِيبَة"]:
+            response = requests.get(f"{BASE_URL}/api/products/search", params={"q": variant})
+            assert response.status_code == 200
+            data = response.json()
+            assert [p["id"] for p in data["products"]] == [p["id"] for p in baseline["products"]], \
+                f"Variant '{variant}' should match the same products as 'حقيبة'"
+
+        print(f"Arabic spelling variants matched {baseline['total']} products")
+
+    def test_search_short_and_long_queries(self):
+        """Test one-character and multi-word substring queries"""
+        response = requests.get(f"{BASE_URL}/api/products/search?q=x")
+        assert response.status_code == 200
+        for product in response.json()["products"]:
+            assert "x" in product["nameEn"].lower() or "x" in product["name"].lower()
+
+        response = requests.get(f"{BASE_URL}/api/products/search", params={"q": "leather bag"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] >= 1
+        for product in data["products"]:
+            assert "leather bag" in product["nameEn"].lower()
+
+        print("Short and multi-word queries handled correctly")
+
     def test_search_products_by_category(self):
         """Test filtering products by category"""
         response = requests.get(f"{BASE_URL}/api/products/search?category=bags")
@@ -285,6 +336,234 @@ class TestProductSearch:
         
         print(f"Products by category 'shirts': {len(data['products'])} products")
 
+    def test_get_products_unknown_category(self):
+        """Test that an unknown category returns an empty list on both endpoints"""
+        response = requests.get(f"{BASE_URL}/api/products?category=nonexistent")
+        assert response.status_code == 200
+        assert response.json()["products"] == []
+
+        response = requests.get(f"{BASE_URL}/api/products/search?category=nonexistent")
+        assert response.status_code == 200
+        assert response.json()["total"] == 0
+
+        print("Unknown category returns no products")
+
+    @pytest.mark.parametrize("query", ["", "q=leather&"])
+    def test_search_facets(self, query):
+        """Test category counts and price histogram returned with facets=true"""
+        response = requests.get(f"{BASE_URL}/api/products/search?{query}category=bags&max_price=900&facets=true")
+        assert response.status_code == 200
+        data = response.json()
+        facets = data["facets"]
+
+        # Category counts keep the price filter but not the category filter
+        for entry in facets["categories"]:
+            expected = requests.get(
+                f"{BASE_URL}/api/products/search?{query}category={entry['id']}&max_price=900"
+            ).json()["total"]
+            assert entry["count"] == expected, entry
+        assert next(c for c in facets["categories"] if c["id"] == "bags")["count"] == data["total"]
+
+        # The histogram keeps the category filter but not the price filter
+        unpriced = requests.get(f"{BASE_URL}/api/products/search?{query}category=bags").json()
+        histogram = facets["price_histogram"]
+        assert sum(bucket["count"] for bucket in histogram) == unpriced["total"]
+        for product in unpriced["products"]:
+            assert any(b["min"] <= product["price"] <= b["max"] and b["count"] for b in histogram)
+
+        assert "facets" not in requests.get(f"{BASE_URL}/api/products/search?{query}category=bags").json()
+        print(f"Facets for '{query}': {facets['categories']}")
+
+    def test_search_price_range_zero_bounds(self):
+        """Test that 0 is a real price bound rather than 'no filter'"""
+        everything = requests.get(f"{BASE_URL}/api/products/search").json()["total"]
+        assert requests.get(f"{BASE_URL}/api/products/search?min_price=0").json()["total"] == everything
+        assert requests.get(f"{BASE_URL}/api/products/search?max_price=0").json()["total"] == 0
+
+        data = requests.get(f"{BASE_URL}/api/products/search?min_price=299&max_price=599").json()
+        prices = [p["price"] for p in data["products"]]
+        assert prices and all(299 <= price <= 599 for price in prices)
+        assert 299 in prices and 599 in prices
+        print(f"Price range 299-599: {data['total']} products")
+
+    @pytest.mark.parametrize("query", ["", "q=bag&", "category=bags&", "min_price=300&"])
+    def test_search_is_new_filter(self, query):
+        """Test is_new=true|false splits the results by the isNew flag"""
+        everything = requests.get(f"{BASE_URL}/api/products/search?{query}").json()
+        by_flag = {}
+        for flag in ("true", "false"):
+            data = requests.get(f"{BASE_URL}/api/products/search?{query}is_new={flag}&sort=price_asc&facets=true").json()
+            assert all(p["isNew"] == (flag == "true") for p in data["products"])
+            assert sum(c["count"] for c in data["facets"]["categories"]) >= data["total"]
+            by_flag[flag] = data
+        assert by_flag["true"]["total"] > 0
+        assert by_flag["true"]["total"] + by_flag["false"]["total"] == everything["total"]
+        print(f"is_new split for '{query}': {by_flag['true']['total']} new of {everything['total']}")
+
+    @pytest.mark.parametrize("query", ["", "q=leather&", "category=bags&max_price=1000&"])
+    def test_search_sort_orders(self, query):
+        """Test sort=price_asc|price_desc|newest|relevance"""
+        def fetch(sort):
+            return requests.get(f"{BASE_URL}/api/products/search?{query}sort={sort}").json()["products"]
+
+        relevance = fetch("relevance")
+        price_asc = [p["price"] for p in fetch("price_asc")]
+        price_desc = [p["price"] for p in fetch("price_desc")]
+        newest = fetch("newest")
+
+        assert price_asc == sorted(price_asc)
+        assert price_desc == sorted(price_desc, reverse=True)
+        assert sorted(p["id"] for p in newest) == sorted(p["id"] for p in relevance)
+        flags = [p["isNew"] for p in newest]
+        assert flags == sorted(flags, reverse=True)
+        print(f"Sort orders for '{query}' over {len(relevance)} products")
+
+    @pytest.mark.parametrize("sort", ["relevance", "price_desc", "newest"])
+    def test_search_pagination(self, sort):
+        """Test limit/offset and cursor paging through search results"""
+        full = requests.get(f"{BASE_URL}/api/products/search?sort={sort}").json()
+
+        seen, cursor = [], None
+        while True:
+            url = f"{BASE_URL}/api/products/search?sort={sort}&limit=5"
+            data = requests.get(url + (f"&cursor={cursor}" if cursor else "")).json()
+            assert len(data["products"]) <= 5
+            assert data["total"] == full["total"]
+            seen.extend(p["id"] for p in data["products"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        assert seen == [p["id"] for p in full["products"]]
+
+        data = requests.get(f"{BASE_URL}/api/products/search?sort={sort}&limit=3&offset=4").json()
+        assert [p["id"] for p in data["products"]] == seen[4:7]
+        print(f"Paged {len(seen)} products sorted by {sort}")
+
+    @pytest.mark.parametrize("sort", ["relevance", "newest"])
+    def test_search_pagination_with_price_filter(self, sort):
+        """Test cursor paging through price-filtered results"""
+        full = requests.get(f"{BASE_URL}/api/products/search?sort={sort}&min_price=300&max_price=1300").json()
+        assert full["total"] > 3
+
+        seen, cursor = [], None
+        while True:
+            url = f"{BASE_URL}/api/products/search?sort={sort}&min_price=300&max_price=1300&limit=3"
+            data = requests.get(url + (f"&cursor={cursor}" if cursor else "")).json()
+            seen.extend(p["id"] for p in data["products"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        assert seen == [p["id"] for p in full["products"]]
+        assert all(300 <= p["price"] <= 1300 for p in full["products"])
+        print(f"Paged {len(seen)} price-filtered products sorted by {sort}")
+
+    def test_search_invalid_sort_and_cursor(self):
+        """Test that an unknown sort, mode or a malformed cursor is rejected"""
+        assert requests.get(f"{BASE_URL}/api/products/search?sort=cheapest").status_code == 400
+        assert requests.get(f"{BASE_URL}/api/products/search?mode=exact&q=bag").status_code == 400
+        assert requests.get(f"{BASE_URL}/api/products/search?cursor=not-a-cursor").status_code == 400
+        print("Invalid sort, mode and cursor rejected")
+
+    def test_search_results_cached_by_normalized_query(self):
+        """Test that repeated and equivalently spelled queries hit the search cache"""
+        # A price bound unique to this run, so earlier runs and parallel tests cannot have cached it
+        max_price = 1000 + uuid.uuid4().int % 10**6 / 10**7
+
+        def search(q, price):
+            return requests.get(f"{BASE_URL}/api/products/search", params={"q": q, "category": "bags", "max_price": price})
+
+        first = search("حقيبة", max_price)
+        assert first.headers["X-Search-Cache"] == "miss"
+        again = search("حقيبه", max_price)
+        assert again.headers["X-Search-Cache"] == "hit"
+        assert again.json()["products"] == first.json()["products"]
+
+        # A different filter is a different entry
+        assert search("حقيبة", max_price - 200).headers["X-Search-Cache"] == "miss"
+        print("Equivalent spellings share a search cache entry")
+
+    def test_ranked_search_tolerates_typos(self):
+        """Test that ranked mode finds misspelled names and ranks the best match first"""
+        response = requests.get(f"{BASE_URL}/api/products/search?q=lether%20bag")
+        assert response.json()["total"] == 0
+
+        data = requests.get(f"{BASE_URL}/api/products/search?q=lether%20bag&mode=ranked").json()
+        assert data["total"] > 0
+        assert data["products"][0]["nameEn"] == "Luxury Leather Bag"
+
+        data = requests.get(f"{BASE_URL}/api/products/search?q=clasic&mode=ranked").json()
+        assert {p["nameEn"] for p in data["products"]} >= {"Classic Pants", "Classic Handbag"}
+
+        data = requests.get(f"{BASE_URL}/api/products/search?q=xyznonexistentproduct&mode=ranked").json()
+        assert data["total"] == 0
+        print("Ranked search matches misspelled queries")
+
+    def test_ranked_search_arabic_variants(self):
+        """Test that ranked Arabic queries ignore hamza/taa marbuta spelling differences"""
+        first = requests.get(f"{BASE_URL}/api/products/search?q=حقيبة جلدية&mode=ranked").json()
+        second = requests.get(f"{BASE_URL}/api/products/search?q=حقيبه جلديه&mode=ranked").json()
+        assert first["total"] > 0
+        assert [p["id"] for p in first["products"]] == [p["id"] for p in second["products"]]
+        assert first["products"][0]["nameEn"] == "Luxury Leather Bag"
+        print(f"Ranked Arabic search: {first['total']} products")
+
+    def test_ranked_search_pagination(self):
+        """Test cursor paging in ranked order"""
+        full = requests.get(f"{BASE_URL}/api/products/search?q=leather%20shirt%20bag&mode=ranked").json()
+        assert full["total"] > 2
+
+        seen, cursor = [], None
+        while True:
+            url = f"{BASE_URL}/api/products/search?q=leather%20shirt%20bag&mode=ranked&limit=2"
+            data = requests.get(url + (f"&cursor={cursor}" if cursor else "")).json()
+            seen.extend(p["id"] for p in data["products"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        assert seen == [p["id"] for p in full["products"]]
+        print(f"Paged {len(seen)} ranked results")
+
+
+class TestProductSuggest:
+    """Autocomplete endpoint tests"""
+
+    def test_suggest_name_and_word_prefixes(self):
+        """Test completions from the start of a name and from later words"""
+        data = requests.get(f"{BASE_URL}/api/products/suggest?prefix=lux").json()
+        assert {s["id"] for s in data["suggestions"]} == {1, 12}
+        assert all(s["text"].startswith("Luxury") for s in data["suggestions"])
+
+        data = requests.get(f"{BASE_URL}/api/products/suggest?prefix=Jack").json()
+        assert {s["id"] for s in data["suggestions"]} == {5, 9, 12}
+        print(f"Suggestions for 'Jack': {[s['text'] for s in data['suggestions']]}")
+
+    def test_suggest_arabic_prefix_variants(self):
+        """Test Arabic prefixes with and without hamza/taa marbuta variants"""
+        plain = requests.get(f"{BASE_URL}/api/products/suggest?prefix=حقيبه").json()["suggestions"]
+        marked = requests.get(f"{BASE_URL}/api/products/suggest?prefix=حقيبة").json()["suggestions"]
+        assert plain and [s["id"] for s in plain] == [s["id"] for s in marked]
+        assert all(requests.get(f"{BASE_URL}/api/products/{s['id']}").json()["category"] == "bags" for s in plain)
+        print(f"Arabic suggestions: {[s['text'] for s in plain]}")
+
+    def test_suggest_limit_and_empty_prefix(self):
+        """Test that limit caps the completions and an empty prefix returns none"""
+        data = requests.get(f"{BASE_URL}/api/products/suggest?prefix=c&limit=2").json()
+        assert len(data["suggestions"]) == 2
+        assert len({s["id"] for s in data["suggestions"]}) == 2
+
+        assert requests.get(f"{BASE_URL}/api/products/suggest?prefix=").json()["suggestions"] == []
+        assert requests.get(f"{BASE_URL}/api/products/suggest?prefix=zzz").json()["suggestions"] == []
+        print("Suggest limit and empty prefix handled")
+
+    def test_suggest_repeated_prefix_is_cached(self):
+        """Test that a repeated prefix is served from the suggest cache"""
+        requests.get(f"{BASE_URL}/api/products/suggest?prefix=Premium")
+        before = requests.get(f"{BASE_URL}/api/metrics").json()["suggest_cache"]["hits"]
+        requests.get(f"{BASE_URL}/api/products/suggest?prefix=premium")
+        after = requests.get(f"{BASE_URL}/api/metrics").json()["suggest_cache"]["hits"]
+        assert after == before + 1
+        print("Repeated prefix served from cache")
+
 
 class TestCategories:
     """Category API tests"""
@@ -315,6 +594,62 @@ class TestCategories:
         print(f"Get categories: {len(data['categories'])} categories returned")
 
 
+class TestCatalogConditionalCaching:
+    """ETag / Cache-Control / 304 tests for catalog endpoints"""
+    
+    @pytest.mark.parametrize("path", [
+        "/api/products",
+        "/api/products?category=bags",
+        "/api/products/1",
+        "/api/products/search?q=leather",
+        "/api/categories",
+    ])
+    def test_etag_revalidation_returns_304(self, path):
+        """Test that a matching If-None-Match gets an empty 304"""
+        response = requests.get(f"{BASE_URL}{path}")
+        assert response.status_code == 200
+        etag = response.headers.get("ETag")
+        assert etag and etag.startswith('"'), "Expected a strong ETag"
+        assert "max-age" in response.headers.get("Cache-Control", "")
+        
+        revalidated = requests.get(f"{BASE_URL}{path}", headers={"If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        assert revalidated.headers.get("ETag") == etag
+        print(f"{path}: 304 on revalidation with {etag}")
+    
+    def test_etag_differs_per_query(self):
+        """Test that different filters produce different ETags"""
+        bags = requests.get(f"{BASE_URL}/api/products?category=bags").headers.get("ETag")
+        shirts = requests.get(f"{BASE_URL}/api/products?category=shirts").headers.get("ETag")
+        assert bags != shirts
+        
+        response = requests.get(f"{BASE_URL}/api/products?category=shirts", headers={"If-None-Match": bags})
+        assert response.status_code == 200
+        print("ETags are specific to the request")
+
+    @pytest.mark.parametrize("path", ["/api/products", "/api/products?category=bags", "/api/categories"])
+    def test_precompressed_variants(self, path):
+        """Test that gzip and identity variants carry the same JSON and distinct ETags"""
+        plain = requests.get(f"{BASE_URL}{path}", headers={"Accept-Encoding": "identity"})
+        assert plain.status_code == 200
+        assert "Content-Encoding" not in plain.headers
+        
+        gzipped = requests.get(f"{BASE_URL}{path}", headers={"Accept-Encoding": "gzip"})
+        assert gzipped.status_code == 200
+        assert gzipped.headers.get("Content-Encoding") == "gzip"
+        assert "Accept-Encoding" in gzipped.headers.get("Vary", "")
+        assert gzipped.json() == plain.json()
+        assert gzipped.headers["ETag"] != plain.headers["ETag"]
+        
+        revalidated = requests.get(f"{BASE_URL}{path}", headers={
+            "Accept-Encoding": "gzip",
+            "If-None-Match": gzipped.headers["ETag"]
+        })
+        assert revalidated.status_code == 304
+        print(f"{path}: identity {len(plain.content)} bytes, gzip {gzipped.headers.get('Content-Length')} bytes")
+
+
 class TestProductDetail:
     """Product detail API tests"""
     
@@ -340,6 +675,41 @@ class TestProductDetail:
         assert response.status_code == 404, f"Expected 404, got {response.status_code}"
         print("Non-existent product correctly returns 404")
 
+    def test_get_products_batch(self):
+        """Test fetching several products in request order with missing ids reported"""
+        response = requests.get(f"{BASE_URL}/api/products/batch?ids=7,99999,2,7,12")
+        assert response.status_code == 200, f"Batch failed: {response.text}"
+        data = response.json()
+
+        assert [p["id"] for p in data["products"]] == [7, 2, 12]
+        assert data["missing"] == [99999]
+        assert data["products"][1] == requests.get(f"{BASE_URL}/api/products/2").json()
+        print(f"Batch fetch: {len(data['products'])} found, missing {data['missing']}")
+
+    def test_get_products_batch_projection(self):
+        """Test field projection on GET and POST batch requests"""
+        data = requests.get(f"{BASE_URL}/api/products/batch?ids=3,1&fields=price,image").json()
+        assert data["products"][0].keys() == {"id", "price", "image"}
+        assert [p["id"] for p in data["products"]] == [3, 1]
+
+        response = requests.post(f"{BASE_URL}/api/products/batch", json={"ids": [5, 4, 404], "fields": ["nameEn"]})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["products"] == [
+            {"id": 5, "nameEn": "Formal Jacket"},
+            {"id": 4, "nameEn": "Elegant Summer Shirt"},
+        ]
+        assert data["missing"] == [404]
+        print("Batch projection works for GET and POST")
+
+    def test_get_products_batch_invalid_ids(self):
+        """Test that malformed or oversized id lists are rejected"""
+        assert requests.get(f"{BASE_URL}/api/products/batch?ids=1,abc").status_code == 400
+        too_many = ",".join(str(i) for i in range(1000))
+        assert requests.get(f"{BASE_URL}/api/products/batch?ids={too_many}").status_code == 400
+        assert requests.post(f"{BASE_URL}/api/products/batch", json={"ids": list(range(1000))}).status_code == 422
+        print("Invalid batch requests rejected")
+
 
 class TestWishlist:
     """Wishlist API tests (requires authentication)"""
@@ -448,6 +818,77 @@ class TestWishlist:
         
         print("Product 1 removed from wishlist and verified")
     
+    def test_concurrent_adds_keep_products_unique(self):
+        """Test concurrent adds from a fresh account create one wishlist with unique products"""
+        register = requests.post(f"{BASE_URL}/api/auth/register", json={
+            "email": f"TEST_wishlist_{uuid.uuid4().hex[:8]}@7777.com",
+            "password": TEST_PASSWORD,
+            "name": "Wishlist Race"
+        })
+        assert register.status_code == 200, f"Registration failed: {register.text}"
+        headers = {"Authorization": f"Bearer {register.json()['access_token']}"}
+        
+        product_ids = [1, 2, 3, 1, 2, 3, 1, 2, 3, 4] * 3
+        
+        def add(product_id):
+            payload = {"product_id": product_id, "name": f"TEST_{product_id}", "price": 100.0, "image": "https://example.com/p.jpg"}
+            return requests.post(f"{BASE_URL}/api/wishlist/add", json=payload, headers=headers)
+        
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            responses = list(pool.map(add, product_ids))
+        assert all(r.status_code == 200 for r in responses), [r.text for r in responses if r.status_code != 200]
+        
+        items = requests.get(f"{BASE_URL}/api/wishlist", headers=headers).json()["items"]
+        assert sorted(i["product_id"] for i in items) == [1, 2, 3, 4]
+        print(f"{len(product_ids)} concurrent adds left {len(items)} unique items")
+    
+    def test_toggle_wishlist(self):
+        """Test toggling a product in and out of the wishlist"""
+        global auth_token
+        
+        if not auth_token:
+            pytest.skip("No auth token available")
+        
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        payload = {"product_id": 5, "name": "Formal Jacket", "price": 599, "image": "https://example.com/5.jpg"}
+        
+        response = requests.post(f"{BASE_URL}/api/wishlist/toggle", json=payload, headers=headers)
+        assert response.status_code == 200, f"Toggle failed: {response.text}"
+        assert response.json()["in_wishlist"] is True
+        
+        response = requests.post(f"{BASE_URL}/api/wishlist/toggle", json=payload, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["in_wishlist"] is False
+        
+        items = requests.get(f"{BASE_URL}/api/wishlist", headers=headers).json()["items"]
+        assert 5 not in [i["product_id"] for i in items]
+        print("Wishlist toggle added and removed product 5")
+    
+    def test_sync_wishlist_merges(self):
+        """Test merging a client-side wishlist without duplicating products"""
+        global auth_token
+        
+        if not auth_token:
+            pytest.skip("No auth token available")
+        
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        requests.post(f"{BASE_URL}/api/wishlist/add", json={
+            "product_id": 6, "name": "Classic Pants", "price": 399, "image": "https://example.com/6.jpg"
+        }, headers=headers)
+        
+        local_items = [
+            {"product_id": 6, "name": "Classic Pants", "price": 399, "image": "https://example.com/6.jpg"},
+            {"product_id": 7, "name": "Practical Backpack", "price": 549, "image": "https://example.com/7.jpg"},
+            {"product_id": 7, "name": "Practical Backpack", "price": 549, "image": "https://example.com/7.jpg"},
+        ]
+        response = requests.post(f"{BASE_URL}/api/wishlist/sync", json={"items": local_items}, headers=headers)
+        assert response.status_code == 200, f"Sync failed: {response.text}"
+        
+        product_ids = [i["product_id"] for i in response.json()["items"]]
+        assert product_ids.count(6) == 1
+        assert product_ids.count(7) == 1
+        print(f"Wishlist after sync: {product_ids}")
+    
     def test_wishlist_requires_auth(self):
         """Test that wishlist endpoints require authentication"""
         response = requests.get(f"{BASE_URL}/api/wishlist")
@@ -618,6 +1059,71 @@ class TestOrders:
         assert "orders" in data
         print(f"User has {len(data['orders'])} orders")
     
+    def test_get_orders_paginated_with_projection(self):
+        """Test paging through order history with a cursor and a field projection"""
+        global auth_token
+        
+        if not auth_token:
+            pytest.skip("No auth token available")
+        
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        for i in range(3):
+            payload = {
+                "origin_url": "https://sevens-fashion-hub.preview.emergentagent.com",
+                "items": [{"product_id": 1, "name": f"TEST_Order page item {i}", "price": 10.0, "quantity": 1, "size": "M"}]
+            }
+            response = requests.post(f"{BASE_URL}/api/checkout/create-session", json=payload, headers=headers)
+            assert response.status_code == 200, f"Checkout failed: {response.text}"
+        
+        seen = []
+        cursor = None
+        while True:
+            params = {"limit": 2, "fields": "id,status"}
+            if cursor:
+                params["cursor"] = cursor
+            response = requests.get(f"{BASE_URL}/api/orders", params=params, headers=headers)
+            assert response.status_code == 200, f"Get orders failed: {response.text}"
+            data = response.json()
+            assert len(data["orders"]) <= 2
+            for order in data["orders"]:
+                assert "items" not in order and "shipping_address" not in order
+                seen.append(order["id"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        
+        assert len(seen) >= 3
+        assert len(seen) == len(set(seen)), "Pages should not overlap"
+        print(f"Paged through {len(seen)} orders")
+    
+    def test_get_orders_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        global auth_token
+        
+        if not auth_token:
+            pytest.skip("No auth token available")
+        
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        response = requests.get(f"{BASE_URL}/api/orders?cursor=not-a-cursor", headers=headers)
+        assert response.status_code == 400, f"Expected 400, got {response.status_code}"
+        print("Malformed cursor correctly rejected")
+
+    def test_get_orders_projection_ignores_internal_fields(self):
+        """Test that _id, $ operators and unknown names in fields are not projected"""
+        global auth_token
+
+        if not auth_token:
+            pytest.skip("No auth token available")
+
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        for fields in ("_id", "_id,status", "$where,status", "items.$,status", "status,bogus"):
+            response = requests.get(f"{BASE_URL}/api/orders", params={"fields": fields}, headers=headers)
+            assert response.status_code == 200, f"fields={fields} failed: {response.text}"
+            for order in response.json()["orders"]:
+                assert "_id" not in order
+                assert set(order) <= {"id", "created_at", "status"}, f"fields={fields} returned {sorted(order)}"
+        print("Internal and unknown fields ignored in the order projection")
+
     def test_get_orders_requires_auth(self):
         """Test that orders endpoint requires authentication"""
         response = requests.get(f"{BASE_URL}/api/orders")
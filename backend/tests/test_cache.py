@@ -0,0 +1,55 @@
+"""
+Cache tests for 7777 Fashion E-commerce Store
+Tests: Weight-bounded TTL cache used for search results
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache import TTLCache
+
+
+class TestWeightedTTLCache:
+    """TTLCache max_weight tests"""
+
+    def test_evicts_least_recent_until_under_weight(self):
+        """Test that entries are evicted by total weight, least recently used first"""
+        cache = TTLCache(maxsize=100, max_weight=10, weigh=len)
+        cache.set("a", [0] * 4)
+        cache.set("b", [0] * 4)
+        cache.get("a")
+        cache.set("c", [0] * 4)
+        assert "a" in cache and "c" in cache
+        assert "b" not in cache
+        assert cache.weight == 8
+        assert cache.stats()["max_weight"] == 10
+        print("Evicted by weight")
+
+    def test_oversized_value_not_stored(self):
+        """Test that a value heavier than max_weight is not cached and does not evict others"""
+        cache = TTLCache(maxsize=100, max_weight=10, weigh=len)
+        cache.set("a", [0] * 4)
+        cache.set("big", [0] * 11)
+        assert "big" not in cache
+        assert "a" in cache
+        assert cache.weight == 4
+        print("Oversized value skipped")
+
+    def test_replace_and_invalidate_update_weight(self):
+        """Test that replacing or invalidating an entry releases its weight"""
+        cache = TTLCache(maxsize=100, max_weight=10, weigh=len)
+        cache.set("a", [0] * 6)
+        cache.set("a", [0] * 2)
+        assert cache.weight == 2
+        cache.invalidate("a")
+        assert cache.weight == 0
+        print("Weight released on replace and invalidate")
+
+    def test_max_weight_needs_weigh(self):
+        """Test that max_weight without a weigh function is rejected"""
+        with pytest.raises(ValueError):
+            TTLCache(max_weight=10)
+        print("max_weight without weigh rejected")
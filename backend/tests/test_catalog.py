@@ -0,0 +1,195 @@
+"""
+Catalog tests for 7777 Fashion E-commerce Store
+Tests: Incremental snapshot updates match a full rebuild, derived structures only rebuilt when their inputs change
+"""
+import random
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog import Catalog
+from columnar import ColumnarCatalog
+from facets import facets_builder
+from product_search import SORTS, build_listings, update_listings
+from search_index import PrefixIndex, RankedIndex
+
+NAMES = ["عباية سوداء", "فستان سهرة", "حقيبة جلدية", "قميص قطني", "جاكيت شتوي", "حذاء رياضي"]
+NAMES_EN = ["Black Abaya", "Evening Dress", "Leather Bag", "Cotton Shirt", "Winter Jacket", "Sport Shoes"]
+CATEGORIES = ["abayas", "dresses", "bags", "shirts", "jackets", "shoes"]
+QUERIES = ["", "a", "ab", "leather", "عباية", "shrit", "bag 7", "dress", "zzz"]
+
+
+def product(product_id, rng):
+    i = rng.randrange(len(NAMES))
+    return {
+        "id": product_id,
+        "name": f"{NAMES[i]} {product_id}",
+        "nameEn": f"{NAMES_EN[i]} {product_id}",
+        "category": rng.choice(CATEGORIES),
+        "price": float(rng.randint(10, 500)),
+        "image": f"https://example.com/{product_id}.jpg",
+        "isNew": rng.random() < 0.3,
+    }
+
+
+def register(catalog):
+    catalog.add_derived("listings", build_listings, update=update_listings)
+    catalog.add_derived(
+        "columns",
+        lambda snapshot: ColumnarCatalog(snapshot.products, text_fields=("name",)),
+        update=lambda previous, snapshot, change: previous.updated(change.after, [p["id"] for p in change.removed]),
+        depends_on=("price", "category", "isNew", "name"),
+    )
+    catalog.add_derived(
+        "ranking",
+        lambda snapshot: RankedIndex(snapshot.products),
+        update=lambda previous, snapshot, change: previous.updated(change.after, [p["id"] for p in change.removed], snapshot.positions),
+        depends_on=("name", "nameEn", "isNew"),
+    )
+    catalog.add_derived(
+        "suggest",
+        lambda snapshot: PrefixIndex(snapshot.products),
+        update=lambda previous, snapshot, change: previous.updated(change.before, change.after),
+        depends_on=("name", "nameEn"),
+    )
+    catalog.add_derived("facets", facets_builder(5), depends_on=("price", "category"))
+    return catalog
+
+
+def assert_same(updated, rebuilt):
+    """Every structure of ``updated`` answers like the one of ``rebuilt``."""
+    assert updated.products == rebuilt.products
+    assert updated.by_id == rebuilt.by_id
+    assert updated.positions == rebuilt.positions
+    assert {c: p for c, p in updated.by_category.items()} == rebuilt.by_category
+    assert updated.price_index.products == rebuilt.price_index.products
+    assert updated.price_index.prices == rebuilt.price_index.prices
+    assert {c: i.products for c, i in updated.category_price_index.items()} == {
+        c: i.products for c, i in rebuilt.category_price_index.items()
+    }
+    assert updated.content_hash == rebuilt.content_hash
+
+    for q in QUERIES:
+        assert updated.search(q) == rebuilt.search(q)
+        ranked, scores = updated.derived["ranking"].search(q, updated.by_id)
+        expected, expected_scores = rebuilt.derived["ranking"].search(q, rebuilt.by_id)
+        assert ranked == expected
+        assert scores == pytest.approx(expected_scores)
+        assert updated.derived["suggest"].complete(q, 20) == rebuilt.derived["suggest"].complete(q, 20)
+
+    assert updated.derived["listings"] == rebuilt.derived["listings"]
+    columns, expected_columns = updated.derived["columns"], rebuilt.derived["columns"]
+    for column in ("ids", "prices", "is_new"):
+        assert np.array_equal(getattr(columns, column), getattr(expected_columns, column))
+    assert [columns.row(i) for i in range(len(columns))] == [expected_columns.row(i) for i in range(len(expected_columns))]
+    for sort in SORTS:
+        for category in ("", "bags"):
+            assert np.array_equal(columns.find(category, 50, 300, True, sort), expected_columns.find(category, 50, 300, True, sort))
+    assert updated.derived["facets"].histogram_counts == rebuilt.derived["facets"].histogram_counts
+
+
+class TestIncrementalUpdate:
+    """Catalog.update against a snapshot built from scratch"""
+
+    def test_random_changes_match_full_build(self):
+        """Test that a series of edits, renames, inserts and deletes gives the same snapshot as a rebuild"""
+        rng = random.Random(7777)
+        products = {i: product(i, rng) for i in range(1, 201)}
+        catalog = register(Catalog(sorted(products.values(), key=lambda p: p["id"])))
+        rebuilt = register(Catalog(catalog.snapshot.products))
+        next_id = 201
+        for _ in range(60):
+            previous, previous_rebuilt = catalog.snapshot, rebuilt
+            upserts, removed = [], []
+            for _ in range(rng.randint(1, 4)):
+                action = rng.random()
+                if action < 0.25 and products:
+                    removed.append(rng.choice(list(products)))
+                elif action < 0.45:
+                    upserts.append(product(next_id, rng))
+                    next_id += 1
+                else:
+                    target = dict(products[rng.choice(list(products))])
+                    field = rng.choice(["price", "category", "isNew", "name", "nameEn", "image"])
+                    target[field] = product(target["id"], rng)[field] if field != "isNew" else not target["isNew"]
+                    upserts.append(target)
+            for product_id in removed:
+                products.pop(product_id, None)
+            for p in upserts:
+                if p["id"] not in removed:
+                    products[p["id"]] = p
+            catalog.update(upserts, removed)
+
+            rebuilt = register(Catalog(sorted(products.values(), key=lambda p: p["id"])))
+            assert_same(catalog.snapshot, rebuilt.snapshot)
+            # Structures shared with the previous snapshot were copied before being changed
+            assert_same(previous, previous_rebuilt.snapshot)
+        print(f"60 incremental updates matched a full build ({len(products)} products)")
+
+    def test_unchanged_inputs_reuse_derived(self):
+        """Test that a price change keeps name-only structures and a rename keeps price-only ones"""
+        rng = random.Random(1)
+        catalog = register(Catalog([product(i, rng) for i in range(1, 51)]))
+        before = catalog.snapshot
+
+        catalog.update([{**before.by_id[7], "price": before.by_id[7]["price"] + 1}])
+        repriced = catalog.snapshot
+        assert repriced.derived["suggest"] is before.derived["suggest"]
+        assert repriced.derived["ranking"] is before.derived["ranking"]
+        assert repriced.derived["facets"] is not before.derived["facets"]
+        assert repriced.positions is before.positions
+        # A reused ranking index still returns the current products
+        ranked, _ = repriced.derived["ranking"].search("7", repriced.by_id)
+        assert repriced.by_id[7] in ranked
+
+        catalog.update([{**repriced.by_id[7], "nameEn": "Renamed Bag 7"}])
+        renamed = catalog.snapshot
+        assert renamed.derived["facets"] is repriced.derived["facets"]
+        assert renamed.derived["suggest"].complete("renamed")[0]["id"] == 7
+        print("Derived structures reused when their inputs did not change")
+
+    def test_load_applies_small_difference(self):
+        """Test that load() with one changed product patches the snapshot instead of rebuilding it"""
+        rng = random.Random(2)
+        products = [product(i, rng) for i in range(1, 101)]
+        catalog = register(Catalog(products))
+        builds = []
+        catalog.add_derived("counted", lambda snapshot: builds.append(snapshot.version), depends_on=("name",))
+        version = catalog.version
+
+        assert catalog.load(products) is catalog.snapshot
+        assert catalog.version == version
+        changed = [dict(p) for p in products]
+        changed[10]["price"] += 5
+        catalog.load(changed)
+        assert catalog.version == version + 1
+        assert builds == [version]
+        assert_same(catalog.snapshot, register(Catalog(changed)).snapshot)
+        print("Single-product difference applied without a rebuild")
+
+    def test_unordered_catalog_rebuilt(self):
+        """Test that a snapshot not in id order is rebuilt in place order, new products last"""
+        catalog = Catalog([{"id": 3, "name": "c", "category": "x", "price": 1.0}, {"id": 1, "name": "a", "category": "x", "price": 2.0}])
+        catalog.update([{"id": 2, "name": "b", "category": "x", "price": 3.0}, {"id": 1, "name": "a2", "category": "x", "price": 2.0}])
+        assert [p["id"] for p in catalog.snapshot.products] == [3, 1, 2]
+        assert catalog.snapshot.search("a2") == [catalog.snapshot.by_id[1]]
+        assert not catalog.snapshot.id_ordered
+        print("Unordered catalog rebuilt")
+
+    def test_content_hash_tracks_content(self):
+        """Test that the content hash changes with a product and returns when the change is undone"""
+        rng = random.Random(3)
+        products = [product(i, rng) for i in range(1, 21)]
+        catalog = Catalog(products)
+        original = catalog.snapshot.content_hash
+        catalog.update([{**products[4], "price": 1.5}])
+        assert catalog.snapshot.content_hash != original
+        catalog.update([products[4]])
+        assert catalog.snapshot.content_hash == original
+        catalog.update([], [products[0]["id"]])
+        assert catalog.snapshot.content_hash == Catalog(products[1:]).snapshot.content_hash
+        print("Content hash follows the products")
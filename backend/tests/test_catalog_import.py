@@ -0,0 +1,193 @@
+"""
+Catalog import tests for 7777 Fashion E-commerce Store
+Tests: Streaming CSV/JSONL product feed import, admin key checks, resuming jobs
+"""
+import json
+import os
+import time
+
+import pytest
+import requests
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY')
+
+pytestmark = pytest.mark.skipif(not ADMIN_API_KEY, reason="ADMIN_API_KEY not set")
+
+ADMIN_HEADERS = {"X-Admin-Key": ADMIN_API_KEY or ""}
+IMPORT_IDS = [90001, 90002, 90003, 90004]
+
+
+def jsonl(rows):
+    return "\n".join(json.dumps(row, ensure_ascii=False) for row in rows) + "\n"
+
+
+def wait_for_products(ids, present=True, timeout=15):
+    """The catalog picks up imported products on its next refresh"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = requests.get(f"{BASE_URL}/api/products/batch", params={"ids": ",".join(map(str, ids))})
+        found = {p["id"] for p in response.json()["products"]}
+        if (found == set(ids)) if present else not found:
+            return response.json()["products"]
+        time.sleep(0.5)
+    pytest.fail(f"Catalog did not pick up the import of {ids}")
+
+
+class TestCatalogImport:
+    """Admin catalog import tests"""
+
+    def test_import_requires_admin_key(self):
+        """Test import is rejected without a valid admin key"""
+        response = requests.post(f"{BASE_URL}/api/admin/catalog/import", data="")
+        assert response.status_code == 401
+
+        response = requests.post(f"{BASE_URL}/api/admin/catalog/import", data="", headers={"X-Admin-Key": "wrong"})
+        assert response.status_code == 401
+        print("✓ Import requires the admin key")
+
+    def test_import_invalid_format(self):
+        """Test unknown feed formats are rejected"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/catalog/import",
+            params={"format": "xml"},
+            data="<products/>",
+            headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 400
+        print("✓ Invalid feed format rejected")
+
+    def test_import_jsonl_reports_invalid_rows(self):
+        """Test JSONL import upserts valid rows and reports invalid ones"""
+        feed = jsonl([
+            {"id": 90001, "name": "منتج استيراد أول", "nameEn": "Imported Sample One", "category": "TEST", "price": 101, "image": "https://example.com/1.jpg"},
+            {"id": 90002, "name": "منتج استيراد ثان", "nameEn": "Imported Sample Two", "category": "TEST", "price": 102, "image": "https://example.com/2.jpg", "isNew": True},
+            {"id": 90099, "name": "بدون سعر", "nameEn": "No Price", "category": "TEST", "image": "https://example.com/x.jpg"},
+        ])
+        response = requests.post(
+            f"{BASE_URL}/api/admin/catalog/import",
+            params={"format": "jsonl", "batch_size": 2},
+            data=feed.encode(),
+            headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "completed"
+        assert data["progress"]["rows"] == 3
+        assert data["progress"]["upserted"] == 2
+        assert data["progress"]["errors"] == 1
+        assert data["progress"]["error_samples"][0]["line"] == 3
+        assert data["progress"]["batches"] == 1
+
+        job = requests.get(f"{BASE_URL}/api/admin/catalog/import/{data['id']}", headers=ADMIN_HEADERS).json()
+        assert job["status"] == "completed"
+        assert job["checkpoint_line"] == 3
+
+        products = wait_for_products([90001, 90002])
+        assert {p["id"]: p["price"] for p in products} == {90001: 101, 90002: 102}
+        print(f"✓ JSONL import: {data['progress']['upserted']} upserted, {data['progress']['errors']} rejected")
+
+    def test_import_csv_completed_job_not_replayed(self):
+        """Test CSV import and that re-posting a completed job does not replay it"""
+        header = "id,name,nameEn,category,price,image,isNew\n"
+        first = header + "90003,منتج استيراد ثالث,Imported Sample Three,TEST,103,https://example.com/3.jpg,\n"
+        response = requests.post(
+            f"{BASE_URL}/api/admin/catalog/import",
+            params={"format": "csv"},
+            data=first.encode(),
+            headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["progress"]["upserted"] == 1
+
+        # A completed job is not replayed
+        response = requests.post(
+            f"{BASE_URL}/api/admin/catalog/import",
+            params={"format": "csv", "job_id": data["id"]},
+            data=first.encode(),
+            headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 200
+        assert response.json()["status"] == "completed"
+
+        products = wait_for_products([90003])
+        assert products[0]["isNew"] is False
+        print("✓ CSV import applied; completed job not replayed")
+
+    def test_import_csv_quoted_newline(self):
+        """Test that a quoted CSV field spanning lines is one row, and line numbers count physical lines"""
+        feed = (
+            "id,name,nameEn,category,price,image\n"
+            '90004,"منتج\nاستيراد","Imported ""Sample""\nFour",TEST,104,https://example.com/4.jpg\n'
+            "90005,منتج,Imported Sample Five,TEST,not-a-price,https://example.com/5.jpg\n"
+        )
+        response = requests.post(
+            f"{BASE_URL}/api/admin/catalog/import",
+            params={"format": "csv"},
+            data=feed.encode(),
+            headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 200
+        progress = response.json()["progress"]
+        assert progress["upserted"] == 1
+        assert progress["checkpoint_line"] == 5
+        assert [sample["line"] for sample in progress["error_samples"]] == [5]
+
+        products = wait_for_products([90004])
+        assert products[0]["nameEn"] == 'Imported "Sample"\nFour'
+        print("✓ Quoted newline kept inside one CSV row")
+
+    def test_import_line_too_long_fails(self):
+        """Test that a body without newlines past the line limit fails the import instead of being buffered"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/catalog/import",
+            data=b"x" * (2 * 1024 * 1024),
+            headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 400
+        assert "longer than" in response.json()["detail"]
+        print("✓ Over-long line failed the import")
+
+    def test_import_resume_with_other_format(self):
+        """Test that resuming a job with a different format than it started with is rejected"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/catalog/import",
+            params={"format": "csv"},
+            data="id,name,nameEn,category,price,image\n".encode(),
+            headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 200
+        response = requests.post(
+            f"{BASE_URL}/api/admin/catalog/import",
+            params={"format": "jsonl", "job_id": response.json()["id"]},
+            data=jsonl([{"id": 90001, "deleted": True}]).encode(),
+            headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 400
+        assert "csv" in response.json()["detail"]
+        print("✓ Resuming with another format rejected")
+
+    def test_import_resume_unknown_job(self):
+        """Test resuming an unknown job returns 404"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/catalog/import",
+            params={"job_id": "missing"},
+            data="",
+            headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 404
+        print("✓ Unknown import job returns 404")
+
+    def test_import_deletes(self):
+        """Test rows flagged deleted remove imported products"""
+        response = requests.post(
+            f"{BASE_URL}/api/admin/catalog/import",
+            data=jsonl([{"id": product_id, "deleted": True} for product_id in IMPORT_IDS]).encode(),
+            headers=ADMIN_HEADERS
+        )
+        assert response.status_code == 200
+        assert response.json()["progress"]["deleted"] == len(IMPORT_IDS)
+
+        wait_for_products(IMPORT_IDS, present=False)
+        print("✓ Deleted rows removed from the catalog")
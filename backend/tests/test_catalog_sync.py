@@ -0,0 +1,224 @@
+"""
+Catalog sync tests for 7777 Fashion E-commerce Store
+Tests: Seeding, watermark polling, soft deletes, change stream fallback, retrying the initial load
+"""
+import asyncio
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from catalog import Catalog
+from catalog_sync import CatalogSync
+from db_indexes import INDEXES, ensure_indexes_with_retry
+
+
+def product(product_id, price=100.0, category="abayas"):
+    return {
+        "id": product_id,
+        "name": f"منتج {product_id}",
+        "nameEn": f"Product {product_id}",
+        "category": category,
+        "price": price,
+        "image": f"https://example.com/{product_id}.jpg",
+        "isNew": False,
+    }
+
+
+BUILT_IN = [product(1), product(2), product(3)]
+
+
+def make_db():
+    return mongomock_motor.AsyncMongoMockClient()["test_catalog_sync"]
+
+
+def make_sync(collection, catalog, **kwargs):
+    options = {"seed": BUILT_IN, "use_change_streams": False, "poll_interval": 0.02, "retry_interval": 0.02}
+    return CatalogSync(collection, catalog, **{**options, **kwargs})
+
+
+async def wait_until(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+def prices(catalog):
+    return {p["id"]: p["price"] for p in catalog.snapshot.products}
+
+
+class Unreachable:
+    """Collection or database wrapper whose calls fail like a server that is down, until ``state["up"]``"""
+
+    def __init__(self, target, state):
+        self.target = target
+        self.state = state
+
+    def __getitem__(self, name):
+        return Unreachable(self.target[name], self.state)
+
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if self.state["up"] or not callable(attr):
+            return attr
+
+        def fail(*args, **kwargs):
+            raise ServerSelectionTimeoutError("localhost:27017: [Errno 111] Connection refused")
+        return fail
+
+
+class TestCatalogSync:
+    """Catalog sync against a mock products collection"""
+
+    def test_seeds_empty_collection(self):
+        """Test that an empty collection is seeded and published with updated_at stripped"""
+        async def scenario():
+            db = make_db()
+            catalog = Catalog()
+            sync = make_sync(db.products, catalog)
+            await sync.start()
+            await sync.stop()
+            return catalog, sync, await db.products.find({}, {"_id": 0}).to_list(None)
+
+        catalog, sync, docs = asyncio.run(scenario())
+        assert sorted(doc["id"] for doc in docs) == [1, 2, 3]
+        assert all(isinstance(doc["updated_at"], datetime) for doc in docs)
+        assert catalog.snapshot.products == BUILT_IN
+        assert sync.stats()["products"] == 3
+        print("Empty collection seeded and published")
+
+    def test_poll_picks_up_changes_past_watermark(self):
+        """Test that polling publishes writes that bump updated_at and skips those that do not"""
+        async def scenario():
+            db = make_db()
+            catalog = Catalog()
+            sync = make_sync(db.products, catalog)
+            await sync.start()
+            await wait_until(lambda: sync.mode == "polling")
+            now = datetime.now(timezone.utc)
+            await db.products.update_one({"id": 2}, {"$set": {"price": 75.0, "updated_at": now}})
+            await db.products.insert_one({**product(4, price=20.0), "updated_at": now})
+            await wait_until(lambda: 4 in prices(catalog))
+            # The watermark has moved past product 1; not bumping updated_at leaves the change unseen
+            await db.products.update_one({"id": 1}, {"$set": {"price": 50.0}})
+            await asyncio.sleep(0.1)
+            result = prices(catalog)
+            await sync.stop()
+            return result
+
+        result = asyncio.run(scenario())
+        assert result == {1: 100.0, 2: 75.0, 3: 100.0, 4: 20.0}
+        print("Changes past the watermark published")
+
+    def test_changes_published_incrementally(self):
+        """Test that a polled price change patches the snapshot instead of rebuilding name-only structures"""
+        async def scenario():
+            db = make_db()
+            catalog = Catalog()
+            builds = []
+            catalog.add_derived("names", lambda snapshot: builds.append(snapshot.version), depends_on=("name", "nameEn"))
+            sync = make_sync(db.products, catalog)
+            await sync.start()
+            await wait_until(lambda: sync.mode == "polling")
+            loaded = list(builds)
+            await db.products.update_one({"id": 2}, {"$set": {"price": 80.0, "updated_at": datetime.now(timezone.utc)}})
+            await wait_until(lambda: prices(catalog)[2] == 80.0)
+            await sync.stop()
+            return loaded, builds, catalog
+
+        loaded, builds, catalog = asyncio.run(scenario())
+        assert builds == loaded
+        assert catalog.snapshot.price_index.prices == [80.0, 100.0, 100.0]
+        print("Price change published without rebuilding name structures")
+
+    def test_soft_delete_removes_product(self):
+        """Test that deleted: true with a bumped updated_at removes the product"""
+        async def scenario():
+            db = make_db()
+            catalog = Catalog()
+            sync = make_sync(db.products, catalog)
+            await sync.start()
+            await db.products.update_one({"id": 3}, {"$set": {"deleted": True, "updated_at": datetime.now(timezone.utc)}})
+            await wait_until(lambda: 3 not in prices(catalog))
+            await sync.stop()
+            return catalog
+
+        catalog = asyncio.run(scenario())
+        assert sorted(prices(catalog)) == [1, 2]
+        assert all("deleted" not in p for p in catalog.snapshot.products)
+        print("Soft-deleted product removed")
+
+    def test_falls_back_to_polling_without_change_streams(self):
+        """Test that a collection without change streams is followed by polling"""
+        async def scenario():
+            db = make_db()
+            catalog = Catalog()
+            sync = make_sync(db.products, catalog, use_change_streams=True)
+            await sync.start()
+            await wait_until(lambda: sync.mode == "polling")
+            await db.products.update_one({"id": 1}, {"$set": {"price": 60.0, "updated_at": datetime.now(timezone.utc)}})
+            await wait_until(lambda: prices(catalog)[1] == 60.0)
+            await sync.stop()
+            return sync
+
+        sync = asyncio.run(scenario())
+        assert sync.use_change_streams is False
+        assert sync.stats()["mode"] == "polling"
+        print("Fell back to polling")
+
+    def test_initial_load_retried(self):
+        """Test that the built-in catalog is served until a failed initial load succeeds"""
+        async def scenario():
+            db = make_db()
+            await db.products.insert_one({**product(9, price=5.0), "updated_at": datetime.now(timezone.utc)})
+            state = {"up": False}
+            catalog = Catalog(BUILT_IN)
+            sync = make_sync(Unreachable(db.products, state), catalog)
+            await sync.start()
+            before = (sync.stats()["mode"], prices(catalog), sync.errors)
+            state["up"] = True
+            await wait_until(lambda: sync.mode == "polling")
+            after = prices(catalog)
+            await sync.stop()
+            return before, after
+
+        (mode, before, errors), after = asyncio.run(scenario())
+        assert mode == "static"
+        assert before == {1: 100.0, 2: 100.0, 3: 100.0}
+        assert errors >= 1
+        # The collection was not empty, so it is not seeded over
+        assert after == {9: 5.0}
+        print("Initial load retried once Mongo answered")
+
+    def test_startup_with_mongo_unreachable(self):
+        """Test the server's startup path: index creation and catalog load both wait for Mongo"""
+        async def scenario():
+            state = {"up": False}
+            db = Unreachable(make_db(), state)
+            catalog = Catalog(BUILT_IN)
+            sync = make_sync(db["products"], catalog)
+            indexing = asyncio.create_task(ensure_indexes_with_retry(db, retry_interval=0.02))
+            await sync.start()
+            await asyncio.sleep(0.1)
+            served = (indexing.done(), len(catalog.snapshot.products))
+            state["up"] = True
+            failed = await asyncio.wait_for(indexing, 5)
+            await wait_until(lambda: sync.mode == "polling")
+            indexes = await db["products"].index_information()
+            await sync.stop()
+            return served, failed, indexes, catalog
+
+        (indexed_early, served), failed, indexes, catalog = asyncio.run(scenario())
+        assert not indexed_early
+        assert served == len(BUILT_IN)
+        assert failed == []
+        assert {model.document["name"] for model in INDEXES["products"]} <= set(indexes)
+        assert sorted(prices(catalog)) == [1, 2, 3]
+        print("Startup served the built-in catalog until Mongo answered")
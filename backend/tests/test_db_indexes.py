@@ -0,0 +1,156 @@
+"""
+Index registry tests for 7777 Fashion E-commerce Store
+Tests: Index creation failures, retry while Mongo is unreachable, duplicate wishlists, COLLSCAN detection
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from pymongo.errors import OperationFailure, ServerSelectionTimeoutError
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db_indexes import INDEXES, QUERY_SHAPES, REQUIRED_FOR_WRITES, ensure_indexes, ensure_indexes_with_retry, verify_query_plans
+
+
+class FakeCursor:
+    def __init__(self, plan):
+        self.plan = plan
+
+    def sort(self, keys):
+        return self
+
+    async def explain(self):
+        return {"queryPlanner": {"winningPlan": self.plan}}
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    async def index_information(self):
+        return {"_id_": {"key": [("_id", 1)]}}
+
+    async def aggregate(self, pipeline):
+        for group in []:
+            yield group
+
+    async def create_indexes(self, models):
+        if self.db.unreachable:
+            self.db.unreachable -= 1
+            raise ServerSelectionTimeoutError("localhost:27017: [Errno 111] Connection refused")
+        if self.name in self.db.broken:
+            raise OperationFailure("E11000 duplicate key error", code=11000)
+        self.db.indexed.append(self.name)
+
+    def find(self, query):
+        if self.name in self.db.unindexed:
+            return FakeCursor({"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}})
+        return FakeCursor({"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}})
+
+
+class FakeDB:
+    """Database stand-in: ``unreachable`` calls fail to connect, ``broken`` collections reject their indexes"""
+
+    def __init__(self, unreachable=0, broken=(), unindexed=()):
+        self.unreachable = unreachable
+        self.broken = set(broken)
+        self.unindexed = set(unindexed)
+        self.indexed = []
+
+    def __getitem__(self, name):
+        return FakeCollection(self, name)
+
+
+class TestEnsureIndexes:
+    """Index creation tests"""
+
+    def test_all_collections_indexed(self):
+        """Test that every registered collection gets its indexes"""
+        db = FakeDB()
+        failed = asyncio.run(ensure_indexes(db))
+        assert failed == []
+        assert db.indexed == list(INDEXES)
+        print(f"Indexed {len(db.indexed)} collections")
+
+    def test_subset_of_collections(self):
+        """Test that only the requested collections are indexed, e.g. the ones writes rely on"""
+        db = FakeDB()
+        failed = asyncio.run(ensure_indexes(db, REQUIRED_FOR_WRITES))
+        assert failed == []
+        assert db.indexed == list(REQUIRED_FOR_WRITES)
+        assert all(any(model.document.get("unique") for model in INDEXES[name]) for name in REQUIRED_FOR_WRITES)
+        print(f"Indexed {db.indexed} before serving")
+
+    def test_failure_reported_and_others_indexed(self):
+        """Test that one collection's failure is reported without skipping the rest"""
+        db = FakeDB(broken={"wishlists"})
+        failed = asyncio.run(ensure_indexes(db))
+        assert failed == ["wishlists"]
+        assert db.indexed == [name for name in INDEXES if name != "wishlists"]
+        print("Failed collection reported, others indexed")
+
+    def test_unreachable_server_raises(self):
+        """Test that a connection error is raised instead of being reported per collection"""
+        with pytest.raises(ServerSelectionTimeoutError):
+            asyncio.run(ensure_indexes(FakeDB(unreachable=1)))
+        print("Unreachable server raised")
+
+    def test_retried_until_server_answers(self):
+        """Test that ensure_indexes_with_retry keeps trying while the server is unreachable"""
+        db = FakeDB(unreachable=3)
+        failed = asyncio.run(ensure_indexes_with_retry(db, retry_interval=0.01))
+        assert failed == []
+        assert db.unreachable == 0
+        assert db.indexed == list(INDEXES)
+        print("Indexes created after 3 failed connection attempts")
+
+
+class TestDedupeWishlists:
+    """Duplicate wishlist repair tests"""
+
+    def test_duplicates_merged_before_unique_index(self):
+        """Test that duplicate wishlists are merged so the unique user_id index can be built"""
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+
+        def item(product_id):
+            return {"product_id": product_id, "name": f"Product {product_id}", "price": 10.0, "image": ""}
+
+        async def scenario():
+            db = mongomock_motor.AsyncMongoMockClient()["test_db_indexes"]
+            await db.wishlists.insert_many([
+                {"user_id": "u1", "items": [item(1), item(2)], "updated_at": "2026-01-01T00:00:00+00:00"},
+                {"user_id": "u2", "items": [item(5)], "updated_at": "2026-01-01T00:00:00+00:00"},
+                {"user_id": "u1", "items": [item(2), item(3)], "updated_at": "2026-01-03T00:00:00+00:00"},
+                {"user_id": "u1", "items": [], "updated_at": "2026-01-02T00:00:00+00:00"},
+            ])
+            failed = await ensure_indexes(db)
+            wishlists = await db.wishlists.find({}, {"_id": 0}).sort("user_id", 1).to_list(None)
+            return failed, wishlists, await db.wishlists.index_information()
+
+        failed, wishlists, indexes = asyncio.run(scenario())
+        assert "wishlists" not in failed
+        assert [w["user_id"] for w in wishlists] == ["u1", "u2"]
+        assert [i["product_id"] for i in wishlists[0]["items"]] == [1, 2, 3]
+        assert wishlists[0]["updated_at"] == "2026-01-03T00:00:00+00:00"
+        assert indexes["user_id_unique"]["unique"]
+        print("Duplicate wishlists merged and unique index created")
+
+
+class TestVerifyQueryPlans:
+    """Query plan check tests"""
+
+    def test_indexed_shapes_pass(self):
+        """Test that no shape is reported when every winning plan uses an index"""
+        assert asyncio.run(verify_query_plans(FakeDB())) == []
+        print(f"{len(QUERY_SHAPES)} query shapes use an index")
+
+    def test_collscan_reported(self):
+        """Test that shapes whose winning plan contains a COLLSCAN stage are reported"""
+        collscans = asyncio.run(verify_query_plans(FakeDB(unindexed={"orders"})))
+        expected = [f"{shape.name} (orders)" for shape in QUERY_SHAPES if shape.collection == "orders"]
+        assert expected
+        assert collscans == expected
+        print(f"COLLSCAN reported for {collscans}")
@@ -0,0 +1,161 @@
+"""
+Image derivative tests for 7777 Fashion E-commerce Store
+Tests: Resizing, content-addressed memory/disk caching and local image sources
+"""
+import asyncio
+import io
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from executors import BoundedExecutor
+from images import DiskCache, ImageNotFound, ImageService, ImageSource, ImageSourceError, LocalImageSource, snap_width
+
+IMAGE_URL = "https://images.unsplash.com/photo-test-1"
+
+
+def write_image(path, size=(1200, 800), color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "JPEG")
+    path.write_bytes(buffer.getvalue())
+
+
+def make_service(tmp_path, disk_bytes=10 * 1024 * 1024):
+    # A thread pool keeps the tests fast; the server runs render() on a process pool
+    return ImageService(
+        source=LocalImageSource(tmp_path / "originals"),
+        executor=BoundedExecutor("image-test", max_workers=2, max_queue=8),
+        disk_cache=DiskCache(tmp_path / "cache", max_bytes=disk_bytes),
+    )
+
+
+@pytest.fixture
+def originals(tmp_path):
+    (tmp_path / "originals").mkdir()
+    write_image(tmp_path / "originals" / "photo-test-1.jpg")
+    return tmp_path
+
+
+class TestImageService:
+    """Image derivative service tests"""
+
+    def test_resizes_to_snapped_width(self, originals):
+        """Test derivatives are scaled to the next width on the ladder and keep their aspect ratio"""
+        service = make_service(originals)
+        derivative = asyncio.run(service.get(IMAGE_URL, 300, "webp"))
+
+        assert snap_width(300) == 320
+        assert derivative.media_type == "image/webp"
+        with Image.open(io.BytesIO(derivative.data)) as image:
+            assert image.format == "WEBP"
+            assert image.size == (320, 213)
+        print(f"Resized to 320px WebP: {len(derivative.data)} bytes")
+
+    def test_never_upscales(self, originals):
+        """Test widths beyond the original keep its size"""
+        service = make_service(originals)
+        derivative = asyncio.run(service.get(IMAGE_URL, 1920, "jpeg"))
+        with Image.open(io.BytesIO(derivative.data)) as image:
+            assert image.size == (1200, 800)
+        print("Original size kept for larger widths")
+
+    def test_cached_in_memory_and_on_disk(self, originals):
+        """Test repeat requests are served from memory, and from disk after a restart"""
+        service = make_service(originals)
+
+        async def twice():
+            return await service.get(IMAGE_URL, 640, "webp"), await service.get(IMAGE_URL, 640, "webp")
+
+        first, second = asyncio.run(twice())
+        assert first.key == second.key
+        assert service.renders == 1
+        assert service.fetches == 1
+        assert service.memory.hits == 1
+
+        restarted = make_service(originals)
+        third = asyncio.run(restarted.get(IMAGE_URL, 640, "webp"))
+        assert third.key == first.key
+        assert third.data == first.data
+        assert restarted.renders == 0
+        assert restarted.disk.hits == 1
+        print("Derivative reused from memory and from disk")
+
+    def test_concurrent_requests_render_once(self, originals):
+        """Test concurrent requests for one derivative share a single render"""
+        service = make_service(originals)
+
+        async def burst():
+            return await asyncio.gather(*(service.get(IMAGE_URL, 480, "webp") for _ in range(10)))
+
+        results = asyncio.run(burst())
+        assert len({result.key for result in results}) == 1
+        assert service.renders == 1
+        print("10 concurrent requests rendered once")
+
+    def test_changed_original_gets_new_key(self, originals):
+        """Test keys follow the original's content, not its URL"""
+        service = make_service(originals)
+        first = asyncio.run(service.get(IMAGE_URL, 320, "webp"))
+
+        write_image(originals / "originals" / "photo-test-1.jpg", color=(30, 30, 200))
+        restarted = make_service(originals)
+        second = asyncio.run(restarted.get(IMAGE_URL, 320, "webp"))
+        assert second.key != first.key
+        assert restarted.renders == 1
+        print("Replaced original produced a new derivative")
+
+    def test_missing_image(self, originals):
+        """Test a missing original raises ImageNotFound"""
+        service = make_service(originals)
+        with pytest.raises(ImageNotFound):
+            asyncio.run(service.get("https://images.unsplash.com/photo-missing", 320, "webp"))
+        print("Missing original reported")
+
+    def test_undecodable_original(self, originals):
+        """Test an original that is not an image raises ImageSourceError"""
+        (originals / "originals" / "photo-broken").write_bytes(b"<html>not an image</html>")
+        service = make_service(originals)
+        with pytest.raises(ImageSourceError):
+            asyncio.run(service.get("https://images.unsplash.com/photo-broken", 320, "webp"))
+        print("Undecodable original reported")
+
+    def test_decompression_bomb(self, originals, monkeypatch):
+        """Test an original over Pillow's pixel limit raises ImageSourceError instead of escaping as a 500"""
+        monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+        service = make_service(originals)
+        with pytest.raises(ImageSourceError):
+            asyncio.run(service.get(IMAGE_URL, 320, "webp"))
+        print("Decompression bomb reported")
+
+    def test_image_source_is_abstract(self):
+        """Test a source has to implement fetch"""
+        with pytest.raises(TypeError):
+            ImageSource()
+
+        class Partial(ImageSource):
+            pass
+
+        with pytest.raises(TypeError):
+            Partial()
+        print("ImageSource requires fetch")
+
+    def test_disk_cache_evicts_least_recently_used(self, tmp_path):
+        """Test the disk cache stays within its budget, dropping the oldest entries"""
+        cache = DiskCache(tmp_path / "cache", max_bytes=3000)
+
+        async def fill():
+            for i in range(5):
+                await cache.set(f"{i:02d}key", bytes(1000))
+                await asyncio.sleep(0.01)
+            return [await cache.get(f"{i:02d}key") for i in range(5)]
+
+        entries = asyncio.run(fill())
+        assert cache.nbytes <= 3000
+        assert cache.evictions >= 2
+        assert entries[0] is None
+        assert entries[4] is not None
+        print(f"Disk cache evicted {cache.evictions} entries")
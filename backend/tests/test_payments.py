@@ -0,0 +1,112 @@
+"""
+Payment client tests for 7777 Fashion E-commerce Store
+Tests: Stripe client registry and pooled HTTP client against a local fake Stripe server
+"""
+import asyncio
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+pytest.importorskip("emergentintegrations")
+
+import stripe
+from payments import PaymentsNotConfigured, PooledHTTPXClient, StripeClientRegistry, checkout_settled
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.client_address[1]))
+        session_id = self.path.rsplit("/", 1)[-1]
+        body = json.dumps({
+            "id": session_id,
+            "object": "checkout.session",
+            "status": "open",
+            "payment_status": "unpaid"
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_stripe():
+    FakeStripeHandler.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeStripeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    original_api_base = stripe.api_base
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    stripe.api_base = original_api_base
+    server.shutdown()
+
+
+class TestStripeClientRegistry:
+    """Stripe client registry tests"""
+
+    def test_registry_reuses_client_per_webhook_url(self, fake_stripe):
+        """Test that one StripeCheckout is kept per webhook URL"""
+        registry = StripeClientRegistry("sk_test_fake", PooledHTTPXClient(), api_base=fake_stripe)
+        first = registry.get("https://shop.example/api/webhook/stripe")
+        assert registry.get("https://shop.example/api/webhook/stripe") is first
+        assert registry.get("https://other.example/api/webhook/stripe") is not first
+        asyncio.run(registry.close())
+        print("Registry returns one client per webhook URL")
+
+    def test_registry_without_api_key(self, fake_stripe):
+        """Test that a missing API key is reported when a client is requested"""
+        registry = StripeClientRegistry(None, PooledHTTPXClient(), api_base=fake_stripe)
+        with pytest.raises(PaymentsNotConfigured):
+            registry.get("https://shop.example/api/webhook/stripe")
+        asyncio.run(registry.close())
+        print("Missing API key correctly reported")
+
+    def test_requests_share_keepalive_connection(self, fake_stripe):
+        """Test that consecutive Stripe calls go to the fake server over one connection"""
+        registry = StripeClientRegistry("sk_test_fake", PooledHTTPXClient(max_connections=2), api_base=fake_stripe)
+
+        async def poll_twice():
+            first = await stripe.checkout.Session.retrieve_async("cs_test_1", api_key="sk_test_fake")
+            second = await stripe.checkout.Session.retrieve_async("cs_test_2", api_key="sk_test_fake")
+            await registry.close()
+            return first, second
+
+        first, second = asyncio.run(poll_twice())
+
+        assert first.id == "cs_test_1"
+        assert second.id == "cs_test_2"
+        paths = [path for path, _ in FakeStripeHandler.requests_seen]
+        assert paths == ["/v1/checkout/sessions/cs_test_1", "/v1/checkout/sessions/cs_test_2"]
+        ports = {port for _, port in FakeStripeHandler.requests_seen}
+        assert len(ports) == 1, f"Expected a reused connection, saw client ports {ports}"
+        assert stripe.default_http_client is None
+        print("Stripe calls reused one keep-alive connection")
+
+
+class TestCheckoutSettled:
+    """Settled checkout session detection tests"""
+
+    @pytest.mark.parametrize("status,settled", [
+        ({"status": "complete", "payment_status": "paid"}, True),
+        ({"status": "complete", "payment_status": "no_payment_required"}, True),
+        ({"status": "expired", "payment_status": "unpaid"}, True),
+        ({"status": "complete", "payment_status": "unpaid"}, False),
+        ({"status": "open", "payment_status": "unpaid"}, False),
+        (None, False),
+    ])
+    def test_checkout_settled(self, status, settled):
+        """Test that only sessions Stripe cannot change again count as settled"""
+        assert checkout_settled(status) is settled
+        print(f"{status} settled={settled}")
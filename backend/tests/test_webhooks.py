@@ -0,0 +1,144 @@
+"""
+Webhook pipeline tests for 7777 Fashion E-commerce Store
+Tests: Duplicate delivery, batched apply, replay after failures and restarts, draining on stop
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from webhooks import WebhookPipeline
+
+
+def event(i):
+    return {"event_id": f"evt_{i}", "event_type": "checkout.session.completed", "session_id": f"cs_{i}", "payment_status": "paid"}
+
+
+async def make_journal():
+    journal = mongomock_motor.AsyncMongoMockClient()["test_webhooks"]["webhook_events"]
+    await journal.create_index("event_id", unique=True)
+    return journal
+
+
+class Recorder:
+    """apply_batch stand-in that records batches and can fail the first ``failures`` calls"""
+
+    def __init__(self, failures=0, delay=0.0):
+        self.batches = []
+        self.failures = failures
+        self.delay = delay
+
+    async def __call__(self, events):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("apply failed")
+        self.batches.append([e["event_id"] for e in events])
+
+    @property
+    def applied(self):
+        return [event_id for batch in self.batches for event_id in batch]
+
+
+class TestWebhookPipeline:
+    """Webhook journal and batch consumer tests"""
+
+    def test_duplicate_delivery_dropped(self):
+        """Test that a redelivered event is journaled once and reported as a duplicate"""
+        async def scenario():
+            journal = await make_journal()
+            pipeline = WebhookPipeline(journal, Recorder())
+            first = await pipeline.submit(event(1))
+            second = await pipeline.submit(event(1))
+            return first, second, pipeline, await journal.count_documents({})
+
+        first, second, pipeline, journaled = asyncio.run(scenario())
+        assert first is True
+        assert second is False
+        assert pipeline.duplicates == 1
+        assert journaled == 1
+        print("Duplicate delivery dropped")
+
+    def test_events_applied_in_batches(self):
+        """Test that queued events are applied in batches and marked processed"""
+        async def scenario():
+            journal = await make_journal()
+            recorder = Recorder()
+            pipeline = WebhookPipeline(journal, recorder, batch_size=4, flush_interval=0.05)
+            await pipeline.start()
+            for i in range(10):
+                await pipeline.submit(event(i))
+            await pipeline.stop()
+            return recorder, pipeline, await journal.count_documents({"processed_at": None})
+
+        recorder, pipeline, unprocessed = asyncio.run(scenario())
+        assert sorted(recorder.applied) == sorted(f"evt_{i}" for i in range(10))
+        assert all(len(batch) <= 4 for batch in recorder.batches)
+        assert len(recorder.batches) >= 3
+        assert pipeline.processed == 10
+        assert unprocessed == 0
+        print(f"10 events applied in {len(recorder.batches)} batches")
+
+    def test_failed_batch_replayed(self):
+        """Test that events of a failed batch stay in the journal and are applied on retry"""
+        async def scenario():
+            journal = await make_journal()
+            recorder = Recorder(failures=1)
+            pipeline = WebhookPipeline(journal, recorder, flush_interval=0.01, retry_interval=0.01)
+            await pipeline.start()
+            for i in range(3):
+                await pipeline.submit(event(i))
+            for _ in range(200):
+                if await journal.count_documents({"processed_at": None}) == 0:
+                    break
+                await asyncio.sleep(0.01)
+            await pipeline.stop()
+            return recorder, pipeline, await journal.count_documents({"processed_at": None})
+
+        recorder, pipeline, unprocessed = asyncio.run(scenario())
+        assert pipeline.failed_batches == 1
+        assert set(recorder.applied) == {f"evt_{i}" for i in range(3)}
+        assert unprocessed == 0
+        print("Failed batch replayed from the journal")
+
+    def test_unprocessed_events_recovered_on_start(self):
+        """Test that events journaled before a restart but never applied are applied after it"""
+        async def scenario():
+            journal = await make_journal()
+            await journal.insert_many([{**event(i), "received_at": "2026-01-01T00:00:00+00:00", "processed_at": None} for i in range(3)])
+            await journal.insert_one({**event(9), "received_at": "2026-01-01T00:00:00+00:00", "processed_at": "2026-01-01T00:00:01+00:00"})
+            recorder = Recorder()
+            pipeline = WebhookPipeline(journal, recorder, flush_interval=0.01)
+            await pipeline.start()
+            for _ in range(200):
+                if len(recorder.applied) == 3:
+                    break
+                await asyncio.sleep(0.01)
+            await pipeline.stop()
+            return recorder
+
+        recorder = asyncio.run(scenario())
+        assert sorted(recorder.applied) == ["evt_0", "evt_1", "evt_2"]
+        print("Unprocessed journal entries recovered on start")
+
+    def test_stop_drains_queue(self):
+        """Test that stop() applies everything already queued before returning"""
+        async def scenario():
+            journal = await make_journal()
+            recorder = Recorder(delay=0.02)
+            pipeline = WebhookPipeline(journal, recorder, batch_size=5, flush_interval=0.01)
+            await pipeline.start()
+            for i in range(25):
+                await pipeline.submit(event(i))
+            await pipeline.stop(timeout=5)
+            return recorder, pipeline
+
+        recorder, pipeline = asyncio.run(scenario())
+        assert len(recorder.applied) == 25
+        assert pipeline.stats()["queue_depth"] == 0
+        print("stop() drained 25 queued events")
@@ -0,0 +1,166 @@
+"""Journaled, batched webhook ingestion.
+
+A verified event is written to a journal collection with a unique
+``event_id`` and acknowledged right away; redeliveries hit the unique index
+and are dropped. A background consumer applies queued events in batches and
+marks them processed in the journal. Events that could not be queued or
+applied stay unprocessed in the journal and are picked up again by the
+consumer, including after a restart.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookPipeline:
+    """Ingests events into ``journal``, which needs a unique index on ``event_id``."""
+
+    def __init__(
+        self,
+        journal,
+        apply_batch: Callable[[List[dict]], Awaitable[None]],
+        batch_size: int = 100,
+        max_queue: int = 10000,
+        flush_interval: float = 0.05,
+        retry_interval: float = 5.0,
+    ):
+        self.journal = journal
+        self.apply_batch = apply_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self._queue: "asyncio.Queue[tuple]" = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._needs_recovery = True
+        self._started_at = time.monotonic()
+
+        self.received = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.failed_batches = 0
+        self.batches = 0
+        self.last_lag_seconds = 0.0
+
+    async def start(self) -> None:
+        self._started_at = time.monotonic()
+        self._task = asyncio.create_task(self._consume())
+
+    async def submit(self, event: dict) -> bool:
+        """Journal ``event`` and queue it; returns False for a duplicate delivery."""
+        doc = {
+            **event,
+            "received_at": datetime.now(timezone.utc).isoformat(),
+            "processed_at": None,
+        }
+        try:
+            await self.journal.insert_one(doc)
+        except DuplicateKeyError:
+            self.duplicates += 1
+            return False
+        doc.pop("_id", None)
+
+        self.received += 1
+        try:
+            self._queue.put_nowait((time.monotonic(), doc))
+        except asyncio.QueueFull:
+            # Still journaled; the consumer replays it once the queue drains
+            self._needs_recovery = True
+        return True
+
+    async def _next_batch(self) -> List[tuple]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _recover(self) -> None:
+        """Queue journaled events that were never applied.
+
+        Runs only while the queue is empty. An event submitted during the scan
+        may be queued twice, which is harmless because applying is idempotent.
+        """
+        self._needs_recovery = False
+        cursor = self.journal.find({"processed_at": None}, {"_id": 0})
+        async for doc in cursor:
+            try:
+                self._queue.put_nowait((time.monotonic(), doc))
+            except asyncio.QueueFull:
+                self._needs_recovery = True
+                break
+
+    async def _consume(self) -> None:
+        while True:
+            if self._needs_recovery and self._queue.empty():
+                try:
+                    await self._recover()
+                except Exception as e:
+                    logger.error(f"Webhook journal recovery failed: {str(e)}")
+                    self._needs_recovery = True
+                    await asyncio.sleep(self.retry_interval)
+                    continue
+
+            batch = await self._next_batch()
+            await self._apply(batch)
+
+    async def _apply(self, batch: List[tuple]) -> None:
+        events = [doc for _, doc in batch]
+        try:
+            await self.apply_batch(events)
+            await self.journal.update_many(
+                {"event_id": {"$in": [e["event_id"] for e in events]}},
+                {"$set": {"processed_at": datetime.now(timezone.utc).isoformat()}}
+            )
+        except Exception as e:
+            logger.error(f"Applying {len(events)} webhook events failed: {str(e)}")
+            self.failed_batches += 1
+            self._needs_recovery = True
+            await asyncio.sleep(self.retry_interval)
+            return
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+        self.batches += 1
+        self.processed += len(events)
+        self.last_lag_seconds = time.monotonic() - min(queued_at for queued_at, _ in batch)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Apply whatever is queued (up to ``timeout`` seconds), then stop the consumer."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping webhook pipeline with {self._queue.qsize()} events left in the journal")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        uptime = time.monotonic() - self._started_at
+        return {
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "processed": self.processed,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "queue_depth": self._queue.qsize(),
+            "last_batch_lag_seconds": self.last_lag_seconds,
+            "throughput_per_second": self.processed / uptime if uptime > 0 else 0.0,
+        }
@@ -0,0 +1,150 @@
+"""Write-behind batching for high-volume, append-only inserts.
+
+Callers hand documents to :meth:`WriteBehindBuffer.submit` and return
+without waiting for Mongo; a background task writes them with one unordered
+``insert_many`` per batch, once ``batch_size`` documents are waiting or every
+``flush_interval`` seconds, whichever comes first. When ``max_buffer``
+documents are waiting, ``submit`` raises :class:`BufferFull` so callers can
+shed load instead of growing memory.
+
+Buffered documents are written before a graceful shutdown completes, but
+anything still buffered when the process dies is lost, and a document is not
+readable until its batch is written. Only use this for data that tolerates
+both.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class BufferFull(Exception):
+    """Raised by :meth:`WriteBehindBuffer.submit` when ``max_buffer`` documents are waiting."""
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        collection,
+        batch_size: int = 500,
+        flush_interval: float = 0.1,
+        max_buffer: int = 10000,
+        retry_interval: float = 1.0,
+    ):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if max_buffer < batch_size:
+            raise ValueError("max_buffer must be at least batch_size")
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.retry_interval = retry_interval
+        self._buffer: Deque[Tuple[float, dict]] = deque()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+        self._started_at = time.monotonic()
+
+        self.submitted = 0
+        self.written = 0
+        self.rejected = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.last_lag_seconds = 0.0
+
+    async def start(self) -> None:
+        self._closing = False
+        self._started_at = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, doc: dict) -> None:
+        """Buffer ``doc`` for the next batch; raises :class:`BufferFull` if the buffer is full."""
+        if len(self._buffer) >= self.max_buffer:
+            self.rejected += 1
+            raise BufferFull(f"{len(self._buffer)} documents waiting to be written")
+        self._buffer.append((time.monotonic(), doc))
+        self.submitted += 1
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            if len(self._buffer) < self.batch_size and not self._closing:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if self._buffer:
+                if not await self._flush():
+                    await asyncio.sleep(self.retry_interval)
+            elif self._closing:
+                return
+
+    async def _flush(self) -> bool:
+        """Write the oldest batch; failed documents go back to the front of the buffer."""
+        batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        retry = batch
+        try:
+            await self.collection.insert_many([doc for _, doc in batch], ordered=False)
+            retry = []
+        except BulkWriteError as e:
+            # Unordered: everything but the reported documents was written. Duplicate keys
+            # mean an earlier, seemingly failed attempt already wrote the document.
+            failed = {error["index"] for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY}
+            retry = [batch[i] for i in sorted(failed)]
+            if retry:
+                logger.error(f"Writing {len(retry)} of {len(batch)} buffered documents failed: {str(e)}")
+        except Exception as e:
+            logger.error(f"Writing {len(batch)} buffered documents failed: {str(e)}")
+        finally:
+            # insert_many set _id on the documents; retries reuse it, so a batch that was
+            # written but not acknowledged is not written twice
+            self._buffer.extendleft(reversed(retry))
+
+        self.written += len(batch) - len(retry)
+        if retry:
+            self.failed_batches += 1
+            return False
+        self.batches += 1
+        self.last_lag_seconds = time.monotonic() - batch[0][0]
+        return True
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Write everything still buffered (up to ``timeout`` seconds), then stop."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping write buffer with {len(self._buffer)} documents unwritten")
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        uptime = time.monotonic() - self._started_at
+        return {
+            "buffered": len(self._buffer),
+            "max_buffer": self.max_buffer,
+            "submitted": self.submitted,
+            "written": self.written,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "last_batch_lag_seconds": self.last_lag_seconds,
+            "throughput_per_second": self.written / uptime if uptime > 0 else 0.0,
+        }